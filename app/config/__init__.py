@@ -1,4 +1,16 @@
 from .settings import settings
 from .firebase import db, initialize_firebase
+from .database import initialize_database, get_db, as_utc
+from .executor import run_db, get_db_pool_stats, shutdown_db_executor
 
-__all__ = ["settings", "db", "initialize_firebase"]
+__all__ = [
+    "settings",
+    "db",
+    "initialize_firebase",
+    "initialize_database",
+    "get_db",
+    "as_utc",
+    "run_db",
+    "get_db_pool_stats",
+    "shutdown_db_executor",
+]
@@ -0,0 +1,110 @@
+"""
+Database - chọn backend lưu trữ theo settings.storage_backend
+
+- firestore: Firebase Firestore (mặc định)
+- sqlite: file SQLite cục bộ (WAL) - cửa hàng một máy, chạy thử và đo hiệu năng
+  không cần project Firebase
+
+Cả hai backend cung cấp cùng phần API client Firestore mà các service dùng
+(collection / document / query, batch, transaction, Increment), nên service
+chỉ cần lấy client qua get_db() và chạy transaction qua run_transaction().
+
+Client được tạo trong lifespan (hoặc lần gọi get_db() đầu tiên), không phải lúc import.
+Process con sau fork (gunicorn --preload, multiprocessing) bỏ client của process cha và
+tạo client / kênh gRPC riêng.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from google.cloud.firestore import FieldFilter
+
+from .metrics import record_datastore
+from .settings import settings
+
+STORAGE_BACKENDS = ("firestore", "sqlite")
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timezone-aware datetime: Firestore (và SQLite backend) lưu datetime naive như UTC"""
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+_client = None
+
+
+def initialize_database():
+    """Create the client of the configured storage backend"""
+    global _client
+    backend = settings.storage_backend
+    if backend == "sqlite":
+        from .sqlite_store import SQLiteClient
+        _client = SQLiteClient(settings.sqlite_path)
+        print(f"✅ SQLite storage initialized: {settings.sqlite_path}")
+    elif backend == "firestore":
+        from .firebase import initialize_firebase
+        _client = initialize_firebase()
+    else:
+        raise ValueError(f"STORAGE_BACKEND không hợp lệ: {backend} ({' | '.join(STORAGE_BACKENDS)})")
+    return _client
+
+
+def get_db():
+    """Get the database client (Firestore client or SQLiteClient)"""
+    if _client is None:
+        initialize_database()
+    return _client
+
+
+def _reset_after_fork():
+    global _client
+    from . import firebase
+    _client = None
+    firebase.db = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def run_transaction(func, *args, **kwargs):
+    """Run func(transaction, *args, **kwargs) in a transaction of the configured backend (blocking)"""
+    writes = []
+
+    def _counted(transaction, *inner_args, **inner_kwargs):
+        result = func(transaction, *inner_args, **inner_kwargs)
+        writes.append(len(transaction))
+        return result
+
+    if settings.storage_backend == "sqlite":
+        result = get_db().run_transaction(_counted, *args, **kwargs)
+    else:
+        from .firebase import run_transaction as run_firestore_transaction
+        result = run_firestore_transaction(_counted, *args, **kwargs)
+    # Chỉ tính lần chạy cuối (lần được commit)
+    record_datastore(writes=writes[-1] if writes else 0)
+    return result
+
+
+def commit_batch(batch):
+    """Commit a WriteBatch and count its writes (blocking)"""
+    writes = len(batch)
+    result = batch.commit()
+    record_datastore(writes=writes)
+    return result
+
+
+def delete_expired(collection: str, batch_size: int = 500) -> int:
+    """
+    Delete documents whose expire_at has passed (blocking). Firestore does this
+    with a TTL policy; SQLite has none, so run it from manage.py purge-expired.
+    """
+    db = get_db()
+    query = db.collection(collection).where(filter=FieldFilter("expire_at", "<", datetime.now())).select([])
+    references = [doc.reference for doc in query.stream()]
+    for i in range(0, len(references), batch_size):
+        batch = db.batch()
+        for reference in references[i:i + batch_size]:
+            batch.delete(reference)
+        commit_batch(batch)
+    return len(references)
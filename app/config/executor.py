@@ -0,0 +1,139 @@
+"""
+Firestore Executor - chạy các lệnh Firestore (blocking) ngoài event loop
+
+Firestore Admin SDK là client đồng bộ, mỗi lệnh get()/set()/stream() chặn
+thread gọi nó. Các service dùng run_db() để đẩy lệnh sang một thread pool
+có giới hạn, đồng thời giới hạn số lệnh đang chờ/đang chạy cùng lúc.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, TypeVar
+
+from .metrics import record_db_call
+from .profiling import current_profile
+from .settings import settings
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# Semaphore gắn với event loop đang chạy (mỗi worker một loop)
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "in_flight": 0,
+    "waiting": 0,
+    "peak_in_flight": 0,
+    "peak_waiting": 0,
+    "total_wait_ms": 0.0,
+    "total_run_ms": 0.0,
+}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.db_thread_pool_size,
+                    thread_name_prefix="firestore"
+                )
+    return _executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(settings.db_max_concurrency)
+        _semaphore_loop = loop
+    return _semaphore
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Chạy một lệnh Firestore trong thread pool, không chặn event loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _get_semaphore()
+
+    queued_at = time.perf_counter()
+    _stats["waiting"] += 1
+    _stats["peak_waiting"] = max(_stats["peak_waiting"], _stats["waiting"])
+    try:
+        await semaphore.acquire()
+    finally:
+        _stats["waiting"] -= 1
+
+    started_at = time.perf_counter()
+    failed = False
+    _stats["submitted"] += 1
+    _stats["in_flight"] += 1
+    _stats["peak_in_flight"] = max(_stats["peak_in_flight"], _stats["in_flight"])
+    _stats["total_wait_ms"] += (started_at - queued_at) * 1000
+    try:
+        # Chạy trong context của request để lệnh trong thread ghi được số liệu của request
+        context = contextvars.copy_context()
+        profile = current_profile()
+        call = partial(context.run, profile.run, func, *args, **kwargs) if profile else partial(context.run, func, *args, **kwargs)
+        result = await loop.run_in_executor(_get_executor(), call)
+        _stats["completed"] += 1
+        return result
+    except BaseException:
+        failed = True
+        _stats["failed"] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - started_at
+        _stats["in_flight"] -= 1
+        _stats["total_run_ms"] += elapsed * 1000
+        semaphore.release()
+        record_db_call(getattr(func, "__qualname__", type(func).__name__), elapsed, failed)
+
+
+def get_db_pool_stats() -> dict:
+    """Thống kê thread pool Firestore"""
+    finished = _stats["completed"] + _stats["failed"]
+    return {
+        "pool_size": settings.db_thread_pool_size,
+        "max_concurrency": settings.db_max_concurrency,
+        "in_flight": _stats["in_flight"],
+        "waiting": _stats["waiting"],
+        "peak_in_flight": _stats["peak_in_flight"],
+        "peak_waiting": _stats["peak_waiting"],
+        "submitted": _stats["submitted"],
+        "completed": _stats["completed"],
+        "failed": _stats["failed"],
+        "avg_wait_ms": round(_stats["total_wait_ms"] / _stats["submitted"], 3) if _stats["submitted"] else 0.0,
+        "avg_run_ms": round(_stats["total_run_ms"] / finished, 3) if finished else 0.0,
+    }
+
+
+def _reset_after_fork():
+    # Thread của pool không tồn tại trong process con
+    global _executor, _executor_lock, _semaphore, _semaphore_loop
+    _executor = None
+    _executor_lock = threading.Lock()
+    _semaphore = None
+    _semaphore_loop = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def shutdown_db_executor():
+    """Đóng thread pool khi tắt ứng dụng"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -1,22 +1,33 @@
 """
 Firebase Admin SDK Configuration
+
+firebase_admin chỉ được import khi khởi tạo client (lifespan / lần dùng đầu tiên), không
+phải khi import app.
 """
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
 import json
 from .settings import settings
 
 db = None
+# Process đã gọi firebase_admin.initialize_app (process cha khi chạy gunicorn --preload)
+_app_pid = None
 
 
 def initialize_firebase():
     """Initialize Firebase Admin SDK"""
-    global db
+    global db, _app_pid
+    import firebase_admin
+    from firebase_admin import credentials, firestore
 
     if firebase_admin._apps:
         # Already initialized
-        db = firestore.client()
+        if _app_pid == os.getpid():
+            db = firestore.client()
+        else:
+            # App được tạo trước khi fork: firestore.client() trả client (kênh gRPC) của process cha
+            app = firebase_admin.get_app()
+            from google.cloud import firestore as cloud_firestore
+            db = cloud_firestore.Client(credentials=app.credential.get_credential(), project=app.project_id)
         return db
 
     try:
@@ -46,6 +57,7 @@ def initialize_firebase():
             print(f"✅ Firebase initialized with project ID: {settings.firebase_project_id}")
         else:
             firebase_admin.initialize_app(cred)
+        _app_pid = os.getpid()
 
         db = firestore.client()
         return db
@@ -61,3 +73,10 @@ def get_db():
     if db is None:
         initialize_firebase()
     return db
+
+
+def run_transaction(func, *args, **kwargs):
+    """Run func(transaction, *args, **kwargs) in a Firestore transaction (blocking, retried on contention)"""
+    from firebase_admin import firestore
+    transaction = get_db().transaction()
+    return firestore.transactional(func)(transaction, *args, **kwargs)
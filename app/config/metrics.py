@@ -0,0 +1,251 @@
+"""
+Metrics - số liệu hiệu năng theo route và theo lệnh datastore (định dạng Prometheus)
+
+- MetricsMiddleware: thời gian xử lý (histogram), số request đang chạy và số byte
+  trả về theo route; thêm header Server-Timing tóm tắt phần datastore của request
+- run_db() ghi thời gian từng lệnh datastore; service ghi số document đọc / ghi /
+  stream bằng record_datastore(); bộ cấp số phiếu ghi số lần chờ khóa và số lần
+  chạy transaction bộ đếm; bản sao phiếu ghi số truy vấn hit / miss
+- GET /metrics trả về render_prometheus()
+
+Số liệu được tính riêng cho từng worker (process).
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DOCUMENT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+DOCUMENT_KINDS = ("read", "write", "streamed")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_METRICS = {
+    "http_request_duration_seconds": ("histogram", "Thời gian xử lý request theo route"),
+    "http_requests_in_flight": ("gauge", "Số request đang xử lý theo route"),
+    "http_response_bytes_total": ("counter", "Số byte body trả về theo route"),
+    "http_request_datastore_documents": ("histogram", "Số document datastore mỗi request theo loại"),
+    "datastore_call_duration_seconds": ("histogram", "Thời gian mỗi lệnh datastore chạy qua run_db"),
+    "datastore_calls_failed_total": ("counter", "Số lệnh datastore lỗi"),
+    "datastore_documents_total": ("counter", "Số document datastore đã đọc / ghi / stream"),
+    "voucher_number_lock_waits_total": ("counter", "Số lần cấp số phiếu phải chờ khóa bộ đếm"),
+    "voucher_number_lock_wait_seconds_total": ("counter", "Tổng thời gian chờ khóa bộ đếm"),
+    "voucher_number_reserve_attempts_total": ("counter", "Số lần chạy transaction giữ block số (gồm chạy lại khi tranh chấp)"),
+    "voucher_number_reservations_total": ("counter", "Số block số giữ thành công"),
+    "voucher_replica_queries_total": ("counter", "Số truy vấn danh sách / thống kê trả lời từ bản sao phiếu (hit) hoặc Firestore (miss)"),
+}
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Fixed-bucket histogram (bucket counts are cumulated when rendered)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1):
+        if not value:
+            return
+        with self._lock:
+            self._values[(name, labels)] = self._values.get((name, labels), 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float, buckets: Sequence[float] = LATENCY_BUCKETS):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = Histogram(buckets)
+            histogram.observe(value)
+
+    @staticmethod
+    def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+    def render(self, extra_gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: (h.buckets, list(h.counts), h.total, h.count) for key, h in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text) in _METRICS.items():
+            samples = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+            series = sorted((labels, data) for (metric, labels), data in histograms.items() if metric == name)
+            if not samples and not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{self._format_labels(labels)} {_format_value(value)}")
+            for labels, (buckets, counts, total, count) in series:
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{self._format_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{name}_bucket{self._format_labels(labels, (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+
+        for name, (help_text, value) in (extra_gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """Datastore usage of the current request (shared with run_db threads via contextvars)"""
+
+    __slots__ = ("db_calls", "db_seconds", "read", "write", "streamed")
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self.read = 0
+        self.write = 0
+        self.streamed = 0
+
+
+_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+def record_db_call(operation: str, seconds: float, failed: bool = False):
+    """Called by run_db for every datastore call"""
+    labels = (("operation", operation),)
+    registry.observe("datastore_call_duration_seconds", labels, seconds)
+    if failed:
+        registry.inc("datastore_calls_failed_total", labels)
+    current = _request_metrics.get()
+    if current is not None:
+        current.db_calls += 1
+        current.db_seconds += seconds
+
+
+def record_datastore(reads: int = 0, writes: int = 0, streamed: int = 0):
+    """Count documents read (get), written (batch/transaction) and streamed (query)"""
+    registry.inc("datastore_documents_total", (("kind", "read"),), reads)
+    registry.inc("datastore_documents_total", (("kind", "write"),), writes)
+    registry.inc("datastore_documents_total", (("kind", "streamed"),), streamed)
+    current = _request_metrics.get()
+    if current is not None:
+        current.read += reads
+        current.write += writes
+        current.streamed += streamed
+
+
+def record_counter_lock_wait(counter_key: str, seconds: float):
+    labels = (("counter", counter_key),)
+    registry.inc("voucher_number_lock_waits_total", labels)
+    registry.inc("voucher_number_lock_wait_seconds_total", labels, seconds)
+
+
+def record_counter_reserve(counter_key: str, committed: bool):
+    """One attempt of the counter transaction (committed=False: attempt started)"""
+    name = "voucher_number_reservations_total" if committed else "voucher_number_reserve_attempts_total"
+    registry.inc(name, (("counter", counter_key),))
+
+
+def record_replica_query(collection: str, hit: bool):
+    registry.inc("voucher_replica_queries_total", (("collection", collection), ("result", "hit" if hit else "miss")))
+
+
+def server_timing(request_metrics: RequestMetrics, elapsed: float) -> str:
+    """Server-Timing header value: total time, datastore time and document counts"""
+    return (
+        f'app;dur={elapsed * 1000:.1f}, '
+        f'db;dur={request_metrics.db_seconds * 1000:.1f};desc="{request_metrics.db_calls} calls", '
+        f'docs;desc="read={request_metrics.read} write={request_metrics.write} streamed={request_metrics.streamed}"'
+    )
+
+
+def _route_template(scope) -> str:
+    """Route path template (/api/cash-vouchers/{voucher_id}) - keeps label cardinality bounded"""
+    router = getattr(scope.get("app"), "router", None)
+    for route in getattr(router, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: per-route latency, in-flight, response bytes and Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = _route_template(scope)
+        method = scope["method"]
+        route_labels = (("method", method), ("route", route))
+        request_metrics = RequestMetrics()
+        token = _request_metrics.set(request_metrics)
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def _send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(request_metrics, time.perf_counter() - started)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))]}
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        registry.inc("http_requests_in_flight", route_labels)
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            registry.inc("http_requests_in_flight", route_labels, -1)
+            registry.observe(
+                "http_request_duration_seconds", route_labels + (("status", str(status)),), time.perf_counter() - started
+            )
+            registry.inc("http_response_bytes_total", route_labels, size)
+            for kind in DOCUMENT_KINDS:
+                registry.observe(
+                    "http_request_datastore_documents", route_labels + (("kind", kind),),
+                    getattr(request_metrics, kind), DOCUMENT_BUCKETS
+                )
+            _request_metrics.reset(token)
+
+
+def render_prometheus(extra_gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+    return registry.render(extra_gauges)
@@ -0,0 +1,198 @@
+"""
+Profiling - chụp cProfile cho từng request khi cần
+
+Bật cho một request bằng header `X-Profile: <PROFILE_ADMIN_TOKEN>`, hoặc lấy mẫu
+ngẫu nhiên theo PROFILE_SAMPLE_RATE (chỉ giữ request chậm hơn PROFILE_MIN_DURATION_MS).
+Profile gồm phần chạy trên event loop và mọi lệnh datastore của request chạy trong
+thread pool (run_db), ghi ra PROFILE_DIR dạng file .prof (pstats / snakeviz) kèm file
+.json mô tả route, thời gian và status.
+
+Mỗi worker chỉ profile một request tại một thời điểm. Phần event loop có thể lẫn các
+request khác chạy xen kẽ trong lúc request được profile đang chờ I/O.
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import pstats
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from .metrics import _route_template
+from .settings import settings
+
+PROFILE_HEADER = b"x-profile"
+_PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class ProfileSession:
+    """cProfile data of one request: event loop profiler + one profiler per run_db call"""
+
+    def __init__(self):
+        self.main = cProfile.Profile()
+        self._calls: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def run(self, func: Callable, *args, **kwargs):
+        """Run a blocking call in the current (thread pool) thread under its own profiler"""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._calls.append(profiler)
+
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self.main)
+        with self._lock:
+            for profiler in self._calls:
+                stats.add(profiler)
+        return stats
+
+    @property
+    def thread_calls(self) -> int:
+        return len(self._calls)
+
+
+_session: ContextVar[Optional[ProfileSession]] = ContextVar("profile_session", default=None)
+# Một request được profile tại một thời điểm trong mỗi worker
+_active = threading.Lock()
+
+
+def current_profile() -> Optional[ProfileSession]:
+    return _session.get()
+
+
+def profile_dir() -> Path:
+    return Path(settings.profile_dir)
+
+
+def _profile_id(method: str, path: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-") or "root"
+    return f"{datetime.now():%Y%m%d-%H%M%S-%f}_{method}_{slug[:80]}"
+
+
+def _write_profile(profile_id: str, session: ProfileSession, metadata: dict):
+    """Dump the merged stats and metadata, then drop the oldest profiles over PROFILE_MAX_FILES (blocking)"""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    session.stats().dump_stats(str(directory / f"{profile_id}.prof"))
+    (directory / f"{profile_id}.json").write_text(json.dumps(metadata, ensure_ascii=False), encoding="utf-8")
+
+    profiles = sorted(directory.glob("*.prof"))
+    for stale in profiles[:max(0, len(profiles) - settings.profile_max_files)]:
+        stale.unlink(missing_ok=True)
+        stale.with_suffix(".json").unlink(missing_ok=True)
+
+
+def list_profiles(limit: int = 100) -> List[dict]:
+    """Metadata of captured profiles, newest first (blocking)"""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in sorted(directory.glob("*.prof"), reverse=True)[:limit]:
+        metadata_path = path.with_suffix(".json")
+        try:
+            metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            metadata = {"id": path.stem}
+        metadata["size_bytes"] = path.stat().st_size
+        profiles.append(metadata)
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """Path of a captured profile, or None for unknown / invalid ids"""
+    if not _PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = profile_dir() / f"{profile_id}.prof"
+    return path if path.is_file() else None
+
+
+def profile_text(path: Path, limit: int = 60) -> str:
+    """Top functions by cumulative time, as printed by pstats (blocking)"""
+    output = io.StringIO()
+    pstats.Stats(str(path), stream=output).strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: profile requests asked for by the admin header or picked by sampling"""
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _trigger(scope) -> Optional[str]:
+        token = settings.profile_admin_token
+        if token:
+            expected = token.encode("utf-8")
+            for name, value in scope.get("headers", ()):
+                # So sánh thời gian hằng như /api/admin/profiles (bytes: header có thể không phải ASCII)
+                if name == PROFILE_HEADER and hmac.compare_digest(value, expected):
+                    return "header"
+        if settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None or not _active.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession()
+        profile_id = _profile_id(scope["method"], scope["path"])
+        token = _session.set(session)
+        status = 500
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trigger == "header":
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            try:
+                session.main.enable()
+            except ValueError:
+                # Đang có profiler khác chạy trên thread này
+                await self.app(scope, receive, send)
+                return
+            try:
+                await self.app(scope, receive, _send)
+            finally:
+                session.main.disable()
+        finally:
+            _session.reset(token)
+            _active.release()
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        if trigger == "sample" and duration_ms < settings.profile_min_duration_ms:
+            return
+        metadata = {
+            "id": profile_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": _route_template(scope),
+            "query_string": scope.get("query_string", b"").decode("latin-1"),
+            "status": status,
+            "duration_ms": round(duration_ms, 3),
+            "trigger": trigger,
+            "thread_calls": session.thread_calls,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        await asyncio.get_running_loop().run_in_executor(None, _write_profile, profile_id, session, metadata)
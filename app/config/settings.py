@@ -24,6 +24,64 @@ class Settings(BaseSettings):
     firebase_service_account_path: str = "./firebase-service-account.json"
     firebase_project_id: str = "songminhketoan-15041989"
 
+    # Backend lưu trữ - firestore | sqlite (file cục bộ, không cần Firebase)
+    storage_backend: str = "firestore"
+    sqlite_path: str = "./taphoa39.db"
+
+    # Firestore thread pool - client Firestore là blocking nên chạy ngoài event loop
+    db_thread_pool_size: int = 64     # Số thread gọi Firestore song song
+    db_max_concurrency: int = 512     # Số lệnh Firestore tối đa đang chờ/chạy mỗi worker
+
+    # Số phiếu - mỗi worker giữ trước một block số trong 1 transaction
+    voucher_no_block_size: int = 20
+    voucher_batch_max_items: int = 5000  # Số phiếu tối đa mỗi request /batch
+    export_page_size: int = 500          # Số phiếu đọc mỗi trang khi xuất dữ liệu
+
+    # Phiếu kho lớn - dòng phiếu lưu tách thành các document con khi vượt ngưỡng (giới hạn 1 MiB/document)
+    voucher_line_chunk_threshold: int = 500
+    voucher_line_chunk_size: int = 500
+
+    # Thống kê - múi giờ dùng để chia ngày cho các document tổng hợp theo ngày (UTC+7)
+    stats_timezone_offset_hours: int = 7
+
+    # Tính giá xuất kho - average (bình quân gia quyền di động) | fifo
+    costing_method: str = "average"
+
+    # Cache phiếu (get_by_id) - memory | shared | none
+    voucher_cache_backend: str = "memory"
+    voucher_cache_max_entries: int = 10000
+    voucher_cache_ttl_seconds: float = 60.0
+    voucher_cache_address: str = "127.0.0.1:50055"  # Tiến trình cache dùng chung (backend shared)
+    voucher_cache_authkey: str = "taphoa39-voucher-cache"
+
+    # Bản sao phiếu gần đây trong bộ nhớ (mỗi worker) cho danh sách và thống kê
+    voucher_replica_enabled: bool = False
+    voucher_replica_months: int = 2      # Tháng hiện tại và (n - 1) tháng trước
+    voucher_replica_max_mb: int = 256    # Bộ nhớ ước lượng tối đa mỗi collection, gồm cả bản listener giữ; vượt thì bỏ phiếu cũ nhất
+
+    # Tìm kiếm phiếu (GET /api/vouchers/search)
+    voucher_search_candidates: int = 500   # Số phiếu mới nhất khớp từ khóa chính được lọc và xếp hạng
+    voucher_search_max_terms: int = 2000   # Số tiền tố tối đa mỗi phiếu (Firestore giới hạn 40000 mục index/document)
+
+    # Idempotency-Key (tạo phiếu, ghi sổ, hủy) - expire_at của idempotency_keys (TTL policy Firestore)
+    idempotency_key_ttl_hours: int = 24
+
+    # ETag danh sách / thống kê: số shard bộ đếm thay đổi mỗi collection phiếu
+    voucher_version_shards: int = 10
+
+    # Luồng thay đổi phiếu (SSE /api/vouchers/stream)
+    voucher_stream_queue_size: int = 1000          # Sự kiện chờ tối đa mỗi client; chậm hơn thì gửi reset và đóng
+    voucher_stream_keepalive_seconds: float = 15.0
+    voucher_change_retention_hours: int = 24       # expire_at của voucher_changes (TTL policy Firestore)
+    voucher_stream_listener_max_changes: int = 1000  # Listener giữ quá số thay đổi này thì mở lại từ thay đổi gần nhất
+
+    # Profiling theo request - header X-Profile: <token> hoặc lấy mẫu ngẫu nhiên (0 = tắt)
+    profile_admin_token: Optional[str] = None  # Cũng dùng cho /api/admin/profiles; không đặt = tắt
+    profile_sample_rate: float = 0.0
+    profile_min_duration_ms: float = 0.0       # Chỉ giữ profile lấy mẫu chậm hơn ngưỡng này
+    profile_dir: str = "./profiles"
+    profile_max_files: int = 200
+
     @property
     def cors_origins_list(self) -> List[str]:
         return [origin.strip() for origin in self.cors_origins.split(",")]
@@ -0,0 +1,516 @@
+"""
+SQLite Storage - backend lưu trữ cục bộ thay cho Firestore
+
+Cài đặt phần API client Firestore mà các service dùng (collection / document /
+query, batch, transaction, Increment, get_all) trên một file SQLite:
+
+- Mỗi document là một dòng (collection, id, data JSON)
+- Datetime lưu dạng chuỗi ISO UTC cố định độ dài, nên so sánh / sắp xếp chuỗi
+  đúng thứ tự thời gian; đọc ra là datetime có tzinfo UTC như Firestore
+- Chế độ WAL: nhiều thread đọc song song, một thread ghi tại một thời điểm
+- Index biểu thức trên voucher_type / status / voucher_date / warehouse_code
+- Transaction giữ khóa ghi (BEGIN IMMEDIATE) từ lần đọc đầu tiên đến commit,
+  nên không cần chạy lại hàm khi có tranh chấp như Firestore
+- on_snapshot() chạy lại query định kỳ trong một thread thay cho snapshot listener
+"""
+import json
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore import Increment
+from google.cloud.firestore_v1.watch import ChangeType
+
+from .database import as_utc
+
+_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+_DATETIME_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}Z$")
+_FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+# Index biểu thức theo các bộ lọc của danh sách phiếu, thống kê và sổ cái
+_INDEXES = {
+    "voucher_type_date": ("voucher_type", "voucher_date"),
+    "status_date": ("status", "voucher_date"),
+    "warehouse_date": ("warehouse_code", "voucher_date"),
+    "voucher_date": ("voucher_date",),
+    "day": ("day",),
+    "period": ("period",),
+    "at": ("at",),
+    "expire_at": ("expire_at",),
+}
+
+
+def _field(path: str) -> str:
+    """SQL expression of a field path - inlined (not bound) so expression indexes match"""
+    if not _FIELD_PATTERN.match(path):
+        raise ValueError(f"Tên trường không hợp lệ: {path}")
+    return f"json_extract(data, '$.{path}')"
+
+
+def _encode(value: Any) -> Any:
+    """Python value -> JSON-compatible value (datetime -> ISO UTC string)"""
+    if isinstance(value, datetime):
+        return as_utc(value).astimezone(timezone.utc).strftime(_DATETIME_FORMAT)
+    if isinstance(value, Increment):
+        return _encode(value.value)
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, str):
+        if _DATETIME_PATTERN.match(value):
+            return datetime.strptime(value, _DATETIME_FORMAT).replace(tzinfo=timezone.utc)
+        return value
+    if isinstance(value, dict):
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+_MISSING = object()
+
+
+def _get_path(data: Optional[dict], path: str, default: Any = None) -> Any:
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return default
+        data = data[part]
+    return data
+
+
+def _merge(target: dict, changes: dict):
+    """set(merge=True): nested dicts are merged, Increment adds to the current value"""
+    for key, value in changes.items():
+        if isinstance(value, Increment):
+            current = target.get(key)
+            target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge(target[key], value)
+        else:
+            target[key] = _encode(value)
+
+
+def _project(data: dict, fields: Sequence[str]) -> dict:
+    """select(): keep only the requested field paths (missing fields are omitted)"""
+    result: dict = {}
+    for path in fields:
+        value = _get_path(data, path, _MISSING)
+        if value is _MISSING:
+            continue
+        target = result
+        parts = path.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return result
+
+
+class DocumentSnapshot:
+
+    def __init__(self, reference: "DocumentReference", data: Optional[dict]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[dict]:
+        return _decode(self._data) if self._data is not None else None
+
+    def get(self, field_path: str) -> Any:
+        return _decode(_get_path(self._data, field_path))
+
+
+class DocumentReference:
+
+    def __init__(self, client: "SQLiteClient", collection: str, document_id: str):
+        self._client = client
+        self._collection = collection
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection}/{self.id}"
+
+    def _read(self, connection: sqlite3.Connection) -> Optional[dict]:
+        row = connection.execute(
+            "SELECT data FROM documents WHERE collection = ? AND id = ?", (self._collection, self.id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, transaction=None, field_paths: Optional[Sequence[str]] = None) -> DocumentSnapshot:
+        data = self._read(self._client.connection())
+        if data is not None and field_paths is not None:
+            data = _project(data, field_paths)
+        return DocumentSnapshot(self, data)
+
+    def set(self, document_data: dict, merge: bool = False):
+        batch = self._client.batch()
+        batch.set(self, document_data, merge=merge)
+        batch.commit()
+
+    def create(self, document_data: dict):
+        batch = self._client.batch()
+        batch.create(self, document_data)
+        batch.commit()
+
+    def update(self, field_updates: dict):
+        batch = self._client.batch()
+        batch.update(self, field_updates)
+        batch.commit()
+
+    def delete(self):
+        batch = self._client.batch()
+        batch.delete(self)
+        batch.commit()
+
+
+class Query:
+
+    ASCENDING = ASCENDING
+    DESCENDING = DESCENDING
+
+    def __init__(
+        self,
+        client: "SQLiteClient",
+        collection: str,
+        filters: Tuple = (),
+        orders: Tuple = (),
+        limit: Optional[int] = None,
+        cursor: Optional[dict] = None,
+        fields: Optional[Tuple[str, ...]] = None
+    ):
+        self._client = client
+        self._collection = collection
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes) -> "Query":
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "cursor": self._cursor,
+            "fields": self._fields,
+        }
+        state.update(changes)
+        return Query(self._client, self._collection, **state)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None, filter=None) -> "Query":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "Query":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "Query":
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields) -> "Query":
+        if isinstance(document_fields, DocumentSnapshot):
+            cursor = {**(document_fields.to_dict() or {}), "__name__": document_fields.id}
+        else:
+            cursor = dict(document_fields)
+        return self._copy(cursor=cursor)
+
+    def select(self, field_paths: Sequence[str]) -> "Query":
+        return self._copy(fields=tuple(field_paths))
+
+    def _filter_sql(self, field_path: str, op_string: str, value: Any) -> Tuple[str, List[Any]]:
+        column = _field(field_path)
+        if op_string == "==":
+            return (f"{column} IS NULL", []) if value is None else (f"{column} = ?", [_encode(value)])
+        if op_string in ("<", "<=", ">", ">="):
+            return f"{column} {op_string} ?", [_encode(value)]
+        if op_string == "!=":
+            return f"{column} IS NOT NULL AND {column} != ?", [_encode(value)]
+        if op_string in ("in", "not-in"):
+            values = [_encode(item) for item in value]
+            placeholders = ", ".join("?" for _ in values)
+            operator = "IN" if op_string == "in" else "NOT IN"
+            return f"{column} {operator} ({placeholders})", values
+        if op_string in ("array_contains", "array_contains_any"):
+            values = [_encode(value)] if op_string == "array_contains" else [_encode(item) for item in value]
+            placeholders = ", ".join("?" for _ in values)
+            return (
+                f"EXISTS (SELECT 1 FROM json_each(data, '$.{field_path}') WHERE json_each.value IN ({placeholders}))",
+                values
+            )
+        raise ValueError(f"Toán tử không hỗ trợ: {op_string}")
+
+    def _cursor_sql(self) -> Tuple[str, List[Any]]:
+        """Keyset condition: rows strictly after the cursor in (orders..., id) order"""
+        orders = [(_field(path), path, direction) for path, direction in self._orders]
+        if "__name__" in self._cursor:
+            orders.append(("id", "__name__", orders[-1][2] if orders else ASCENDING))
+        clauses, params = [], []
+        for index, (column, path, direction) in enumerate(orders):
+            equal = [f"{previous} = ?" for previous, _, _ in orders[:index]]
+            equal_params = [_encode(self._cursor[previous_path]) for _, previous_path, _ in orders[:index]]
+            operator = "<" if direction == DESCENDING else ">"
+            clauses.append("(" + " AND ".join(equal + [f"{column} {operator} ?"]) + ")")
+            params += equal_params + [_encode(self._cursor[path])]
+        return "(" + " OR ".join(clauses) + ")", params
+
+    def _sql(self) -> Tuple[str, List[Any]]:
+        conditions, params = ["collection = ?"], [self._collection]
+        for field_path, op_string, value in self._filters:
+            condition, values = self._filter_sql(field_path, op_string, value)
+            conditions.append(condition)
+            params += values
+        # Firestore bỏ qua document không có trường dùng để sắp xếp
+        for field_path, _ in self._orders:
+            conditions.append(f"json_type(data, '$.{field_path}') IS NOT NULL")
+        if self._cursor:
+            condition, values = self._cursor_sql()
+            conditions.append(condition)
+            params += values
+
+        order = [f"{_field(path)} {'DESC' if direction == DESCENDING else 'ASC'}" for path, direction in self._orders]
+        order.append(f"id {'DESC' if self._orders and self._orders[-1][1] == DESCENDING else 'ASC'}")
+        sql = f"SELECT id, data FROM documents WHERE {' AND '.join(conditions)} ORDER BY {', '.join(order)}"
+        if self._limit is not None:
+            sql += " LIMIT ?"
+            params.append(self._limit)
+        return sql, params
+
+    def stream(self, transaction=None) -> Iterator[DocumentSnapshot]:
+        sql, params = self._sql()
+        rows = self._client.connection().execute(sql, params).fetchall()
+        for document_id, raw in rows:
+            data = json.loads(raw)
+            if self._fields is not None:
+                data = _project(data, self._fields)
+            yield DocumentSnapshot(DocumentReference(self._client, self._collection, document_id), data)
+
+    def get(self, transaction=None) -> List[DocumentSnapshot]:
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback: Callable) -> "Watch":
+        return Watch(self, callback, self._client.watch_interval_seconds)
+
+
+class DocumentChange:
+
+    def __init__(self, change_type: ChangeType, document: DocumentSnapshot):
+        self.type = change_type
+        self.document = document
+
+
+class Watch:
+    """Polling stand-in for a Firestore listener: callback(docs, changes, read_time) from a background thread"""
+
+    def __init__(self, query: Query, callback: Callable, interval_seconds: float):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(query, callback, interval_seconds), name="sqlite-watch", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, query: Query, callback: Callable, interval_seconds: float):
+        known: Dict[str, DocumentSnapshot] = {}
+        first = True
+        try:
+            while not self._stop.is_set():
+                docs = list(query.stream())
+                current = {doc.id: doc for doc in docs}
+                changes = [
+                    DocumentChange(ChangeType.ADDED if doc_id not in known else ChangeType.MODIFIED, doc)
+                    for doc_id, doc in current.items()
+                    if doc_id not in known or known[doc_id]._data != doc._data
+                ]
+                changes += [DocumentChange(ChangeType.REMOVED, doc) for doc_id, doc in known.items() if doc_id not in current]
+                known = current
+                if changes or first:
+                    callback(docs, changes, datetime.now(timezone.utc))
+                first = False
+                self._stop.wait(interval_seconds)
+        finally:
+            query._client.close()
+
+    def unsubscribe(self):
+        self._stop.set()
+
+
+class CollectionReference(Query):
+
+    def __init__(self, client: "SQLiteClient", collection: str):
+        super().__init__(client, collection)
+        self.id = collection
+
+    def document(self, document_id: Optional[str] = None) -> DocumentReference:
+        return DocumentReference(self._client, self._collection, document_id or uuid.uuid4().hex)
+
+    def add(self, document_data: dict, document_id: Optional[str] = None) -> Tuple[datetime, DocumentReference]:
+        reference = self.document(document_id)
+        reference.create(document_data)
+        return datetime.now(timezone.utc), reference
+
+
+class WriteBatch:
+    """Buffered writes applied atomically in one SQLite transaction"""
+
+    def __init__(self, client: "SQLiteClient"):
+        self._client = client
+        self._writes: List[Tuple[str, DocumentReference, Optional[dict], bool]] = []
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def set(self, reference: DocumentReference, document_data: dict, merge: bool = False):
+        self._writes.append(("set", reference, document_data, merge))
+
+    def create(self, reference: DocumentReference, document_data: dict):
+        self._writes.append(("create", reference, document_data, False))
+
+    def update(self, reference: DocumentReference, field_updates: dict):
+        self._writes.append(("update", reference, field_updates, False))
+
+    def delete(self, reference: DocumentReference):
+        self._writes.append(("delete", reference, None, False))
+
+    def _apply(self, connection: sqlite3.Connection):
+        for op, reference, data, merge in self._writes:
+            if op == "delete":
+                connection.execute(
+                    "DELETE FROM documents WHERE collection = ? AND id = ?", (reference._collection, reference.id)
+                )
+                continue
+
+            current = reference._read(connection)
+            if op == "create" and current is not None:
+                raise AlreadyExists(f"Document already exists: {reference.path}")
+            if op == "update":
+                if current is None:
+                    raise NotFound(f"No document to update: {reference.path}")
+                document = current
+                for field_path, value in data.items():
+                    target = document
+                    parts = field_path.split(".")
+                    for part in parts[:-1]:
+                        if not isinstance(target.get(part), dict):
+                            target[part] = {}
+                        target = target[part]
+                    if isinstance(value, Increment):
+                        _merge(target, {parts[-1]: value})
+                    else:
+                        # update() thay cả map tại field path, không gộp như set(merge=True)
+                        target[parts[-1]] = _encode(value)
+            elif merge and current is not None:
+                document = current
+                _merge(document, data)
+            else:
+                document = _encode(data)
+
+            connection.execute(
+                "INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)",
+                (reference._collection, reference.id, json.dumps(document, ensure_ascii=False, separators=(",", ":")))
+            )
+
+    def commit(self):
+        with self._client.write() as connection:
+            self._apply(connection)
+        self._writes = []
+
+
+class Transaction(WriteBatch):
+    """Reads see the locked database; writes are applied when the function returns"""
+
+    def get_all(self, references: Sequence[DocumentReference]) -> List[DocumentSnapshot]:
+        return self._client.get_all(references)
+
+
+class _WriteScope:
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.owner = not connection.in_transaction
+
+    def __enter__(self) -> sqlite3.Connection:
+        if self.owner:
+            self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.owner:
+            self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+class SQLiteClient:
+    """Firestore-compatible client backed by a local SQLite file"""
+
+    def __init__(self, path: str, busy_timeout_seconds: float = 30.0, watch_interval_seconds: float = 0.5):
+        self.path = path
+        self.busy_timeout_seconds = busy_timeout_seconds
+        self.watch_interval_seconds = watch_interval_seconds
+        self._local = threading.local()
+        self._init_schema()
+
+    def connection(self) -> sqlite3.Connection:
+        """One connection per thread (run_db thread pool) - WAL allows concurrent readers"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout_seconds, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _init_schema(self):
+        connection = self.connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "collection TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (collection, id)) WITHOUT ROWID"
+        )
+        for name, fields in _INDEXES.items():
+            columns = ", ".join(["collection"] + [_field(field) for field in fields])
+            connection.execute(f"CREATE INDEX IF NOT EXISTS idx_documents_{name} ON documents ({columns})")
+
+    def write(self) -> _WriteScope:
+        return _WriteScope(self.connection())
+
+    def collection(self, name: str) -> CollectionReference:
+        return CollectionReference(self, name)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def transaction(self) -> Transaction:
+        return Transaction(self)
+
+    def get_all(self, references: Sequence[DocumentReference], transaction=None) -> List[DocumentSnapshot]:
+        return [reference.get() for reference in references]
+
+    def run_transaction(self, func: Callable, *args, **kwargs):
+        """Run func(transaction, *args, **kwargs) holding the write lock (blocking)"""
+        transaction = self.transaction()
+        with self.write() as connection:
+            result = func(transaction, *args, **kwargs)
+            transaction._apply(connection)
+        return result
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -1,5 +1,6 @@
 from .cash_voucher import (
     CashVoucher,
+    CashVoucherSummary,
     CashVoucherLine,
     CashVoucherCreate,
     CashVoucherUpdate,
@@ -9,16 +10,23 @@ from .cash_voucher import (
 )
 from .warehouse_voucher import (
     WarehouseVoucher,
+    WarehouseVoucherSummary,
     WarehouseVoucherLine,
+    WarehouseVoucherLinePage,
     WarehouseVoucherCreate,
     WarehouseVoucherUpdate,
     WarehouseVoucherType,
     ReceiptType,
     IssueType
 )
+from .inventory import InventoryBalance, CostLayer
+from .ledger import JournalLine, JournalEntry, AccountBalance
+from .report import TrialBalance, TrialBalanceRow, AccountDetail, AccountDetailLine
+from .search import VoucherSearchHit, VoucherSearchResult
 
 __all__ = [
     "CashVoucher",
+    "CashVoucherSummary",
     "CashVoucherLine",
     "CashVoucherCreate",
     "CashVoucherUpdate",
@@ -26,10 +34,23 @@ __all__ = [
     "VoucherStatus",
     "PaymentMethod",
     "WarehouseVoucher",
+    "WarehouseVoucherSummary",
     "WarehouseVoucherLine",
+    "WarehouseVoucherLinePage",
     "WarehouseVoucherCreate",
     "WarehouseVoucherUpdate",
     "WarehouseVoucherType",
     "ReceiptType",
     "IssueType",
+    "InventoryBalance",
+    "CostLayer",
+    "JournalLine",
+    "JournalEntry",
+    "AccountBalance",
+    "TrialBalance",
+    "TrialBalanceRow",
+    "AccountDetail",
+    "AccountDetailLine",
+    "VoucherSearchHit",
+    "VoucherSearchResult",
 ]
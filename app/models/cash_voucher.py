@@ -135,3 +135,27 @@ class CashVoucher(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class CashVoucherSummary(BaseModel):
+    """Thông tin chung của phiếu thu/chi cho màn hình danh sách (không có lines)"""
+    id: str
+    voucher_type: VoucherType
+    voucher_no: str
+    voucher_date: datetime
+    posting_date: Optional[datetime] = None
+    related_object_type: RelatedObjectType
+    related_object_code: Optional[str] = None
+    related_object_name: str
+    reason: str
+    payment_method: PaymentMethod
+    cash_account_code: str
+    total_amount: float
+    total_tax_amount: float
+    grand_total: float
+    status: VoucherStatus = VoucherStatus.DRAFT
+    created_at: datetime
+    created_by: str
+    updated_at: Optional[datetime] = None
+    posted_at: Optional[datetime] = None
+    cancelled_at: Optional[datetime] = None
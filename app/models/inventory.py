@@ -0,0 +1,37 @@
+"""
+Tồn kho - Inventory Balance Models
+"""
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+
+class CostLayer(BaseModel):
+    """Lớp giá nhập kho (FIFO)"""
+    key: str
+    voucher_no: Optional[str] = None
+    quantity: float
+    unit_cost: float
+
+
+class InventoryBalance(BaseModel):
+    """Số dư tồn kho theo kho và hàng hóa"""
+    id: str
+    warehouse_code: str
+    product_code: str
+    product_name: Optional[str] = None
+    unit: Optional[str] = None
+
+    # Số lượng và giá trị tồn
+    quantity: float = 0
+    value: float = 0
+    average_cost: float = 0
+    layers: List[CostLayer] = []  # Chỉ dùng khi COSTING_METHOD=fifo
+
+    # Phiếu gần nhất làm thay đổi tồn kho
+    last_voucher_id: Optional[str] = None
+    last_voucher_no: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
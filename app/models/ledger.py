@@ -0,0 +1,47 @@
+"""
+Sổ cái - Journal Entry / Account Balance Models
+Theo Thông tư 133/2016/TT-BTC
+"""
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+
+
+class JournalLine(BaseModel):
+    """Một định khoản Nợ/Có"""
+    debit_account: str
+    credit_account: str
+    amount: float
+    description: Optional[str] = None
+
+
+class JournalEntry(BaseModel):
+    """Bút toán sinh ra khi ghi sổ một phiếu"""
+    id: str
+    source: str  # cash | warehouse
+    voucher_id: str
+    voucher_no: str
+    voucher_type: str
+    voucher_date: datetime
+    period: str  # YYYY-MM
+    status: str  # POSTED | CANCELLED
+    description: Optional[str] = None
+    lines: List[JournalLine]
+    accounts: List[str]
+    total_amount: float
+    created_at: datetime
+    cancelled_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class AccountBalance(BaseModel):
+    """Số dư và số phát sinh của một tài khoản trong kỳ"""
+    account_code: str
+    opening_debit: float = 0
+    opening_credit: float = 0
+    debit: float = 0
+    credit: float = 0
+    closing_debit: float = 0
+    closing_credit: float = 0
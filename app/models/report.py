@@ -0,0 +1,54 @@
+"""
+Báo cáo - Report Models
+Theo Thông tư 133/2016/TT-BTC
+"""
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+
+
+class TrialBalanceRow(BaseModel):
+    """Một dòng bảng cân đối số phát sinh (số tiền: đồng)"""
+    account_code: str
+    is_rollup: bool = False  # Dòng tổng hợp theo tài khoản cấp trên (VD: 111 gồm 1111, 1112)
+    opening_debit: int = 0
+    opening_credit: int = 0
+    debit: int = 0
+    credit: int = 0
+    closing_debit: int = 0
+    closing_credit: int = 0
+
+
+class TrialBalance(BaseModel):
+    """Bảng cân đối số phát sinh"""
+    from_date: datetime
+    to_date: datetime
+    rows: List[TrialBalanceRow]
+    totals: TrialBalanceRow
+    line_count: int
+
+
+class AccountDetailLine(BaseModel):
+    """Một dòng sổ chi tiết tài khoản"""
+    voucher_date: datetime
+    source: str
+    voucher_id: str
+    voucher_no: Optional[str] = None
+    description: Optional[str] = None
+    account_code: str
+    counter_account: str
+    debit: int = 0
+    credit: int = 0
+    balance: int = 0  # Số dư lũy kế (Nợ - Có)
+
+
+class AccountDetail(BaseModel):
+    """Sổ chi tiết tài khoản"""
+    account_code: str
+    from_date: datetime
+    to_date: datetime
+    opening_balance: int
+    debit: int
+    credit: int
+    closing_balance: int
+    lines: List[AccountDetailLine]
@@ -0,0 +1,22 @@
+"""
+Tìm kiếm phiếu - Voucher Search Models
+"""
+from pydantic import BaseModel
+from typing import Any, Dict, List
+from datetime import datetime
+
+
+class VoucherSearchHit(BaseModel):
+    """Một phiếu khớp từ khóa"""
+    source: str  # cash | warehouse
+    id: str
+    voucher_date: datetime
+    score: float
+    summary: Dict[str, Any]  # Các trường của CashVoucherSummary / WarehouseVoucherSummary
+
+
+class VoucherSearchResult(BaseModel):
+    """Kết quả tìm kiếm, phiếu khớp nhiều nhất trước"""
+    query: str
+    items: List[VoucherSearchHit]
+    truncated: bool = False  # True: từ khóa khớp quá nhiều phiếu, chỉ xếp hạng các phiếu mới nhất
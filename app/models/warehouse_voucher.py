@@ -118,8 +118,11 @@ class WarehouseVoucher(BaseModel):
     keeper: Optional[str] = None
     receiver: Optional[str] = None
 
-    # Chi tiết
+    # Chi tiết - phiếu lớn lưu dòng tách riêng (line_chunks > 0): lines rỗng, đọc qua GET /{id}/lines
     lines: List[WarehouseVoucherLine]
+    line_count: Optional[int] = None
+    line_chunks: int = 0
+    line_chunk_size: Optional[int] = None  # Số dòng mỗi khối lúc ghi
 
     # Tổng hợp
     total_quantity: float
@@ -128,6 +131,8 @@ class WarehouseVoucher(BaseModel):
     # Bút toán
     debit_account: str
     credit_account: str
+    # Hủy phiếu nhập bình quân: giá trị tồn kho xuất ra trừ thành tiền phiếu (hạch toán vào 632)
+    cost_adjustment: Optional[float] = None
 
     # Ghi chú
     description: Optional[str] = None
@@ -145,3 +150,38 @@ class WarehouseVoucher(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class WarehouseVoucherSummary(BaseModel):
+    """Thông tin chung của phiếu nhập/xuất kho cho màn hình danh sách (không có lines)"""
+    id: str
+    voucher_no: str
+    voucher_type: WarehouseVoucherType
+    receipt_type: Optional[ReceiptType] = None
+    issue_type: Optional[IssueType] = None
+    voucher_date: datetime
+    status: WarehouseVoucherStatus = WarehouseVoucherStatus.DRAFT
+    partner_code: Optional[str] = None
+    partner_name: Optional[str] = None
+    ref_voucher_no: Optional[str] = None
+    warehouse_code: str
+    warehouse_name: str
+    line_count: Optional[int] = None
+    total_quantity: float
+    total_amount: float
+    debit_account: str
+    credit_account: str
+    description: Optional[str] = None
+    created_at: datetime
+    created_by: str
+    updated_at: Optional[datetime] = None
+    posted_at: Optional[datetime] = None
+    cancelled_at: Optional[datetime] = None
+
+
+class WarehouseVoucherLinePage(BaseModel):
+    """Một trang dòng phiếu kho (GET /{voucher_id}/lines)"""
+    voucher_id: str
+    line_count: int
+    offset: int
+    lines: List[WarehouseVoucherLine]
@@ -1,4 +1,11 @@
 from .cash_voucher_routes import router as cash_voucher_router
 from .warehouse_voucher_routes import router as warehouse_voucher_router
+from .inventory_routes import router as inventory_router
+from .ledger_routes import router as ledger_router
+from .report_routes import router as report_router
+from .profile_routes import router as profile_router
+from .voucher_stream_routes import router as voucher_stream_router
+from .search_routes import router as search_router
 
-__all__ = ["cash_voucher_router", "warehouse_voucher_router"]
+__all__ = ["cash_voucher_router", "warehouse_voucher_router", "inventory_router", "ledger_router", "report_router", "profile_router",
+           "voucher_stream_router", "search_router"]
@@ -1,25 +1,37 @@
 """
 Cash Voucher API Routes - Phiếu Thu/Chi
 """
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional, List
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, Literal, Optional, List, Union
 from datetime import datetime
 
+from ..config.settings import settings
 from ..models.cash_voucher import (
     CashVoucher,
+    CashVoucherSummary,
     CashVoucherCreate,
     CashVoucherUpdate,
     VoucherType,
     VoucherStatus
 )
 from ..services.cash_voucher_service import CashVoucherService
+from ..services.providers import get_cash_voucher_service
+from ..services.idempotency import IdempotencyKeyConflict
+from ..services.voucher_export import EXPORT_MEDIA_TYPES, export_chunks
+from .responses import (
+    ORJSONResponse, collection_etag, etag_headers, etag_matches, model_response, not_modified, voucher_etag
+)
 
-router = APIRouter(prefix="/api/cash-vouchers", tags=["Cash Vouchers"])
-service = CashVoucherService()
+router = APIRouter(prefix="/api/cash-vouchers", tags=["Cash Vouchers"], default_response_class=ORJSONResponse)
 
 
 @router.post("", response_model=CashVoucher, status_code=201)
-async def create_voucher(data: CashVoucherCreate):
+async def create_voucher(
+    data: CashVoucherCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    service: CashVoucherService = Depends(get_cash_voucher_service)
+):
     """
     Tạo phiếu thu/chi mới
 
@@ -30,19 +42,58 @@ async def create_voucher(data: CashVoucherCreate):
     - **lines**: Danh sách chi tiết
     """
     try:
-        voucher = await service.create(data)
-        return voucher
+        voucher = await service.create(data, idempotency_key=idempotency_key)
+        return model_response(CashVoucher, voucher, status_code=201)
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("", response_model=List[CashVoucher])
+@router.post("/batch")
+async def create_vouchers_batch(
+    items: List[Dict[str, Any]] = Body(..., description="Danh sách phiếu cần tạo"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    service: CashVoucherService = Depends(get_cash_voucher_service)
+):
+    """
+    Tạo nhiều phiếu thu/chi cùng lúc (đồng bộ cuối ngày)
+
+    - Mỗi phần tử có cấu trúc giống body của `POST /api/cash-vouchers`
+    - Số phiếu được cấp liên tiếp cho cả lô, ghi bằng WriteBatch
+    - Trả về kết quả từng phần tử theo đúng thứ tự gửi lên
+    - Gửi lại với cùng header `Idempotency-Key` chỉ tạo các phiếu chưa được ghi
+    """
+    if len(items) > settings.voucher_batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Tối đa {settings.voucher_batch_max_items} phiếu mỗi lần")
+
+    try:
+        results = await service.create_batch(items, idempotency_key=idempotency_key)
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    created = sum(1 for result in results if result["success"])
+    return {
+        "total": len(results),
+        "created": created,
+        "failed": len(results) - created,
+        "results": results
+    }
+
+
+@router.get("", response_model=Union[List[CashVoucher], List[CashVoucherSummary], List[Dict[str, Any]]])
 async def get_vouchers(
+    request: Request,
     voucher_type: Optional[VoucherType] = Query(None, description="Loại phiếu: RECEIPT/PAYMENT"),
     status: Optional[VoucherStatus] = Query(None, description="Trạng thái: DRAFT/POSTED/CANCELLED"),
     from_date: Optional[datetime] = Query(None, description="Từ ngày"),
     to_date: Optional[datetime] = Query(None, description="Đến ngày"),
-    limit: int = Query(100, ge=1, le=500, description="Số lượng tối đa")
+    limit: int = Query(100, ge=1, le=500, description="Số lượng tối đa"),
+    cursor: Optional[str] = Query(None, description="Cursor trang tiếp theo (header X-Next-Cursor)"),
+    fields: Optional[str] = Query(None, description="summary: chỉ thông tin chung, không có lines; hoặc danh sách trường, VD: voucher_no,voucher_date,status"),
+    service: CashVoucherService = Depends(get_cash_voucher_service)
 ):
     """
     Lấy danh sách phiếu thu/chi
@@ -51,24 +102,83 @@ async def get_vouchers(
     - Loại phiếu (thu/chi)
     - Trạng thái
     - Khoảng thời gian
+
+    Kết quả sắp xếp theo ngày phiếu giảm dần. Nếu còn trang sau, header
+    `X-Next-Cursor` chứa cursor để truyền vào tham số `cursor`.
+
+    `fields=summary` hoặc `fields=<trường>,...` chỉ đọc các trường cần (field mask của Firestore),
+    không tải và dựng `lines` - dùng cho màn hình danh sách.
+
+    Response có `ETag` theo bộ đếm thay đổi của collection; gửi lại với `If-None-Match` nhận 304
+    nếu chưa có phiếu nào thay đổi.
     """
+    filters = dict(
+        voucher_type=voucher_type,
+        status=status,
+        from_date=from_date,
+        to_date=to_date,
+        limit=limit,
+        cursor=cursor
+    )
+    etag = collection_etag(await service.get_version(), request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     try:
-        vouchers = await service.get_all(
-            voucher_type=voucher_type,
-            status=status,
-            from_date=from_date,
-            to_date=to_date,
-            limit=limit
-        )
-        return vouchers
+        if fields == "summary":
+            vouchers, next_cursor = await service.get_summary_page(**filters)
+            model_type = List[CashVoucherSummary]
+        elif fields:
+            requested = [name.strip() for name in fields.split(",") if name.strip()]
+            vouchers, next_cursor = await service.get_summary_page(**filters, fields=requested)
+            model_type = List[Dict[str, Any]]
+        else:
+            vouchers, next_cursor = await service.get_page(**filters)
+            model_type = List[CashVoucher]
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return model_response(model_type, vouchers, headers=etag_headers(etag, headers))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/export")
+async def export_vouchers(
+    voucher_type: Optional[VoucherType] = Query(None, description="Loại phiếu: RECEIPT/PAYMENT"),
+    status: Optional[VoucherStatus] = Query(None, description="Trạng thái: DRAFT/POSTED/CANCELLED"),
+    from_date: Optional[datetime] = Query(None, description="Từ ngày"),
+    to_date: Optional[datetime] = Query(None, description="Đến ngày"),
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="ndjson hoặc csv"),
+    layout: Literal["header", "lines"] = Query("header", description="CSV: một dòng mỗi phiếu (header) hoặc mỗi dòng chi tiết (lines)"),
+    service: CashVoucherService = Depends(get_cash_voucher_service)
+):
+    """
+    Xuất toàn bộ phiếu thu/chi theo bộ lọc (không giới hạn số lượng)
+
+    Dữ liệu được stream theo từng trang từ Firestore nên bộ nhớ server không tăng theo khoảng thời gian.
+    """
+    pages = service.iter_pages(
+        voucher_type=voucher_type,
+        status=status,
+        from_date=from_date,
+        to_date=to_date,
+        page_size=settings.export_page_size
+    )
+    chunks = export_chunks(pages, export_format, layout, service.EXPORT_HEADER_FIELDS, service.EXPORT_LINE_FIELDS)
+    filename = f"cash-vouchers-{datetime.now():%Y%m%d-%H%M%S}.{export_format}"
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @router.get("/statistics")
 async def get_statistics(
+    request: Request,
     from_date: Optional[datetime] = Query(None, description="Từ ngày"),
-    to_date: Optional[datetime] = Query(None, description="Đến ngày")
+    to_date: Optional[datetime] = Query(None, description="Đến ngày"),
+    service: CashVoucherService = Depends(get_cash_voucher_service)
 ):
     """
     Thống kê phiếu thu/chi
@@ -77,58 +187,89 @@ async def get_statistics(
     - Tổng số phiếu thu/chi
     - Tổng tiền thu/chi
     - Dòng tiền ròng
+
+    Có `ETag` như danh sách phiếu (304 khi không có phiếu nào thay đổi)
     """
+    etag = collection_etag(await service.get_version(), request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     try:
         stats = await service.get_statistics(from_date=from_date, to_date=to_date)
-        return stats
+        return ORJSONResponse(stats, headers=etag_headers(etag))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{voucher_id}", response_model=CashVoucher)
-async def get_voucher(voucher_id: str):
+async def get_voucher(
+    voucher_id: str,
+    request: Request,
+    service: CashVoucherService = Depends(get_cash_voucher_service)
+):
     """Lấy chi tiết phiếu theo ID"""
     voucher = await service.get_by_id(voucher_id)
     if not voucher:
         raise HTTPException(status_code=404, detail="Không tìm thấy phiếu")
-    return voucher
+    etag = voucher_etag(voucher.updated_at)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return model_response(CashVoucher, voucher, headers=etag_headers(etag))
 
 
 @router.put("/{voucher_id}", response_model=CashVoucher)
-async def update_voucher(voucher_id: str, data: CashVoucherUpdate):
+async def update_voucher(
+    voucher_id: str,
+    data: CashVoucherUpdate,
+    service: CashVoucherService = Depends(get_cash_voucher_service)
+):
     """
     Cập nhật phiếu (chỉ phiếu DRAFT)
     """
     voucher = await service.update(voucher_id, data)
     if not voucher:
         raise HTTPException(status_code=400, detail="Không thể cập nhật phiếu (phiếu không tồn tại hoặc đã ghi sổ)")
-    return voucher
+    return model_response(CashVoucher, voucher)
 
 
 @router.post("/{voucher_id}/post", response_model=CashVoucher)
-async def post_voucher(voucher_id: str):
+async def post_voucher(
+    voucher_id: str,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    service: CashVoucherService = Depends(get_cash_voucher_service)
+):
     """
     Ghi sổ phiếu (chuyển từ DRAFT sang POSTED)
     """
-    voucher = await service.post(voucher_id)
+    try:
+        voucher = await service.post(voucher_id, idempotency_key=idempotency_key)
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     if not voucher:
         raise HTTPException(status_code=400, detail="Không thể ghi sổ phiếu")
-    return voucher
+    return model_response(CashVoucher, voucher)
 
 
 @router.post("/{voucher_id}/cancel", response_model=CashVoucher)
-async def cancel_voucher(voucher_id: str, reason: str = Query(..., min_length=10, description="Lý do hủy (>= 10 ký tự)")):
+async def cancel_voucher(
+    voucher_id: str,
+    reason: str = Query(..., min_length=10, description="Lý do hủy (>= 10 ký tự)"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    service: CashVoucherService = Depends(get_cash_voucher_service)
+):
     """
     Hủy phiếu
     """
-    voucher = await service.cancel(voucher_id, reason)
+    try:
+        voucher = await service.cancel(voucher_id, reason, idempotency_key=idempotency_key)
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     if not voucher:
         raise HTTPException(status_code=400, detail="Không thể hủy phiếu")
-    return voucher
+    return model_response(CashVoucher, voucher)
 
 
 @router.delete("/{voucher_id}")
-async def delete_voucher(voucher_id: str):
+async def delete_voucher(voucher_id: str, service: CashVoucherService = Depends(get_cash_voucher_service)):
     """
     Xóa phiếu (chỉ phiếu DRAFT)
     """
@@ -0,0 +1,37 @@
+"""
+Inventory API Routes - Tồn kho
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional, List
+
+from ..models.inventory import InventoryBalance
+from ..services.inventory_service import InventoryService
+from ..services.providers import get_inventory_service
+
+router = APIRouter(prefix="/api/inventory", tags=["Inventory"])
+
+
+@router.get("/balances", response_model=List[InventoryBalance])
+async def get_balances(
+    warehouse_code: Optional[str] = Query(None, description="Mã kho"),
+    product_code: Optional[str] = Query(None, description="Mã hàng"),
+    limit: int = Query(500, ge=1, le=5000, description="Số lượng tối đa"),
+    service: InventoryService = Depends(get_inventory_service)
+):
+    """
+    Tra cứu tồn kho theo kho và hàng hóa
+
+    - Có cả **warehouse_code** và **product_code**: đọc đúng một document
+    - Chỉ **warehouse_code**: toàn bộ hàng trong kho (sắp xếp theo mã hàng)
+    - Chỉ **product_code**: tồn của hàng ở các kho
+
+    Tồn kho được cập nhật khi ghi sổ / hủy phiếu nhập xuất kho.
+    """
+    try:
+        return await service.get_balances(
+            warehouse_code=warehouse_code,
+            product_code=product_code,
+            limit=limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,58 @@
+"""
+Ledger API Routes - Sổ cái
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional, List
+from datetime import datetime
+
+from ..models.ledger import AccountBalance, JournalEntry
+from ..services.ledger_service import LedgerService
+from ..services.providers import get_ledger_service
+
+router = APIRouter(prefix="/api/ledger", tags=["Ledger"])
+
+PERIOD_PATTERN = r"^\d{4}-\d{2}$"
+
+
+@router.get("/balances", response_model=List[AccountBalance])
+async def get_account_balances(
+    from_period: str = Query(..., pattern=PERIOD_PATTERN, description="Từ kỳ (YYYY-MM)"),
+    to_period: str = Query(..., pattern=PERIOD_PATTERN, description="Đến kỳ (YYYY-MM)"),
+    account_prefix: Optional[str] = Query(None, description="Chỉ lấy tài khoản bắt đầu bằng (VD: 111)"),
+    service: LedgerService = Depends(get_ledger_service)
+):
+    """
+    Số dư đầu kỳ, số phát sinh Nợ/Có và số dư cuối kỳ theo tài khoản
+
+    Đọc các document số dư theo tháng (`account_balances`), không đọc lại phiếu.
+    """
+    if from_period > to_period:
+        raise HTTPException(status_code=400, detail="from_period phải nhỏ hơn hoặc bằng to_period")
+    try:
+        return await service.get_account_balances(from_period, to_period, account_prefix)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/journal", response_model=List[JournalEntry])
+async def get_journal(
+    account_code: Optional[str] = Query(None, description="Tài khoản (bút toán có Nợ hoặc Có tài khoản này)"),
+    from_date: Optional[datetime] = Query(None, description="Từ ngày"),
+    to_date: Optional[datetime] = Query(None, description="Đến ngày"),
+    include_cancelled: bool = Query(False, description="Bao gồm bút toán của phiếu đã hủy"),
+    limit: int = Query(500, ge=1, le=5000, description="Số lượng tối đa"),
+    service: LedgerService = Depends(get_ledger_service)
+):
+    """
+    Sổ nhật ký chung - bút toán sinh ra khi ghi sổ phiếu thu/chi và phiếu kho
+    """
+    try:
+        return await service.get_journal(
+            account_code=account_code,
+            from_date=from_date,
+            to_date=to_date,
+            include_cancelled=include_cancelled,
+            limit=limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,53 @@
+"""
+Profile API Routes - Xem và tải profile request đã chụp (cần X-Admin-Token)
+"""
+import asyncio
+import hmac
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from typing import Optional
+
+from ..config.profiling import list_profiles, profile_path, profile_text
+from ..config.settings import settings
+
+router = APIRouter(prefix="/api/admin/profiles", tags=["Profiling"])
+
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    token = settings.profile_admin_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Profiling chưa bật (PROFILE_ADMIN_TOKEN)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, token):
+        raise HTTPException(status_code=403, detail="X-Admin-Token không hợp lệ")
+
+
+@router.get("", dependencies=[Depends(require_admin_token)])
+async def get_profiles(limit: int = Query(100, ge=1, le=1000, description="Số profile mới nhất")):
+    """
+    Danh sách profile đã chụp (mới nhất trước)
+
+    - Mỗi profile có route, status, thời gian xử lý (ms), cách bật (header | sample)
+    - Bật profile cho một request: gửi header `X-Profile: <PROFILE_ADMIN_TOKEN>`,
+      response trả về `X-Profile-Id`
+    """
+    return await asyncio.to_thread(list_profiles, limit)
+
+
+@router.get("/{profile_id}", dependencies=[Depends(require_admin_token)])
+async def download_profile(
+    profile_id: str,
+    format: str = Query("prof", pattern="^(prof|text)$", description="prof: file pstats, text: top hàm theo cumulative"),
+    limit: int = Query(60, ge=1, le=1000, description="Số dòng (format=text)")
+):
+    """
+    Tải profile
+
+    - `prof`: mở bằng `python -m pstats` hoặc snakeviz
+    - `text`: bảng pstats sắp xếp theo thời gian cộng dồn
+    """
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy profile {profile_id}")
+    if format == "text":
+        return PlainTextResponse(await asyncio.to_thread(profile_text, path, limit))
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
@@ -0,0 +1,58 @@
+"""
+Report API Routes - Báo cáo kế toán
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from datetime import datetime
+
+from ..models.report import AccountDetail, TrialBalance
+from ..services.report_service import ReportService, ROLLUP_LENGTHS
+from ..services.providers import get_report_service
+
+router = APIRouter(prefix="/api/reports", tags=["Reports"])
+
+
+@router.get("/trial-balance", response_model=TrialBalance)
+async def get_trial_balance(
+    from_date: datetime = Query(..., description="Từ ngày"),
+    to_date: datetime = Query(..., description="Đến ngày"),
+    account_prefix: Optional[str] = Query(None, description="Chỉ lấy tài khoản bắt đầu bằng (VD: 1)"),
+    level: Optional[int] = Query(None, ge=1, le=len(ROLLUP_LENGTHS), description="1: chỉ TK cấp 1, 2: đến TK cấp 2, bỏ trống: tất cả"),
+    service: ReportService = Depends(get_report_service)
+):
+    """
+    Bảng cân đối số phát sinh (TT133)
+
+    - Số dư đầu kỳ, số phát sinh Nợ/Có, số dư cuối kỳ theo tài khoản (đồng)
+    - Có dòng tổng hợp theo tài khoản cấp 1 / cấp 2 (VD: 111 gồm 1111, 1112)
+    - Tính từ bút toán đã ghi sổ (`journal_entries`) và số dư theo tháng (`account_balances`)
+    """
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date phải nhỏ hơn hoặc bằng to_date")
+    try:
+        return await service.get_trial_balance(
+            from_date=from_date,
+            to_date=to_date,
+            account_prefix=account_prefix,
+            max_length=ROLLUP_LENGTHS[level - 1] if level else None
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/account-detail", response_model=AccountDetail)
+async def get_account_detail(
+    account_code: str = Query(..., min_length=1, description="Tài khoản (gồm cả tài khoản con)"),
+    from_date: datetime = Query(..., description="Từ ngày"),
+    to_date: datetime = Query(..., description="Đến ngày"),
+    service: ReportService = Depends(get_report_service)
+):
+    """
+    Sổ chi tiết tài khoản - số dư đầu kỳ, từng bút toán có Nợ/Có tài khoản, số dư lũy kế
+    """
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date phải nhỏ hơn hoặc bằng to_date")
+    try:
+        return await service.get_account_detail(account_code, from_date, to_date)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
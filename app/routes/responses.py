@@ -0,0 +1,83 @@
+"""
+Response helpers - trả JSON nhanh cho route phiếu
+
+Model do service dựng (CashVoucher, WarehouseVoucher) đã hợp lệ, nên được serialize một
+lần bằng pydantic-core thay vì để FastAPI validate lại theo response_model rồi encode
+bằng json chuẩn. response_model vẫn giữ trên decorator cho OpenAPI.
+
+ETag: phiếu dùng ETag mạnh theo updated_at; danh sách / thống kê dùng ETag yếu theo bộ đếm
+thay đổi của collection (voucher_versions) và query string. Request có If-None-Match khớp
+nhận 304 không body.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Mapping, Optional
+
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import TypeAdapter
+
+from ..config.database import as_utc
+
+__all__ = [
+    "ORJSONResponse", "model_response", "voucher_etag", "collection_etag", "etag_headers", "etag_matches",
+    "not_modified"
+]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@lru_cache(maxsize=None)
+def _adapter(model_type: Any) -> TypeAdapter:
+    return TypeAdapter(model_type)
+
+
+def model_response(
+    model_type: Any,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Mapping[str, str]] = None
+) -> Response:
+    """JSON response for trusted model data (model_type: CashVoucher, List[CashVoucher], ...)"""
+    return Response(
+        _adapter(model_type).dump_json(content, by_alias=True),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json"
+    )
+
+
+def voucher_etag(updated_at: Optional[datetime]) -> Optional[str]:
+    """Strong ETag of one voucher: updated_at in microseconds"""
+    if updated_at is None:
+        return None
+    return f'"{(as_utc(updated_at) - _EPOCH) // timedelta(microseconds=1)}"'
+
+
+def collection_etag(version: int, request: Request) -> str:
+    """Weak ETag of a list / statistics response: collection version + query parameters"""
+    query = hashlib.sha1(repr(sorted(request.query_params.multi_items())).encode("utf-8")).hexdigest()[:16]
+    return f'W/"{version}-{query}"'
+
+
+def etag_headers(etag: Optional[str], headers: Optional[Mapping[str, str]] = None) -> Optional[Dict[str, str]]:
+    """ETag + Cache-Control: no-cache (the client revalidates every time, usually getting a 304)"""
+    if etag is None:
+        return dict(headers) if headers else None
+    return {**(headers or {}), "ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """If-None-Match contains etag (weak comparison, RFC 9110)"""
+    header = request.headers.get("if-none-match")
+    if not header or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == target for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag))
@@ -0,0 +1,33 @@
+"""
+Voucher Search API Routes - Tìm kiếm phiếu
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Literal, Optional
+from datetime import datetime
+
+from ..models.search import VoucherSearchResult
+from ..services.voucher_search import VoucherSearchService
+from ..services.providers import get_search_service
+
+router = APIRouter(prefix="/api/vouchers", tags=["Voucher Search"])
+
+
+@router.get("/search", response_model=VoucherSearchResult)
+async def search_vouchers(
+    q: str = Query(..., min_length=2, max_length=200, description="Từ khóa, có dấu hoặc không dấu (VD: nguyen van a)"),
+    source: Optional[Literal["cash", "warehouse"]] = Query(None, description="cash: phiếu thu/chi, warehouse: phiếu kho"),
+    from_date: Optional[datetime] = Query(None, description="Từ ngày"),
+    to_date: Optional[datetime] = Query(None, description="Đến ngày"),
+    limit: int = Query(20, ge=1, le=100),
+    service: VoucherSearchService = Depends(get_search_service)
+):
+    """
+    Tìm phiếu theo số phiếu, tên / mã đối tượng, lý do, diễn giải, tên / mã hàng trong dòng phiếu
+
+    - Không phân biệt hoa thường và dấu tiếng Việt; mỗi từ khớp đầu từ ("ngu" khớp "Nguyễn")
+    - Phiếu phải chứa mọi từ; xếp hạng theo trường khớp (tên đối tượng, số phiếu trước) rồi ngày mới trước
+    - `truncated`: từ khóa quá phổ biến, chỉ các phiếu mới nhất được xét - thêm từ hoặc thu hẹp ngày
+    """
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date phải nhỏ hơn hoặc bằng to_date")
+    return await service.search(q, source, from_date, to_date, limit)
@@ -0,0 +1,58 @@
+"""
+Voucher Stream API Routes - Luồng thay đổi phiếu (Server-Sent Events)
+"""
+import asyncio
+import json
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Literal, Optional
+
+from ..config.settings import settings
+from ..services.voucher_events import get_voucher_event_hub
+
+router = APIRouter(prefix="/api/vouchers", tags=["Voucher Events"])
+
+
+async def _event_stream(
+    source: Optional[str],
+    voucher_type: Optional[str],
+    warehouse_code: Optional[str]
+) -> AsyncIterator[str]:
+    # Đăng ký khi response bắt đầu gửi: client ngắt trước đó thì không để lại subscription
+    hub = get_voucher_event_hub()
+    subscription = hub.subscribe(source, voucher_type, warehouse_code)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout=settings.voucher_stream_keepalive_seconds)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@router.get("/stream")
+async def stream_voucher_changes(
+    source: Optional[Literal["cash", "warehouse"]] = Query(None, description="cash: phiếu thu/chi, warehouse: phiếu kho"),
+    voucher_type: Optional[str] = Query(None, description="Loại phiếu: RECEIPT/PAYMENT/ISSUE"),
+    warehouse_code: Optional[str] = Query(None, description="Mã kho (phiếu kho)")
+):
+    """
+    Luồng thay đổi phiếu (Server-Sent Events) thay cho poll danh sách
+
+    - Sự kiện: `created`, `updated`, `posted`, `cancelled`, `deleted`; `data` gồm `source`,
+      `id`, `voucher_no`, `voucher_type`, `status`, `voucher_date`, `warehouse_code`, `at`
+    - `reset`: client nhận chậm, đã bỏ lỡ sự kiện - tải lại danh sách rồi kết nối lại
+    - Dùng `EventSource` trên trình duyệt; comment `: keepalive` gửi định kỳ để giữ kết nối
+    """
+    return StreamingResponse(
+        _event_stream(source, voucher_type, warehouse_code),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
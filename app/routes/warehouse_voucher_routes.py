@@ -1,25 +1,40 @@
 """
 Warehouse Voucher API Routes - Phiếu Nhập/Xuất Kho
 """
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional, List
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, Literal, Optional, List, Union
 from datetime import datetime
 
+from ..config.settings import settings
 from ..models.warehouse_voucher import (
     WarehouseVoucher,
+    WarehouseVoucherSummary,
+    WarehouseVoucherLine,
+    WarehouseVoucherLinePage,
     WarehouseVoucherCreate,
     WarehouseVoucherUpdate,
     WarehouseVoucherType,
     WarehouseVoucherStatus
 )
 from ..services.warehouse_voucher_service import WarehouseVoucherService
+from ..services.providers import get_warehouse_voucher_service
+from ..services.inventory_service import InsufficientStockError
+from ..services.idempotency import IdempotencyKeyConflict
+from ..services.voucher_export import EXPORT_MEDIA_TYPES, export_chunks
+from .responses import (
+    ORJSONResponse, collection_etag, etag_headers, etag_matches, model_response, not_modified, voucher_etag
+)
 
-router = APIRouter(prefix="/api/warehouse-vouchers", tags=["Warehouse Vouchers"])
-service = WarehouseVoucherService()
+router = APIRouter(prefix="/api/warehouse-vouchers", tags=["Warehouse Vouchers"], default_response_class=ORJSONResponse)
 
 
 @router.post("", response_model=WarehouseVoucher, status_code=201)
-async def create_voucher(data: WarehouseVoucherCreate):
+async def create_voucher(
+    data: WarehouseVoucherCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
+):
     """
     Tạo phiếu nhập/xuất kho mới
 
@@ -30,20 +45,59 @@ async def create_voucher(data: WarehouseVoucherCreate):
     - **lines**: Danh sách chi tiết hàng hóa
     """
     try:
-        voucher = await service.create(data)
-        return voucher
+        voucher = await service.create(data, idempotency_key=idempotency_key)
+        return model_response(WarehouseVoucher, voucher, status_code=201)
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/batch")
+async def create_vouchers_batch(
+    items: List[Dict[str, Any]] = Body(..., description="Danh sách phiếu cần tạo"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
+):
+    """
+    Tạo nhiều phiếu nhập/xuất kho cùng lúc (đồng bộ cuối ngày)
+
+    - Mỗi phần tử có cấu trúc giống body của `POST /api/warehouse-vouchers`
+    - Số phiếu được cấp liên tiếp cho cả lô, ghi bằng WriteBatch
+    - Trả về kết quả từng phần tử theo đúng thứ tự gửi lên
+    - Gửi lại với cùng header `Idempotency-Key` chỉ tạo các phiếu chưa được ghi
+    """
+    if len(items) > settings.voucher_batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Tối đa {settings.voucher_batch_max_items} phiếu mỗi lần")
+
+    try:
+        results = await service.create_batch(items, idempotency_key=idempotency_key)
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    created = sum(1 for result in results if result["success"])
+    return {
+        "total": len(results),
+        "created": created,
+        "failed": len(results) - created,
+        "results": results
+    }
+
 
-@router.get("", response_model=List[WarehouseVoucher])
+@router.get("", response_model=Union[List[WarehouseVoucher], List[WarehouseVoucherSummary], List[Dict[str, Any]]])
 async def get_vouchers(
+    request: Request,
     voucher_type: Optional[WarehouseVoucherType] = Query(None, description="Loại phiếu: RECEIPT/ISSUE"),
     status: Optional[WarehouseVoucherStatus] = Query(None, description="Trạng thái: DRAFT/POSTED/CANCELLED"),
     warehouse_code: Optional[str] = Query(None, description="Mã kho"),
     from_date: Optional[datetime] = Query(None, description="Từ ngày"),
     to_date: Optional[datetime] = Query(None, description="Đến ngày"),
-    limit: int = Query(100, ge=1, le=500, description="Số lượng tối đa")
+    limit: int = Query(100, ge=1, le=500, description="Số lượng tối đa"),
+    cursor: Optional[str] = Query(None, description="Cursor trang tiếp theo (header X-Next-Cursor)"),
+    fields: Optional[str] = Query(None, description="summary: chỉ thông tin chung, không có lines; hoặc danh sách trường, VD: voucher_no,voucher_date,status"),
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
 ):
     """
     Lấy danh sách phiếu nhập/xuất kho
@@ -53,26 +107,87 @@ async def get_vouchers(
     - Trạng thái
     - Mã kho
     - Khoảng thời gian
+
+    Kết quả sắp xếp theo ngày phiếu giảm dần. Nếu còn trang sau, header
+    `X-Next-Cursor` chứa cursor để truyền vào tham số `cursor`.
+
+    `fields=summary` hoặc `fields=<trường>,...` chỉ đọc các trường cần (field mask của Firestore),
+    không tải và dựng `lines` - dùng cho màn hình danh sách.
+
+    Response có `ETag` theo bộ đếm thay đổi của collection; gửi lại với `If-None-Match` nhận 304
+    nếu chưa có phiếu nào thay đổi.
     """
+    filters = dict(
+        voucher_type=voucher_type,
+        status=status,
+        warehouse_code=warehouse_code,
+        from_date=from_date,
+        to_date=to_date,
+        limit=limit,
+        cursor=cursor
+    )
+    etag = collection_etag(await service.get_version(), request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     try:
-        vouchers = await service.get_all(
-            voucher_type=voucher_type,
-            status=status,
-            warehouse_code=warehouse_code,
-            from_date=from_date,
-            to_date=to_date,
-            limit=limit
-        )
-        return vouchers
+        if fields == "summary":
+            vouchers, next_cursor = await service.get_summary_page(**filters)
+            model_type = List[WarehouseVoucherSummary]
+        elif fields:
+            requested = [name.strip() for name in fields.split(",") if name.strip()]
+            vouchers, next_cursor = await service.get_summary_page(**filters, fields=requested)
+            model_type = List[Dict[str, Any]]
+        else:
+            vouchers, next_cursor = await service.get_page(**filters)
+            model_type = List[WarehouseVoucher]
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return model_response(model_type, vouchers, headers=etag_headers(etag, headers))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/export")
+async def export_vouchers(
+    voucher_type: Optional[WarehouseVoucherType] = Query(None, description="Loại phiếu: RECEIPT/ISSUE"),
+    status: Optional[WarehouseVoucherStatus] = Query(None, description="Trạng thái: DRAFT/POSTED/CANCELLED"),
+    warehouse_code: Optional[str] = Query(None, description="Mã kho"),
+    from_date: Optional[datetime] = Query(None, description="Từ ngày"),
+    to_date: Optional[datetime] = Query(None, description="Đến ngày"),
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="ndjson hoặc csv"),
+    layout: Literal["header", "lines"] = Query("header", description="CSV: một dòng mỗi phiếu (header) hoặc mỗi dòng chi tiết (lines)"),
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
+):
+    """
+    Xuất toàn bộ phiếu nhập/xuất kho theo bộ lọc (không giới hạn số lượng)
+
+    Dữ liệu được stream theo từng trang từ Firestore nên bộ nhớ server không tăng theo khoảng thời gian.
+    """
+    pages = service.iter_pages(
+        voucher_type=voucher_type,
+        status=status,
+        warehouse_code=warehouse_code,
+        from_date=from_date,
+        to_date=to_date,
+        page_size=settings.export_page_size
+    )
+    chunks = export_chunks(pages, export_format, layout, service.EXPORT_HEADER_FIELDS, service.EXPORT_LINE_FIELDS)
+    filename = f"warehouse-vouchers-{datetime.now():%Y%m%d-%H%M%S}.{export_format}"
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @router.get("/statistics")
 async def get_statistics(
+    request: Request,
     voucher_type: Optional[WarehouseVoucherType] = Query(None, description="Loại phiếu"),
     from_date: Optional[datetime] = Query(None, description="Từ ngày"),
-    to_date: Optional[datetime] = Query(None, description="Đến ngày")
+    to_date: Optional[datetime] = Query(None, description="Đến ngày"),
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
 ):
     """
     Thống kê phiếu kho
@@ -81,62 +196,140 @@ async def get_statistics(
     - Tổng số phiếu
     - Số lượng theo trạng thái
     - Tổng số lượng và giá trị
+
+    Có `ETag` như danh sách phiếu (304 khi không có phiếu nào thay đổi)
     """
+    etag = collection_etag(await service.get_version(), request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     try:
         stats = await service.get_statistics(
             voucher_type=voucher_type,
             from_date=from_date,
             to_date=to_date
         )
-        return stats
+        return ORJSONResponse(stats, headers=etag_headers(etag))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{voucher_id}", response_model=WarehouseVoucher)
-async def get_voucher(voucher_id: str):
+async def get_voucher(
+    voucher_id: str,
+    request: Request,
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
+):
     """Lấy chi tiết phiếu theo ID"""
     voucher = await service.get_by_id(voucher_id)
     if not voucher:
         raise HTTPException(status_code=404, detail="Không tìm thấy phiếu")
-    return voucher
+    etag = voucher_etag(voucher.updated_at)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return model_response(WarehouseVoucher, voucher, headers=etag_headers(etag))
+
+
+@router.get("/{voucher_id}/lines", response_model=WarehouseVoucherLinePage)
+async def get_voucher_lines(
+    voucher_id: str,
+    offset: int = Query(0, ge=0, description="Vị trí dòng bắt đầu (0 = dòng đầu tiên)"),
+    limit: int = Query(200, ge=1, le=1000, description="Số dòng tối đa"),
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
+):
+    """
+    Lấy dòng phiếu theo trang
+
+    Phiếu lớn (nhiều hơn `VOUCHER_LINE_CHUNK_THRESHOLD` dòng) lưu dòng tách riêng nên
+    `GET /{voucher_id}` trả về `lines` rỗng kèm `line_count`; dùng endpoint này để đọc dòng.
+    """
+    page = await service.get_lines(voucher_id, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy phiếu")
+    return model_response(WarehouseVoucherLinePage, page)
+
+
+@router.put("/{voucher_id}/lines/{line_no}", response_model=WarehouseVoucher)
+async def update_voucher_line(
+    voucher_id: str,
+    line_no: int,
+    line: WarehouseVoucherLine,
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
+):
+    """
+    Sửa một dòng phiếu (chỉ phiếu DRAFT)
+
+    - **line_no**: thứ tự dòng (bắt đầu từ 1)
+    - Phiếu lớn chỉ ghi lại khối dòng chứa dòng này; tổng số lượng / thành tiền được cập nhật
+    """
+    voucher = await service.update_line(voucher_id, line_no, line)
+    if not voucher:
+        raise HTTPException(status_code=400, detail="Không thể sửa dòng phiếu (phiếu không tồn tại, đã ghi sổ hoặc sai số dòng)")
+    return model_response(WarehouseVoucher, voucher)
 
 
 @router.put("/{voucher_id}", response_model=WarehouseVoucher)
-async def update_voucher(voucher_id: str, data: WarehouseVoucherUpdate):
+async def update_voucher(
+    voucher_id: str,
+    data: WarehouseVoucherUpdate,
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
+):
     """
     Cập nhật phiếu (chỉ phiếu DRAFT)
     """
     voucher = await service.update(voucher_id, data)
     if not voucher:
         raise HTTPException(status_code=400, detail="Không thể cập nhật phiếu (phiếu không tồn tại hoặc đã ghi sổ)")
-    return voucher
+    return model_response(WarehouseVoucher, voucher)
 
 
 @router.post("/{voucher_id}/post", response_model=WarehouseVoucher)
-async def post_voucher(voucher_id: str):
+async def post_voucher(
+    voucher_id: str,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
+):
     """
     Ghi sổ phiếu (chuyển từ DRAFT sang POSTED)
+
+    Cập nhật tồn kho; phiếu xuất làm tồn kho âm sẽ bị từ chối (400).
+    Đơn giá / thành tiền các dòng phiếu xuất được tính lại theo giá vốn (COSTING_METHOD).
     """
-    voucher = await service.post(voucher_id)
+    try:
+        voucher = await service.post(voucher_id, idempotency_key=idempotency_key)
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     if not voucher:
         raise HTTPException(status_code=400, detail="Không thể ghi sổ phiếu")
-    return voucher
+    return model_response(WarehouseVoucher, voucher)
 
 
 @router.post("/{voucher_id}/cancel", response_model=WarehouseVoucher)
-async def cancel_voucher(voucher_id: str, reason: str = Query(..., min_length=10, description="Lý do hủy (>= 10 ký tự)")):
+async def cancel_voucher(
+    voucher_id: str,
+    reason: str = Query(..., min_length=10, description="Lý do hủy (>= 10 ký tự)"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)
+):
     """
     Hủy phiếu
+
+    Phiếu đã ghi sổ được hoàn lại tồn kho; hủy phiếu nhập làm tồn kho âm sẽ bị từ chối (400)
     """
-    voucher = await service.cancel(voucher_id, reason)
+    try:
+        voucher = await service.cancel(voucher_id, reason, idempotency_key=idempotency_key)
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     if not voucher:
         raise HTTPException(status_code=400, detail="Không thể hủy phiếu")
-    return voucher
+    return model_response(WarehouseVoucher, voucher)
 
 
 @router.delete("/{voucher_id}")
-async def delete_voucher(voucher_id: str):
+async def delete_voucher(voucher_id: str, service: WarehouseVoucherService = Depends(get_warehouse_voucher_service)):
     """
     Xóa phiếu (chỉ phiếu DRAFT)
     """
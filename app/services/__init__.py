@@ -1,4 +1,47 @@
 from .cash_voucher_service import CashVoucherService
 from .warehouse_voucher_service import WarehouseVoucherService
+from .voucher_number_allocator import VoucherNumberAllocator, get_voucher_number_allocator
+from .voucher_cache import VoucherCache, get_voucher_cache
+from .inventory_service import InventoryService, InsufficientStockError
+from .ledger_service import LedgerService
+from .report_service import ReportService
+from .voucher_events import VoucherEventHub, get_voucher_event_hub
+from .voucher_search import VoucherSearchService
+from .idempotency import IdempotencyStore, IdempotencyKeyConflict
+from .providers import warm_up_services
+from .voucher_versions import VoucherVersions, get_voucher_versions, close_voucher_versions, get_voucher_versions_stats
+from .voucher_replica import (
+    VoucherReplica,
+    get_voucher_replica,
+    start_voucher_replicas,
+    close_voucher_replicas,
+    get_voucher_replica_stats
+)
 
-__all__ = ["CashVoucherService", "WarehouseVoucherService"]
+__all__ = [
+    "CashVoucherService",
+    "WarehouseVoucherService",
+    "VoucherNumberAllocator",
+    "get_voucher_number_allocator",
+    "VoucherCache",
+    "get_voucher_cache",
+    "InventoryService",
+    "InsufficientStockError",
+    "LedgerService",
+    "ReportService",
+    "VoucherEventHub",
+    "get_voucher_event_hub",
+    "VoucherSearchService",
+    "IdempotencyStore",
+    "IdempotencyKeyConflict",
+    "warm_up_services",
+    "VoucherVersions",
+    "get_voucher_versions",
+    "close_voucher_versions",
+    "get_voucher_versions_stats",
+    "VoucherReplica",
+    "get_voucher_replica",
+    "start_voucher_replicas",
+    "close_voucher_replicas",
+    "get_voucher_replica_stats",
+]
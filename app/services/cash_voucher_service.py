@@ -1,14 +1,30 @@
 """
 Cash Voucher Service - Phiếu Thu/Chi
 """
+from collections import Counter
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, Callable, List, Optional, Sequence, Tuple, Union
 from google.cloud.firestore import FieldFilter
+from pydantic import ValidationError
+import asyncio
 import uuid
 
-from ..config.firebase import get_db
+from ..config.database import commit_batch, get_db, run_transaction
+from ..config.executor import run_db
+from ..config.metrics import record_datastore
+from .voucher_number_allocator import get_voucher_number_allocator
+from .pagination import apply_order_and_cursor, projection_fields, split_page
+from .stats_rollup import DailyStatsRollup, MAX_BATCH_WRITES, merge_deltas
+from .voucher_cache import get_voucher_cache
+from .ledger_service import LedgerService
+from .voucher_events import VoucherChangeLog
+from .voucher_replica import get_voucher_replica
+from .voucher_versions import get_voucher_versions
+from .voucher_search import VoucherSearchIndex
+from .idempotency import IdempotencyStore, IdempotentRequest, fingerprint
 from ..models.cash_voucher import (
     CashVoucher,
+    CashVoucherSummary,
     CashVoucherCreate,
     CashVoucherUpdate,
     CashVoucherLine,
@@ -19,31 +35,171 @@ from ..models.cash_voucher import (
 
 class CashVoucherService:
     COLLECTION = "cash_vouchers"
-    COUNTER_COLLECTION = "counters"
+    STATS_COLLECTION = "cash_voucher_daily_stats"
+    LEDGER_SOURCE = "cash"
+    EVENT_SOURCE = "cash"
+    SEARCH_SOURCE = "cash"
+    SEARCH_TEXT_FIELDS = ("voucher_no", "related_object_code", "related_object_name", "reason", "description", "receiver_name")
+    SEARCH_LINE_FIELDS = ("description",)
+    STATS_AMOUNT_FIELDS = ("grand_total", "total_amount", "total_tax_amount")
+    EXPORT_HEADER_FIELDS = (
+        "id", "voucher_no", "voucher_type", "voucher_date", "status",
+        "related_object_type", "related_object_code", "related_object_name", "reason",
+        "payment_method", "cash_account_code", "total_amount", "total_tax_amount", "grand_total",
+        "created_at", "posted_at"
+    )
+    EXPORT_LINE_FIELDS = (
+        "line_no", "description", "account_code", "account_name", "amount", "tax_code", "tax_rate", "tax_amount"
+    )
 
     def __init__(self):
         self.db = get_db()
+        self.allocator = get_voucher_number_allocator()
+        self.cache = get_voucher_cache()
+        self.rollup = DailyStatsRollup(self.db, self.STATS_COLLECTION, self.STATS_AMOUNT_FIELDS)
+        self.ledger = LedgerService()
+        self.changes = VoucherChangeLog(self.db)
+        self.replica = get_voucher_replica(self.COLLECTION)
+        self.versions = get_voucher_versions(self.COLLECTION)
+        self.idempotency = IdempotencyStore(self.db)
+        self.search = VoucherSearchIndex(
+            self.db, self.SEARCH_SOURCE, self.SEARCH_TEXT_FIELDS, self.SEARCH_LINE_FIELDS, CashVoucherSummary.model_fields
+        )
 
     def _get_collection(self):
         return self.db.collection(self.COLLECTION)
 
-    def _generate_voucher_no(self, voucher_type: VoucherType) -> str:
-        """Generate voucher number: PT202501001 or PC202501001"""
-        prefix = "PT" if voucher_type == VoucherType.RECEIPT else "PC"
-        year = datetime.now().year
-        counter_key = f"{prefix}{year}"
-
-        counter_ref = self.db.collection(self.COUNTER_COLLECTION).document(counter_key)
-        counter_doc = counter_ref.get()
-
-        if counter_doc.exists:
-            current = counter_doc.to_dict().get("value", 0)
-            new_value = current + 1
+    @staticmethod
+    def _stream_dicts(query) -> List[dict]:
+        """Stream query results as dicts (blocking - run via run_db)"""
+        docs = [doc.to_dict() for doc in query.stream()]
+        record_datastore(streamed=len(docs))
+        return docs
+
+    def _commit_create(self, voucher_id: str, voucher_data: dict, idempotent: Optional[IdempotentRequest] = None):
+        """Write a new voucher and its derived documents in one batch (blocking)"""
+        batch = self.db.batch()
+        batch.set(self._get_collection().document(voucher_id), voucher_data)
+        self._apply_side_effects(batch, None, voucher_data)
+        if idempotent is not None:
+            self.idempotency.record(batch, idempotent, voucher_data)
+        commit_batch(batch)
+        self._replicate(voucher_id, voucher_data)
+
+    def _commit_create_batch(self, documents: List[dict], records: Sequence[Tuple[IdempotentRequest, dict]] = ()):
+        """
+        Write many new vouchers with aggregated rollup increments in one WriteBatch (blocking).
+        records: (Idempotency-Key request, item result) stored with the vouchers.
+        """
+        batch = self.db.batch()
+        deltas: dict = {}
+        for voucher_data in documents:
+            batch.set(self._get_collection().document(voucher_data["id"]), voucher_data)
+            merge_deltas(deltas, self.rollup.deltas(None, voucher_data))
+        self.rollup.apply(batch, deltas)
+        self.changes.record(batch, self.EVENT_SOURCE, "created", documents)
+        self.versions.bump(batch)
+        for voucher_data in documents:
+            self.search.apply(batch, None, voucher_data)
+        for request, result in records:
+            self.idempotency.record(batch, request, result)
+        commit_batch(batch)
+        for voucher_data in documents:
+            self._replicate(voucher_data["id"], voucher_data)
+
+    def _chunk_for_batch(self, documents: List[Tuple[int, dict]], extra_writes: int = 0) -> List[List[Tuple[int, dict]]]:
+        """
+        Split documents so voucher, search document and extra_writes per voucher
+        + rollup day writes + the change and version documents fit in one WriteBatch
+        """
+        chunks, chunk, days = [], [], set()
+        for item in documents:
+            day = self.rollup.day_key(item[1]["voucher_date"])
+            if chunk and (2 + extra_writes) * (len(chunk) + 1) + len(days | {day}) > MAX_BATCH_WRITES - 2:
+                chunks.append(chunk)
+                chunk, days = [], set()
+            chunk.append(item)
+            days.add(day)
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _apply_side_effects(self, writer, before: Optional[dict], after: Optional[dict]):
+        """Derived documents written together with a voucher change (WriteBatch or Transaction)"""
+        self.rollup.apply(writer, self.rollup.deltas(before, after))
+        self.ledger.apply(writer, self.LEDGER_SOURCE, before, after)
+        self.changes.apply(writer, self.EVENT_SOURCE, before, after)
+        self.search.apply(writer, before, after)
+        self.versions.bump(writer)
+
+    def _replicate(self, voucher_id: str, after: Optional[dict]):
+        """Apply a committed write to this worker's in-memory replica and version counter (after=None: deleted)"""
+        self.versions.mark_written()
+        if self.replica is None:
+            return
+        if after is None:
+            self.replica.remove(voucher_id)
         else:
-            new_value = 1
+            self.replica.upsert(after)
 
-        counter_ref.set({"value": new_value})
-        return f"{prefix}{year}{str(new_value).zfill(5)}"
+    def _run_transition(
+        self,
+        voucher_id: str,
+        build_changes: Callable[[dict], Optional[dict]],
+        delete: bool = False,
+        idempotent: Optional[IdempotentRequest] = None
+    ) -> Tuple[Optional[dict], bool]:
+        """
+        Read the voucher, check the status precondition and write the change in
+        one transaction (blocking). build_changes(current) returns the fields to
+        update, or None when the precondition fails.
+
+        Returns (data, written): the voucher data after the change (before it,
+        for delete), or None if the voucher does not exist or the precondition
+        failed; written is False when the data is the stored result of an
+        earlier request with the same Idempotency-Key (nothing was written).
+        """
+        ref = self._get_collection().document(voucher_id)
+
+        def _transition(transaction):
+            if idempotent is not None:
+                # Request trùng chạy song song đã ghi xong trước
+                stored = self.idempotency.lookup(idempotent, transaction)
+                if stored is not None:
+                    return stored, False
+            snapshot = ref.get(transaction=transaction)
+            record_datastore(reads=1)
+            if not snapshot.exists:
+                return None, False
+
+            before = snapshot.to_dict()
+            changes = build_changes(before)
+            if changes is None:
+                return None, False
+
+            after = None if delete else {**before, **changes}
+            self._apply_side_effects(transaction, before, after)
+            if delete:
+                transaction.delete(ref)
+                return before, True
+            transaction.update(ref, changes)
+            if idempotent is not None:
+                self.idempotency.record(transaction, idempotent, after, overwrite=True)
+            return after, True
+
+        result, written = run_transaction(_transition)
+        if written:
+            # Kết quả lưu theo Idempotency-Key là bản cũ: không đẩy vào bản sao
+            self._replicate(voucher_id, None if delete else result)
+        return result, written
+
+    @staticmethod
+    def _voucher_prefix(voucher_type: VoucherType) -> str:
+        return "PT" if voucher_type == VoucherType.RECEIPT else "PC"
+
+    async def _generate_voucher_no(self, voucher_type: VoucherType) -> str:
+        """Generate voucher number: PT202500001 or PC202500001"""
+        return await self.allocator.next_number(self._voucher_prefix(voucher_type))
 
     def _calculate_totals(self, lines: List[CashVoucherLine]) -> dict:
         """Calculate total amounts from lines"""
@@ -62,12 +218,9 @@ class CashVoucherService:
         # Simplified implementation
         return f"{int(num):,} đồng".replace(",", ".")
 
-    async def create(self, data: CashVoucherCreate, user_id: str = "admin") -> CashVoucher:
-        """Create new cash voucher"""
-        voucher_id = str(uuid.uuid4())
-        voucher_no = self._generate_voucher_no(data.voucher_type)
+    def _build_voucher_data(self, data: CashVoucherCreate, voucher_id: str, voucher_no: str, user_id: str, now: datetime) -> dict:
+        """Document data for a new voucher"""
         totals = self._calculate_totals(data.lines)
-        now = datetime.now()
 
         # Prepare lines with IDs
         lines = []
@@ -77,7 +230,7 @@ class CashVoucherService:
             line_dict["line_no"] = i + 1
             lines.append(line_dict)
 
-        voucher_data = {
+        return {
             "id": voucher_id,
             "voucher_type": data.voucher_type.value,
             "voucher_no": voucher_no,
@@ -106,64 +259,220 @@ class CashVoucherService:
             "updated_at": now
         }
 
-        self._get_collection().document(voucher_id).set(voucher_data)
-        return CashVoucher(**voucher_data)
+    async def create(self, data: CashVoucherCreate, user_id: str = "admin", idempotency_key: Optional[str] = None) -> CashVoucher:
+        """Create new cash voucher (a retry with the same Idempotency-Key returns the first result)"""
+        idempotent = None
+        if idempotency_key:
+            idempotent = IdempotentRequest(f"{self.COLLECTION}:create", idempotency_key, fingerprint(data.model_dump(mode="json")))
+            stored = await self._stored_result(idempotent)
+            if stored is not None:
+                return CashVoucher(**stored)
+
+        voucher_id = str(uuid.uuid4())
+        voucher_no = await self._generate_voucher_no(data.voucher_type)
+        voucher_data = self._build_voucher_data(data, voucher_id, voucher_no, user_id, datetime.now())
+
+        try:
+            await run_db(self._commit_create, voucher_id, voucher_data, idempotent)
+        except Exception:
+            await self.allocator.report_unused(voucher_no, "create_failed")
+            # Request trùng chạy song song đã tạo phiếu trước
+            stored = await self._stored_result(idempotent)
+            if stored is not None:
+                return CashVoucher(**stored)
+            raise
+
+        voucher = CashVoucher(**voucher_data)
+        self.cache.set(self.COLLECTION, voucher)
+        return voucher
+
+    async def create_batch(self, items: List[dict], user_id: str = "admin", idempotency_key: Optional[str] = None) -> List[dict]:
+        """
+        Create many vouchers at once: validate every item, reserve one contiguous
+        range of voucher numbers per prefix, then write with chunked WriteBatch
+        commits. Returns one result per item, in input order.
+
+        With an Idempotency-Key each item's result is stored with its voucher, so a
+        retry only creates the items that were not written.
+        """
+        results: List[Optional[dict]] = [None] * len(items)
+        valid: List[Tuple[int, CashVoucherCreate]] = []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, CashVoucherCreate.model_validate(item)))
+            except ValidationError as e:
+                results[index] = {
+                    "index": index,
+                    "success": False,
+                    "error": e.errors(include_url=False, include_context=False, include_input=False)
+                }
+
+        requests = {}
+        if idempotency_key:
+            requests = {
+                index: IdempotentRequest(f"{self.COLLECTION}:batch", f"{idempotency_key}#{index}", fingerprint(items[index]))
+                for index, _ in valid
+            }
+            stored = await run_db(self.idempotency.lookup_many, list(requests.values()))
+            for index, result in zip(list(requests), stored):
+                if result is not None:
+                    results[index] = result
+            valid = [(index, data) for index, data in valid if results[index] is None]
+
+        # One counter transaction per prefix for the whole batch
+        numbers = {}
+        for prefix, count in Counter(self._voucher_prefix(data.voucher_type) for _, data in valid).items():
+            year, first, last = await self.allocator.reserve(prefix, count)
+            numbers[prefix] = iter([self.allocator.format_number(prefix, year, value) for value in range(first, last + 1)])
+
+        now = datetime.now()
+        documents = []
+        for index, data in valid:
+            voucher_id = str(uuid.uuid4())
+            voucher_no = next(numbers[self._voucher_prefix(data.voucher_type)])
+            documents.append((index, self._build_voucher_data(data, voucher_id, voucher_no, user_id, now)))
+
+        async def _commit_chunk(chunk: List[Tuple[int, dict]]):
+            created = {
+                index: {"index": index, "success": True, "id": voucher_data["id"], "voucher_no": voucher_data["voucher_no"]}
+                for index, voucher_data in chunk
+            }
+            records = [(requests[index], result) for index, result in created.items() if index in requests]
+            try:
+                await run_db(self._commit_create_batch, [voucher_data for _, voucher_data in chunk], records)
+            except Exception as e:
+                await self.allocator.report_unused_numbers([voucher_data["voucher_no"] for _, voucher_data in chunk], "batch_failed")
+                for index, _ in chunk:
+                    results[index] = {"index": index, "success": False, "error": str(e)}
+                return
+            for index, result in created.items():
+                results[index] = result
+
+        extra_writes = 1 if requests else 0
+        await asyncio.gather(*[_commit_chunk(chunk) for chunk in self._chunk_for_batch(documents, extra_writes)])
+        return results
 
     async def get_by_id(self, voucher_id: str) -> Optional[CashVoucher]:
-        """Get voucher by ID"""
-        doc = self._get_collection().document(voucher_id).get()
+        """Get voucher by ID (read-through cache)"""
+        voucher = self.cache.get(self.COLLECTION, voucher_id, CashVoucher)
+        if voucher is not None:
+            return voucher
+
+        doc = await run_db(self._get_collection().document(voucher_id).get)
+        record_datastore(reads=1)
         if doc.exists:
-            return CashVoucher(**doc.to_dict())
+            voucher = CashVoucher(**doc.to_dict())
+            self.cache.set(self.COLLECTION, voucher)
+            return voucher
         return None
 
-    async def get_all(
+    def _build_list_query(
         self,
         voucher_type: Optional[VoucherType] = None,
         status: Optional[VoucherStatus] = None,
         from_date: Optional[datetime] = None,
         to_date: Optional[datetime] = None,
-        limit: int = 100
-    ) -> List[CashVoucher]:
-        """Get all vouchers with filters - simple query to avoid composite index"""
-        # Use simple query with only one filter to avoid composite index requirement
+        cursor: Optional[str] = None
+    ):
+        """All filters and voucher_date ordering pushed to Firestore (see firestore.indexes.json)"""
         query = self._get_collection()
 
-        # Only apply voucher_type filter in Firestore (most common filter)
         if voucher_type:
             query = query.where(filter=FieldFilter("voucher_type", "==", voucher_type.value))
+        if status:
+            query = query.where(filter=FieldFilter("status", "==", status.value))
+        if from_date:
+            query = query.where(filter=FieldFilter("voucher_date", ">=", from_date))
+        if to_date:
+            query = query.where(filter=FieldFilter("voucher_date", "<=", to_date))
 
-        # Get all documents (limited)
-        docs = query.limit(limit * 2).stream()  # Get more to filter client-side
-
-        # Convert to list and filter in memory
-        vouchers = []
-        for doc in docs:
-            data = doc.to_dict()
-            voucher = CashVoucher(**data)
+        return apply_order_and_cursor(query, cursor)
 
-            # Apply other filters in memory
-            if status and voucher.status != status:
-                continue
-            if from_date and voucher.voucher_date < from_date:
-                continue
-            if to_date and voucher.voucher_date > to_date:
-                continue
+    async def get_page(
+        self,
+        voucher_type: Optional[VoucherType] = None,
+        status: Optional[VoucherStatus] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[CashVoucher], Optional[str]]:
+        """Get one page of vouchers (newest first) and the cursor of the next page"""
+        # Fetch one extra document to know whether there is a next page
+        docs = self.replica.query(
+            from_date, to_date, cursor, limit + 1, voucher_type=voucher_type, status=status
+        ) if self.replica else None
+        if docs is None:
+            query = self._build_list_query(voucher_type, status, from_date, to_date, cursor)
+            docs = await run_db(self._stream_dicts, query.limit(limit + 1))
+        docs, next_cursor = split_page(docs, limit)
+        return [CashVoucher(**data) for data in docs], next_cursor
+
+    async def get_summary_page(
+        self,
+        voucher_type: Optional[VoucherType] = None,
+        status: Optional[VoucherStatus] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Tuple[List[Union[CashVoucherSummary, dict]], Optional[str]]:
+        """
+        One page of voucher headers, read with a Firestore field mask (lines are not downloaded)
+
+        fields=None returns CashVoucherSummary models; an explicit field list returns dicts
+        with only those fields (plus id and voucher_date, used by the cursor).
+        """
+        if fields is not None:
+            selected = projection_fields(fields, CashVoucher.model_fields)
+        else:
+            selected = list(CashVoucherSummary.model_fields)
+        docs = self.replica.query(
+            from_date, to_date, cursor, limit + 1, selected, voucher_type=voucher_type, status=status
+        ) if self.replica else None
+        if docs is None:
+            query = self._build_list_query(voucher_type, status, from_date, to_date, cursor).select(selected)
+            docs = await run_db(self._stream_dicts, query.limit(limit + 1))
+
+        docs, next_cursor = split_page(docs, limit)
+        if fields is not None:
+            return docs, next_cursor
+        return [CashVoucherSummary(**data) for data in docs], next_cursor
 
-            vouchers.append(voucher)
+    async def get_all(
+        self,
+        voucher_type: Optional[VoucherType] = None,
+        status: Optional[VoucherStatus] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: int = 100
+    ) -> List[CashVoucher]:
+        """Get the first page of vouchers with filters"""
+        vouchers, _ = await self.get_page(voucher_type, status, from_date, to_date, limit)
+        return vouchers
 
-            if len(vouchers) >= limit:
+    async def iter_pages(
+        self,
+        voucher_type: Optional[VoucherType] = None,
+        status: Optional[VoucherStatus] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        page_size: int = 500
+    ) -> AsyncIterator[List[CashVoucher]]:
+        """Walk every matching voucher page by page with a Firestore cursor (constant memory)"""
+        cursor = None
+        while True:
+            vouchers, cursor = await self.get_page(
+                voucher_type, status, from_date, to_date, limit=page_size, cursor=cursor
+            )
+            if vouchers:
+                yield vouchers
+            if not cursor:
                 break
 
-        # Sort by date descending
-        vouchers.sort(key=lambda v: v.voucher_date, reverse=True)
-        return vouchers[:limit]
-
     async def update(self, voucher_id: str, data: CashVoucherUpdate, user_id: str = "admin") -> Optional[CashVoucher]:
         """Update voucher (only DRAFT status)"""
-        voucher = await self.get_by_id(voucher_id)
-        if not voucher or voucher.status != VoucherStatus.DRAFT:
-            return None
-
         update_data = data.model_dump(exclude_unset=True)
         update_data["updated_at"] = datetime.now()
 
@@ -173,58 +482,130 @@ class CashVoucherService:
             update_data.update(totals)
             update_data["amount_in_words"] = self._number_to_words(totals["grand_total"])
 
-        self._get_collection().document(voucher_id).update(update_data)
-        return await self.get_by_id(voucher_id)
+        def _changes(current: dict) -> Optional[dict]:
+            if current.get("status") != VoucherStatus.DRAFT.value:
+                return None
+            return update_data
 
-    async def post(self, voucher_id: str, user_id: str = "admin") -> Optional[CashVoucher]:
-        """Post voucher (change status to POSTED)"""
-        voucher = await self.get_by_id(voucher_id)
-        if not voucher or voucher.status != VoucherStatus.DRAFT:
-            return None
+        return await self._transition(voucher_id, _changes)
 
+    async def post(self, voucher_id: str, user_id: str = "admin", idempotency_key: Optional[str] = None) -> Optional[CashVoucher]:
+        """Post voucher (change status to POSTED)"""
         now = datetime.now()
-        self._get_collection().document(voucher_id).update({
-            "status": VoucherStatus.POSTED.value,
-            "posting_date": now,
-            "posted_at": now,
-            "posted_by": user_id
-        })
-        return await self.get_by_id(voucher_id)
-
-    async def cancel(self, voucher_id: str, reason: str, user_id: str = "admin") -> Optional[CashVoucher]:
-        """Cancel voucher"""
-        voucher = await self.get_by_id(voucher_id)
-        if not voucher or voucher.status == VoucherStatus.CANCELLED:
-            return None
 
+        def _changes(current: dict) -> Optional[dict]:
+            if current.get("status") != VoucherStatus.DRAFT.value:
+                return None
+            return {
+                "status": VoucherStatus.POSTED.value,
+                "posting_date": now,
+                "posted_at": now,
+                "posted_by": user_id,
+                "updated_at": now
+            }
+
+        idempotent = None
+        if idempotency_key:
+            idempotent = IdempotentRequest(f"{self.COLLECTION}:post", idempotency_key, fingerprint(voucher_id))
+        return await self._transition(voucher_id, _changes, idempotent)
+
+    async def cancel(
+        self,
+        voucher_id: str,
+        reason: str,
+        user_id: str = "admin",
+        idempotency_key: Optional[str] = None
+    ) -> Optional[CashVoucher]:
+        """Cancel voucher"""
         now = datetime.now()
-        self._get_collection().document(voucher_id).update({
-            "status": VoucherStatus.CANCELLED.value,
-            "cancelled_at": now,
-            "cancelled_by": user_id,
-            "cancel_reason": reason
-        })
-        return await self.get_by_id(voucher_id)
+
+        def _changes(current: dict) -> Optional[dict]:
+            if current.get("status") == VoucherStatus.CANCELLED.value:
+                return None
+            return {
+                "status": VoucherStatus.CANCELLED.value,
+                "cancelled_at": now,
+                "cancelled_by": user_id,
+                "cancel_reason": reason,
+                "updated_at": now
+            }
+
+        idempotent = None
+        if idempotency_key:
+            idempotent = IdempotentRequest(f"{self.COLLECTION}:cancel", idempotency_key, fingerprint(voucher_id, reason))
+        return await self._transition(voucher_id, _changes, idempotent)
 
     async def delete(self, voucher_id: str) -> bool:
         """Delete voucher (only DRAFT status)"""
-        voucher = await self.get_by_id(voucher_id)
-        if not voucher or voucher.status != VoucherStatus.DRAFT:
+        def _changes(current: dict) -> Optional[dict]:
+            if current.get("status") != VoucherStatus.DRAFT.value:
+                return None
+            return {}
+
+        deleted, _ = await run_db(self._run_transition, voucher_id, _changes, True)
+        if deleted is None:
             return False
 
-        self._get_collection().document(voucher_id).delete()
+        self.cache.invalidate(self.COLLECTION, voucher_id)
         return True
 
-    async def get_statistics(self, from_date: Optional[datetime] = None, to_date: Optional[datetime] = None) -> dict:
-        """Get voucher statistics"""
-        query = self._get_collection()
+    async def _stored_result(self, idempotent: Optional[IdempotentRequest]) -> Optional[dict]:
+        """Result of an earlier request with the same Idempotency-Key (None without a key)"""
+        if idempotent is None:
+            return None
+        return await run_db(self.idempotency.lookup, idempotent)
 
-        if from_date:
-            query = query.where(filter=FieldFilter("voucher_date", ">=", from_date))
-        if to_date:
-            query = query.where(filter=FieldFilter("voucher_date", "<=", to_date))
+    async def _transition(
+        self,
+        voucher_id: str,
+        build_changes: Callable[[dict], Optional[dict]],
+        idempotent: Optional[IdempotentRequest] = None
+    ) -> Optional[CashVoucher]:
+        """Run a transition and build the response from the transaction result (no re-read)"""
+        stored = await self._stored_result(idempotent)
+        if stored is not None:
+            return CashVoucher(**stored)
+
+        after, written = await run_db(self._run_transition, voucher_id, build_changes, False, idempotent)
+        if after is None:
+            return None
 
-        docs = list(query.stream())
+        voucher = CashVoucher(**after)
+        if written:
+            self.cache.set(self.COLLECTION, voucher)
+        return voucher
+
+    async def _load_stat_buckets(self, from_date: Optional[datetime], to_date: Optional[datetime]) -> dict:
+        """
+        In-memory replica when it covers the range, otherwise daily rollups for fully
+        covered days + raw vouchers for partial days at the edges
+        """
+        buckets = self.replica.buckets(self.rollup, from_date, to_date) if self.replica else None
+        if buckets is not None:
+            return buckets
+
+        full_days, partial_ranges = self.rollup.split_range(from_date, to_date)
+
+        buckets = {}
+        if full_days:
+            buckets = await run_db(self.rollup.fetch_buckets, *full_days)
+
+        fields = ["voucher_date", "voucher_type", "status", *self.STATS_AMOUNT_FIELDS]
+        for start, end in partial_ranges:
+            query = self._get_collection()
+            query = query.where(filter=FieldFilter("voucher_date", ">=", start))
+            query = query.where(filter=FieldFilter("voucher_date", "<=", end))
+            for data in await run_db(self._stream_dicts, query.select(fields)):
+                self.rollup.accumulate(buckets, data)
+        return buckets
+
+    async def get_version(self) -> int:
+        """Change counter of the collection, for list / statistics ETags"""
+        return await self.versions.current()
+
+    async def get_statistics(self, from_date: Optional[datetime] = None, to_date: Optional[datetime] = None) -> dict:
+        """Get voucher statistics"""
+        buckets = await self._load_stat_buckets(from_date, to_date)
 
         stats = {
             "total_vouchers": 0,
@@ -240,27 +621,35 @@ class CashVoucherService:
             }
         }
 
-        for doc in docs:
-            data = doc.to_dict()
-            stats["total_vouchers"] += 1
-
-            # Count by status
-            status = data.get("status")
-            if status == VoucherStatus.DRAFT.value:
-                stats["by_status"]["draft"] += 1
-            elif status == VoucherStatus.POSTED.value:
-                stats["by_status"]["posted"] += 1
-            elif status == VoucherStatus.CANCELLED.value:
-                stats["by_status"]["cancelled"] += 1
-
-            # Only count amounts for non-cancelled vouchers
-            if status != VoucherStatus.CANCELLED.value:
-                if data.get("voucher_type") == VoucherType.RECEIPT.value:
-                    stats["receipt_count"] += 1
-                    stats["total_receipt_amount"] += data.get("grand_total", 0)
-                else:
-                    stats["payment_count"] += 1
-                    stats["total_payment_amount"] += data.get("grand_total", 0)
+        for voucher_type, statuses in buckets.items():
+            for status, values in statuses.items():
+                count = int(values.get("count", 0))
+                stats["total_vouchers"] += count
+
+                # Count by status
+                if status == VoucherStatus.DRAFT.value:
+                    stats["by_status"]["draft"] += count
+                elif status == VoucherStatus.POSTED.value:
+                    stats["by_status"]["posted"] += count
+                elif status == VoucherStatus.CANCELLED.value:
+                    stats["by_status"]["cancelled"] += count
+
+                # Only count amounts for non-cancelled vouchers
+                if status != VoucherStatus.CANCELLED.value:
+                    if voucher_type == VoucherType.RECEIPT.value:
+                        stats["receipt_count"] += count
+                        stats["total_receipt_amount"] += values.get("grand_total", 0)
+                    else:
+                        stats["payment_count"] += count
+                        stats["total_payment_amount"] += values.get("grand_total", 0)
 
         stats["net_cash_flow"] = stats["total_receipt_amount"] - stats["total_payment_amount"]
         return stats
+
+    async def rebuild_statistics(self) -> dict:
+        """Regenerate daily statistics rollups from raw vouchers"""
+        return await run_db(self.rollup.rebuild, self._get_collection())
+
+    async def rebuild_search_index(self) -> dict:
+        """Regenerate the search documents from raw vouchers"""
+        return await run_db(self.search.rebuild, self._get_collection())
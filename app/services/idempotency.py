@@ -0,0 +1,124 @@
+"""
+Idempotency Keys - chống tạo trùng / ghi sổ trùng khi client gửi lại request
+
+Client gửi header `Idempotency-Key` (chuỗi ngẫu nhiên, giữ nguyên khi gửi lại). Kết quả của
+lệnh ghi được lưu ở `idempotency_keys/<sha256(scope, key)>` trong cùng batch / transaction với
+phiếu (create() - hai request trùng chạy song song thì một bên thất bại). Request gửi lại tìm
+thấy bản ghi và trả kết quả cũ, không cấp số phiếu và không ghi gì thêm.
+
+- Cùng key nhưng nội dung request khác -> IdempotencyKeyConflict (HTTP 422)
+- Bản ghi có `expire_at` (IDEMPOTENCY_KEY_TTL_HOURS) để đặt TTL policy trên Firestore (SQLite:
+  manage.py purge-expired). Bản ghi hết hạn mà chưa bị xóa được coi như không có: lookup ngoài
+  transaction xóa nó (trong transaction) để create() ghi lại được, còn transaction ghi đè bằng set()
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+from ..config.database import as_utc, run_transaction
+from ..config.metrics import record_datastore
+from ..config.settings import settings
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+
+
+class IdempotencyKeyConflict(Exception):
+    """The Idempotency-Key was already used for a different request"""
+
+
+def fingerprint(*parts) -> str:
+    """Hash of the request content a key is bound to"""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IdempotentRequest:
+    """One keyed request: scope (collection:operation), client key and request fingerprint"""
+
+    def __init__(self, scope: str, key: str, request_fingerprint: str):
+        self.scope = scope
+        self.key = key
+        self.fingerprint = request_fingerprint
+
+    @property
+    def document_id(self) -> str:
+        return hashlib.sha256(f"{self.scope}\n{self.key}".encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+
+    def __init__(self, db):
+        self.db = db
+
+    def _get_collection(self):
+        return self.db.collection(IDEMPOTENCY_COLLECTION)
+
+    def _ref(self, request: IdempotentRequest):
+        return self._get_collection().document(request.document_id)
+
+    @staticmethod
+    def _expired(snapshot) -> bool:
+        expire_at = (snapshot.to_dict() or {}).get("expire_at") if snapshot.exists else None
+        # Ghi và so sánh cùng giờ datetime.now()
+        return expire_at is not None and as_utc(expire_at) < as_utc(datetime.now())
+
+    @classmethod
+    def _result(cls, request: IdempotentRequest, snapshot) -> Optional[dict]:
+        if not snapshot.exists or cls._expired(snapshot):
+            return None
+        data = snapshot.to_dict() or {}
+        if data.get("fingerprint") != request.fingerprint:
+            raise IdempotencyKeyConflict("Idempotency-Key đã được dùng cho một request khác")
+        return data.get("result")
+
+    def lookup(self, request: IdempotentRequest, transaction=None) -> Optional[dict]:
+        """Stored result of an earlier request with this key, None if there is none (blocking)"""
+        snapshot = self._ref(request).get(transaction=transaction)
+        record_datastore(reads=1)
+        if transaction is None and self._expired(snapshot):
+            self._delete_expired(request)
+        return self._result(request, snapshot)
+
+    def lookup_many(self, requests: Sequence[IdempotentRequest]) -> List[Optional[dict]]:
+        """lookup() for many keys with one get_all (blocking)"""
+        if not requests:
+            return []
+        refs = [self._ref(request) for request in requests]
+        found = {snapshot.id: snapshot for snapshot in self.db.get_all(refs)}
+        record_datastore(reads=len(refs))
+        for request, ref in zip(requests, refs):
+            if ref.id in found and self._expired(found[ref.id]):
+                self._delete_expired(request)
+        return [self._result(request, found[ref.id]) if ref.id in found else None for request, ref in zip(requests, refs)]
+
+    def _delete_expired(self, request: IdempotentRequest):
+        """Remove an expired record the TTL policy has not removed yet, if it is still expired (blocking)"""
+        ref = self._ref(request)
+
+        def _delete(transaction):
+            snapshot = ref.get(transaction=transaction)
+            record_datastore(reads=1)
+            if self._expired(snapshot):
+                transaction.delete(ref)
+
+        run_transaction(_delete)
+
+    def record(self, writer, request: IdempotentRequest, result: dict, overwrite: bool = False):
+        """
+        Store the result with the write it belongs to (WriteBatch or Transaction).
+        create() fails if the key exists; overwrite=True (a transaction that looked
+        the key up and found it absent or expired) replaces an expired record.
+        """
+        now = datetime.now()
+        data = {
+            "scope": request.scope,
+            "fingerprint": request.fingerprint,
+            "result": result,
+            "created_at": now,
+            "expire_at": now + timedelta(hours=settings.idempotency_key_ttl_hours)
+        }
+        if overwrite:
+            writer.set(self._ref(request), data)
+        else:
+            writer.create(self._ref(request), data)
@@ -0,0 +1,193 @@
+"""
+Inventory Costing - Tính giá xuất kho (bình quân gia quyền di động / FIFO)
+
+Trạng thái giá vốn của mỗi cặp (kho, hàng) nằm ngay trong document tồn kho:
+
+    {"quantity": 12, "value": 600000, "layers": [{"key": ..., "voucher_no": "PNK202500001", "quantity": 5, "unit_cost": 48000}, ...]}
+
+- average: đơn giá xuất = value / quantity tại thời điểm xuất - O(1)
+- fifo: xuất lần lượt từ các lớp nhập cũ nhất - O(số lớp bị tiêu thụ)
+
+Các hàm thay đổi trạng thái tại chỗ và ném InsufficientStockError khi tồn kho
+không đủ, để transaction ghi sổ bị hủy toàn bộ.
+"""
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+COSTING_METHODS = ("average", "fifo")
+
+# Làm tròn để tránh sai số float khi cộng dồn nhiều lần
+PRECISION = 6
+# Làm tròn thành tiền của dòng xuất kho
+AMOUNT_PRECISION = 2
+
+
+class InsufficientStockError(ValueError):
+    """Xuất kho (hoặc hủy phiếu nhập) làm tồn kho âm"""
+
+
+class CostingEngine:
+
+    def __init__(self, method: str = "average"):
+        if method not in COSTING_METHODS:
+            raise ValueError(f"Phương pháp tính giá không hợp lệ: {method} (average | fifo)")
+        self.method = method
+
+    @property
+    def fifo(self) -> bool:
+        return self.method == "fifo"
+
+    def state(self, data: Optional[dict]) -> dict:
+        """Cost state from a balance document (or an empty state)"""
+        data = data or {}
+        quantity = float(data.get("quantity") or 0)
+        value = float(data.get("value") or 0)
+        layers = []
+        if self.fifo:
+            layers = [dict(layer) for layer in data.get("layers") or []]
+            missing = round(quantity - sum(layer["quantity"] for layer in layers), PRECISION)
+            if missing > 0:
+                # Tồn có trước khi bật FIFO: một lớp đầu kỳ theo giá bình quân
+                layered_value = sum(layer["quantity"] * layer["unit_cost"] for layer in layers)
+                layers.insert(0, {
+                    "key": "",
+                    "voucher_no": None,
+                    "quantity": missing,
+                    "unit_cost": round((value - layered_value) / missing, PRECISION)
+                })
+        return {"quantity": quantity, "value": value, "layers": layers}
+
+    @staticmethod
+    def document(state: dict) -> dict:
+        """Balance document fields for a cost state"""
+        quantity = state["quantity"]
+        return {
+            "quantity": quantity,
+            "value": state["value"],
+            "average_cost": round(state["value"] / quantity, PRECISION) if quantity else 0.0,
+            "layers": state["layers"]
+        }
+
+    # ----- Receipts -----
+
+    def receive(self, state: dict, quantity: float, amount: float, key: str, voucher_no: Optional[str]):
+        state["quantity"] = round(state["quantity"] + quantity, PRECISION)
+        state["value"] = round(state["value"] + amount, PRECISION)
+        if self.fifo:
+            self._put_layer(state, key, voucher_no, quantity, amount / quantity)
+
+    def unreceive(
+        self,
+        state: dict,
+        quantity: float,
+        amount: float,
+        key: str,
+        voucher_no: Optional[str],
+        label: str,
+        exact: bool = True
+    ) -> float:
+        """
+        Undo a receipt (cancelling a posted PNK). exact=False means the balance
+        moved since the receipt: under average costing the receipt was partly
+        issued at a blended cost, so it is taken out at the current average
+        cost instead of its own amount (which could leave value without stock).
+
+        Returns the value taken out of stock, which differs from `amount` when
+        repriced or when the remaining value is written off at zero quantity.
+        """
+        if round(state["quantity"] - quantity, PRECISION) < 0:
+            raise InsufficientStockError(
+                f"Không đủ tồn kho: hàng {label} (tồn {state['quantity']:g}, cần hoàn {quantity:g})"
+            )
+        if self.fifo:
+            layer = next((layer for layer in state["layers"] if layer["key"] == key), None)
+            if layer is None or round(layer["quantity"] - quantity, PRECISION) < 0:
+                raise InsufficientStockError(f"Hàng {label} của phiếu {voucher_no} đã được xuất kho, không thể hoàn nhập")
+            layer["quantity"] = round(layer["quantity"] - quantity, PRECISION)
+            if not layer["quantity"]:
+                state["layers"].remove(layer)
+        elif not exact:
+            amount = quantity * state["value"] / state["quantity"] if state["quantity"] else 0.0
+        value = state["value"]
+        state["quantity"] = round(state["quantity"] - quantity, PRECISION)
+        # Hết hàng thì hết giá trị
+        state["value"] = round(state["value"] - amount, PRECISION) if state["quantity"] else 0.0
+        return round(value - state["value"], PRECISION)
+
+    # ----- Issues -----
+
+    def issue(self, state: dict, quantity: float, label: str) -> Tuple[float, List[dict]]:
+        """
+        Take `quantity` out of stock. Returns the cost amount and, for FIFO,
+        the consumed layers (needed to undo the issue).
+        """
+        available = state["quantity"]
+        remaining_after = round(available - quantity, PRECISION)
+        if remaining_after < 0:
+            raise InsufficientStockError(f"Không đủ tồn kho: hàng {label} (tồn {available:g}, cần {quantity:g})")
+
+        consumed: List[dict] = []
+        if remaining_after == 0:
+            # Xuất hết: lấy toàn bộ giá trị còn lại, không để lại số lẻ
+            amount = round(state["value"], AMOUNT_PRECISION)
+            consumed = [dict(layer) for layer in state["layers"]]
+            state["layers"] = []
+        elif self.fifo:
+            amount = 0.0
+            remaining = quantity
+            layers = state["layers"]
+            while remaining > 0:
+                layer = layers[0]
+                take = min(layer["quantity"], remaining)
+                amount += take * layer["unit_cost"]
+                consumed.append({**layer, "quantity": take})
+                layer["quantity"] = round(layer["quantity"] - take, PRECISION)
+                remaining = round(remaining - take, PRECISION)
+                if not layer["quantity"]:
+                    layers.pop(0)
+            amount = round(amount, AMOUNT_PRECISION)
+        else:
+            amount = round(quantity * state["value"] / available, AMOUNT_PRECISION)
+
+        state["quantity"] = remaining_after
+        state["value"] = round(state["value"] - amount, PRECISION)
+        return amount, consumed
+
+    def unissue(
+        self,
+        state: dict,
+        quantity: float,
+        amount: float,
+        consumed: Optional[List[dict]],
+        key: str,
+        voucher_no: Optional[str]
+    ):
+        """Undo an issue (cancelling a posted PXK) - FIFO layers are put back"""
+        state["quantity"] = round(state["quantity"] + quantity, PRECISION)
+        state["value"] = round(state["value"] + amount, PRECISION)
+        if not self.fifo:
+            return
+        if consumed:
+            for layer in consumed:
+                self._put_layer(state, layer["key"], layer.get("voucher_no"), layer["quantity"], layer["unit_cost"])
+        else:
+            # Phiếu ghi sổ trước khi bật FIFO: hoàn lại thành một lớp theo giá đã xuất
+            self._put_layer(state, key, voucher_no, quantity, amount / quantity)
+
+    @staticmethod
+    def _put_layer(state: dict, key: str, voucher_no: Optional[str], quantity: float, unit_cost: float):
+        """Add quantity to the layer `key`, keeping layers ordered oldest first"""
+        layers = state["layers"]
+        for layer in layers:
+            if layer["key"] == key:
+                total = layer["quantity"] + quantity
+                layer["unit_cost"] = round((layer["quantity"] * layer["unit_cost"] + quantity * unit_cost) / total, PRECISION)
+                layer["quantity"] = round(total, PRECISION)
+                return
+        index = bisect_right([layer["key"] for layer in layers], key)
+        layers.insert(index, {
+            "key": key,
+            "voucher_no": voucher_no,
+            "quantity": round(quantity, PRECISION),
+            "unit_cost": round(unit_cost, PRECISION)
+        })
@@ -0,0 +1,442 @@
+"""
+Inventory Service - Tồn kho theo kho và hàng hóa
+
+Mỗi cặp (warehouse_code, product_code) có một document trong
+`inventory_balances` chứa số lượng, giá trị tồn và trạng thái giá vốn
+(xem inventory_costing). Document được cập nhật trong cùng transaction với
+lệnh ghi sổ / hủy phiếu kho, nên tra cứu tồn kho chỉ cần đọc O(1) document
+thay vì quét toàn bộ phiếu và dòng chi tiết.
+
+Mỗi lần ghi sổ cũng ghi một document `inventory_movements` cho từng cặp
+(phiếu, kho-hàng) với giá xuất từng dòng và số dư sau phiếu, dùng để hủy
+phiếu FIFO và để tính lại giá vốn từ một ngày bất kỳ.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+from google.cloud.firestore import FieldFilter, Query
+
+from ..config.database import as_utc, commit_batch, get_db
+from ..config.executor import run_db
+from ..config.metrics import record_datastore
+from ..config.settings import settings
+from ..models.inventory import InventoryBalance
+from ..models.warehouse_voucher import WarehouseVoucherType, WarehouseVoucherStatus
+from .inventory_costing import AMOUNT_PRECISION, CostingEngine, InsufficientStockError, PRECISION
+from .stats_rollup import MAX_BATCH_WRITES, merge_deltas
+
+# (warehouse_code, product_code)
+BalanceKey = Tuple[str, str]
+
+
+def _sequence_time(value: datetime) -> str:
+    return as_utc(value).astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+class InventoryService:
+    COLLECTION = "inventory_balances"
+    MOVEMENT_COLLECTION = "inventory_movements"
+
+    def __init__(self):
+        self.db = get_db()
+        self.costing = CostingEngine(settings.costing_method)
+
+    def _get_collection(self):
+        return self.db.collection(self.COLLECTION)
+
+    def _get_movements(self):
+        return self.db.collection(self.MOVEMENT_COLLECTION)
+
+    @staticmethod
+    def _stream_dicts(query) -> List[dict]:
+        """Stream query results as dicts (blocking - run via run_db)"""
+        docs = [doc.to_dict() for doc in query.stream()]
+        record_datastore(streamed=len(docs))
+        return docs
+
+    @staticmethod
+    def balance_id(warehouse_code: str, product_code: str) -> str:
+        """Document ID: {warehouse_code}__{product_code} (mã được encode để không chứa '/')"""
+        return f"{quote(warehouse_code, safe='')}__{quote(product_code, safe='')}"
+
+    @staticmethod
+    def movement_id(voucher_id: str, balance_id: str) -> str:
+        return f"{voucher_id}__{balance_id}"
+
+    @staticmethod
+    def sequence(voucher: dict) -> str:
+        """
+        Replay order of a voucher: voucher date (UTC) then voucher number, so
+        PNK comes before PXK at the same timestamp. Also the FIFO layer key.
+        """
+        return f"{_sequence_time(voucher['voucher_date'])}#{voucher.get('voucher_no') or ''}"
+
+    @staticmethod
+    def _is_posted(data: Optional[dict]) -> bool:
+        return bool(data) and data.get("status") == WarehouseVoucherStatus.POSTED.value
+
+    @staticmethod
+    def _line_key(voucher: dict, line: dict) -> BalanceKey:
+        return line.get("warehouse_code") or voucher["warehouse_code"], line["product_code"]
+
+    def _keys(self, voucher: dict) -> List[BalanceKey]:
+        """Distinct balances touched by a voucher, in line order"""
+        return list(dict.fromkeys(self._line_key(voucher, line) for line in voucher.get("lines") or []))
+
+    # ----- Costing -----
+
+    def post_lines(self, voucher: dict, states: Dict[BalanceKey, dict]) -> Tuple[Dict[BalanceKey, dict], Optional[List[dict]]]:
+        """
+        Apply a voucher's lines to the cost states (in place), pricing issue
+        lines from the states. Returns one movement document per balance and
+        the priced lines (None for receipts).
+        """
+        is_issue = voucher.get("voucher_type") == WarehouseVoucherType.ISSUE.value
+        sequence = self.sequence(voucher)
+        movements: Dict[BalanceKey, dict] = {}
+        lines = [dict(line) for line in voucher.get("lines") or []]
+
+        for line in lines:
+            key = self._line_key(voucher, line)
+            state = states[key]
+            quantity = float(line["quantity"])
+            entry = {"line_no": line.get("line_no"), "quantity": quantity}
+
+            if is_issue:
+                amount, consumed = self.costing.issue(state, quantity, f"{key[1]} tại kho {key[0]}")
+                line["amount"] = amount
+                line["unit_price"] = round(amount / quantity, PRECISION)
+                if consumed:
+                    entry["cost_layers"] = consumed
+            else:
+                amount = float(line.get("amount") or 0)
+                self.costing.receive(state, quantity, amount, sequence, voucher.get("voucher_no"))
+            entry["amount"] = amount
+
+            movement = movements.setdefault(key, {
+                "id": self.movement_id(voucher["id"], self.balance_id(*key)),
+                "voucher_id": voucher["id"],
+                "voucher_no": voucher.get("voucher_no"),
+                "voucher_type": voucher.get("voucher_type"),
+                "voucher_date": voucher["voucher_date"],
+                "seq": sequence,
+                "warehouse_code": key[0],
+                "product_code": key[1],
+                "product_name": line.get("product_name"),
+                "unit": line.get("unit"),
+                "quantity": 0.0,
+                "value": 0.0,
+                "lines": []
+            })
+            sign = -1 if is_issue else 1
+            movement["quantity"] = round(movement["quantity"] + sign * quantity, PRECISION)
+            movement["value"] = round(movement["value"] + sign * amount, PRECISION)
+            movement["lines"].append(entry)
+
+        # Số dư sau phiếu - số dư đầu kỳ khi tính lại giá vốn từ một ngày
+        for key, movement in movements.items():
+            state = states[key]
+            movement["balance_quantity"] = state["quantity"]
+            movement["balance_value"] = state["value"]
+            movement["balance_layers"] = [dict(layer) for layer in state["layers"]]
+
+        return movements, (lines if is_issue else None)
+
+    def reverse_lines(self, voucher: dict, states: Dict[BalanceKey, dict], movements: Dict[BalanceKey, Optional[dict]]) -> float:
+        """
+        Undo a posted voucher's lines on the cost states (in place), last line
+        first. Returns the cost adjustment of a receipt: value taken out of
+        stock minus the receipt amounts (0 for issues).
+        """
+        is_issue = voucher.get("voucher_type") == WarehouseVoucherType.ISSUE.value
+        sequence = self.sequence(voucher)
+        recorded = {
+            (key, entry.get("line_no")): entry
+            for key, movement in movements.items() if movement
+            for entry in movement.get("lines") or []
+        }
+        # Số dư chưa đổi từ khi nhập: hoàn đúng thành tiền của phiếu
+        untouched = {
+            key: bool(movement)
+            and movement.get("balance_quantity") == states[key]["quantity"]
+            and movement.get("balance_value") == states[key]["value"]
+            for key, movement in movements.items()
+        }
+
+        adjustment = 0.0
+        for line in reversed(voucher.get("lines") or []):
+            key = self._line_key(voucher, line)
+            quantity = float(line["quantity"])
+            amount = float(line.get("amount") or 0)
+            if is_issue:
+                consumed = recorded.get((key, line.get("line_no")), {}).get("cost_layers")
+                self.costing.unissue(states[key], quantity, amount, consumed, sequence, voucher.get("voucher_no"))
+            else:
+                removed = self.costing.unreceive(
+                    states[key], quantity, amount, sequence, voucher.get("voucher_no"), f"{key[1]} tại kho {key[0]}",
+                    exact=untouched.get(key, False)
+                )
+                adjustment += removed - amount
+        return round(adjustment, AMOUNT_PRECISION)
+
+    def _balance_document(self, key: BalanceKey, state: dict, current: dict, voucher: dict, now: datetime) -> dict:
+        line = next((line for line in voucher.get("lines") or [] if self._line_key(voucher, line) == key), {})
+        return {
+            "id": self.balance_id(*key),
+            "warehouse_code": key[0],
+            "product_code": key[1],
+            "product_name": line.get("product_name") or current.get("product_name"),
+            "unit": line.get("unit") or current.get("unit"),
+            **self.costing.document(state),
+            "last_voucher_id": voucher["id"],
+            "last_voucher_no": voucher.get("voucher_no"),
+            "updated_at": now
+        }
+
+    # ----- Transaction hooks (blocking) -----
+
+    def prepare(self, transaction, before: Optional[dict], after: Optional[dict]) -> Tuple[List[tuple], dict]:
+        """
+        Read the affected balances (and movements, when cancelling) inside the
+        transaction and compute the writes. Must run before any write of the
+        transaction. Returns (writes, voucher_changes) - voucher_changes holds
+        the priced lines and total of an issue being posted, or the
+        cost_adjustment of a receipt being cancelled at a different value.
+
+        Raises InsufficientStockError if a balance would become negative.
+        """
+        posting = self._is_posted(after) and not self._is_posted(before)
+        reversing = self._is_posted(before) and not self._is_posted(after)
+        if not posting and not reversing:
+            return [], {}
+
+        voucher = after if posting else before
+        keys = self._keys(voucher)
+        balance_refs = {key: self._get_collection().document(self.balance_id(*key)) for key in keys}
+        movement_refs = {
+            key: self._get_movements().document(self.movement_id(voucher["id"], ref.id))
+            for key, ref in balance_refs.items()
+        }
+
+        refs = list(balance_refs.values()) + (list(movement_refs.values()) if reversing else [])
+        found = {snapshot.id: snapshot.to_dict() for snapshot in transaction.get_all(refs) if snapshot.exists}
+        record_datastore(reads=len(refs))
+        current = {key: found.get(ref.id) or {} for key, ref in balance_refs.items()}
+        states = {key: self.costing.state(current[key]) for key in keys}
+
+        writes: List[tuple] = []
+        voucher_changes: dict = {}
+        if posting:
+            movements, priced_lines = self.post_lines(voucher, states)
+            writes += [("set", movement_refs[key], movement) for key, movement in movements.items()]
+            if priced_lines is not None:
+                voucher_changes = {
+                    "lines": priced_lines,
+                    "total_amount": round(sum(line["amount"] for line in priced_lines), PRECISION)
+                }
+        else:
+            adjustment = self.reverse_lines(voucher, states, {key: found.get(ref.id) for key, ref in movement_refs.items()})
+            if adjustment:
+                voucher_changes = {"cost_adjustment": adjustment}
+            writes += [("delete", ref, None) for ref in movement_refs.values()]
+
+        now = datetime.now()
+        writes += [
+            ("set", balance_refs[key], self._balance_document(key, states[key], current[key], voucher, now))
+            for key in keys
+        ]
+        return writes, voucher_changes
+
+    @staticmethod
+    def apply(writer, writes: List[tuple]):
+        """Queue the writes computed by prepare() on a WriteBatch or Transaction"""
+        for op, ref, data in writes:
+            if op == "delete":
+                writer.delete(ref)
+            elif op == "update":
+                writer.update(ref, data)
+            else:
+                writer.set(ref, data)
+
+    # ----- Queries -----
+
+    async def get_balance(self, warehouse_code: str, product_code: str) -> Optional[InventoryBalance]:
+        """Balance of one product in one warehouse (single document read)"""
+        doc = await run_db(self._get_collection().document(self.balance_id(warehouse_code, product_code)).get)
+        record_datastore(reads=1)
+        if doc.exists:
+            return InventoryBalance(**doc.to_dict())
+        return None
+
+    async def get_balances(
+        self,
+        warehouse_code: Optional[str] = None,
+        product_code: Optional[str] = None,
+        limit: int = 500
+    ) -> List[InventoryBalance]:
+        """Balances filtered by warehouse and/or product"""
+        if warehouse_code and product_code:
+            balance = await self.get_balance(warehouse_code, product_code)
+            return [balance] if balance else []
+
+        query = self._get_collection()
+        if warehouse_code:
+            query = query.where(filter=FieldFilter("warehouse_code", "==", warehouse_code)).order_by("product_code")
+        elif product_code:
+            query = query.where(filter=FieldFilter("product_code", "==", product_code)).order_by("warehouse_code")
+
+        docs = await run_db(self._stream_dicts, query.limit(limit))
+        return [InventoryBalance(**data) for data in docs]
+
+    # ----- Maintenance (blocking - run via run_db) -----
+
+    def _opening_state(self, key: BalanceKey, from_sequence: str) -> dict:
+        """Cost state after the last movement before from_sequence"""
+        query = (
+            self._get_movements()
+            .where(filter=FieldFilter("warehouse_code", "==", key[0]))
+            .where(filter=FieldFilter("product_code", "==", key[1]))
+            .where(filter=FieldFilter("seq", "<", from_sequence))
+            .order_by("seq", direction=Query.DESCENDING)
+            .limit(1)
+        )
+        for doc in query.stream():
+            movement = doc.to_dict() or {}
+            return self.costing.state({
+                "quantity": movement.get("balance_quantity"),
+                "value": movement.get("balance_value"),
+                "layers": movement.get("balance_layers")
+            })
+        return self.costing.state(None)
+
+    def recompute(
+        self,
+        voucher_collection,
+        rollup,
+        ledger,
+        ledger_source: str,
+        from_date: Optional[datetime] = None,
+        line_chunks=None,
+        cache=None
+    ) -> dict:
+        """
+        Replay POSTED warehouse vouchers dated from `from_date` (all of them when
+        None) in voucher date order: reprice issue lines, rewrite movements and
+        balances, and fix the daily statistics and journal entries of repriced
+        vouchers. The opening state of each balance is taken from its last
+        movement before from_date.
+
+        Cancelled receipts in the range no longer count at all, so their cost
+        adjustment entries are removed. Nothing is written if the replay drives
+        a balance negative (InsufficientStockError). Run during maintenance - postings made while
+        recomputing may be lost. line_chunks (VoucherLineChunks) loads and
+        rewrites the lines of vouchers stored in chunks; cache (VoucherCache)
+        drops the cached copies of the rewritten vouchers once committed.
+        """
+        query = voucher_collection.where(filter=FieldFilter("status", "==", WarehouseVoucherStatus.POSTED.value))
+        if from_date:
+            query = query.where(filter=FieldFilter("voucher_date", ">=", from_date))
+        vouchers = sorted((doc.to_dict() for doc in query.stream()), key=self.sequence)
+        if line_chunks is not None:
+            vouchers = [line_chunks.load(voucher) for voucher in vouchers]
+
+        keys = list(dict.fromkeys(key for voucher in vouchers for key in self._keys(voucher)))
+        if from_date:
+            from_sequence = _sequence_time(from_date)
+            states = {key: self._opening_state(key, from_sequence) for key in keys}
+        else:
+            states = {key: self.costing.state(None) for key in keys}
+
+        writes: List[tuple] = []
+        deltas: dict = {}
+        revisions: List[Tuple[dict, dict]] = []
+        last_voucher: Dict[BalanceKey, dict] = {}
+        movement_ids = set()
+        repriced = 0
+        for voucher in vouchers:
+            try:
+                movements, priced_lines = self.post_lines(voucher, states)
+            except InsufficientStockError as e:
+                raise InsufficientStockError(f"Phiếu {voucher.get('voucher_no')}: {e}") from e
+
+            for key, movement in movements.items():
+                writes.append(("set", self._get_movements().document(movement["id"]), movement))
+                movement_ids.add(movement["id"])
+                last_voucher[key] = voucher
+
+            if priced_lines is None:
+                continue
+            changes = {
+                "lines": priced_lines,
+                "total_amount": round(sum(line["amount"] for line in priced_lines), PRECISION)
+            }
+            if changes["lines"] != voucher.get("lines") or changes["total_amount"] != voucher.get("total_amount"):
+                # updated_at đổi để ETag / bản sao của phiếu được làm mới
+                changes["updated_at"] = datetime.now()
+                stored_changes = changes
+                if line_chunks is not None:
+                    line_fields, chunk_writes = line_chunks.plan(voucher["id"], priced_lines, voucher)
+                    stored_changes = {**changes, **line_fields}
+                    writes += chunk_writes
+                writes.append(("update", voucher_collection.document(voucher["id"]), stored_changes))
+                merge_deltas(deltas, rollup.deltas(voucher, {**voucher, **changes}))
+                revisions.append((voucher, {**voucher, **changes}))
+                repriced += 1
+
+        now = datetime.now()
+        balance_ids = set()
+        for key in keys:
+            document = self._balance_document(key, states[key], {}, last_voucher[key], now)
+            writes.append(("set", self._get_collection().document(document["id"]), document))
+            balance_ids.add(document["id"])
+
+        if not from_date:
+            # Tính lại toàn bộ: xóa số dư / chứng từ kho không còn phiếu ghi sổ
+            writes += [("delete", doc.reference, None) for doc in self._get_collection().select([]).stream()
+                       if doc.id not in balance_ids]
+            writes += [("delete", doc.reference, None) for doc in self._get_movements().select([]).stream()
+                       if doc.id not in movement_ids]
+
+        for i in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            self.apply(batch, writes[i:i + MAX_BATCH_WRITES])
+            commit_batch(batch)
+
+        days = list(deltas.items())
+        for i in range(0, len(days), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            rollup.apply(batch, dict(days[i:i + MAX_BATCH_WRITES]))
+            commit_batch(batch)
+
+        # Mỗi phiếu: 1 bút toán + tối đa 2 số dư cho mỗi cặp tài khoản
+        for i in range(0, len(revisions), MAX_BATCH_WRITES // 5):
+            batch = self.db.batch()
+            for before, after in revisions[i:i + MAX_BATCH_WRITES // 5]:
+                ledger.apply_revision(batch, ledger_source, before, after)
+            commit_batch(batch)
+
+        cancelled = voucher_collection.where(filter=FieldFilter("status", "==", WarehouseVoucherStatus.CANCELLED.value))
+        if from_date:
+            cancelled = cancelled.where(filter=FieldFilter("voucher_date", ">=", from_date))
+        adjusted = [voucher for voucher in (doc.to_dict() for doc in cancelled.stream()) if voucher.get("cost_adjustment")]
+        # Mỗi phiếu: xóa bút toán chênh lệch + 2 số dư + sửa phiếu
+        for i in range(0, len(adjusted), MAX_BATCH_WRITES // 4):
+            batch = self.db.batch()
+            for voucher in adjusted[i:i + MAX_BATCH_WRITES // 4]:
+                ledger.remove_adjustment(batch, ledger_source, voucher)
+                batch.update(voucher_collection.document(voucher["id"]), {"cost_adjustment": None, "updated_at": now})
+            commit_batch(batch)
+
+        if cache is not None:
+            for voucher in [before for before, _ in revisions] + adjusted:
+                cache.invalidate(voucher_collection.id, voucher["id"])
+
+        return {
+            "collection": self.COLLECTION,
+            "method": self.costing.method,
+            "vouchers": len(vouchers),
+            "balances": len(keys),
+            "movements": len(movement_ids),
+            "repriced": repriced,
+            "adjustments_removed": len(adjusted)
+        }
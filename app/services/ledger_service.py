@@ -0,0 +1,382 @@
+"""
+Ledger Service - Sổ cái: bút toán và số dư tài khoản theo kỳ
+
+Ghi sổ một phiếu sinh một document `journal_entries/{source}_{voucher_id}`
+chứa các định khoản Nợ/Có, và cộng (Increment) số phát sinh Nợ/Có vào
+`account_balances/{account}_{YYYY-MM}` trong cùng transaction. Hủy phiếu đã
+ghi sổ đánh dấu bút toán CANCELLED và trừ lại số phát sinh. Hủy phiếu nhập mà
+tồn kho xuất ra khác thành tiền phiếu (bình quân, `cost_adjustment`) sinh thêm
+bút toán `{source}_{voucher_id}_adjustment` Nợ 632 / Có TK kho (hoặc ngược lại),
+để số dư TK kho luôn bằng giá trị tồn kho.
+
+Số dư tài khoản / bảng cân đối phát sinh chỉ cần đọc O(số tài khoản x số kỳ)
+document thay vì đọc lại toàn bộ phiếu.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from google.cloud.firestore import FieldFilter, Increment
+
+from ..config.database import as_utc, commit_batch, get_db
+from ..config.executor import run_db
+from ..config.metrics import record_datastore
+from ..config.settings import settings
+from ..models.ledger import AccountBalance, JournalEntry
+from .stats_rollup import MAX_BATCH_WRITES
+from .voucher_lines import VoucherLineChunks
+
+POSTED = "POSTED"
+CANCELLED = "CANCELLED"
+
+# TK thuế GTGT theo TT133
+OUTPUT_VAT_ACCOUNT = "33311"  # Thuế GTGT đầu ra
+INPUT_VAT_ACCOUNT = "1331"    # Thuế GTGT được khấu trừ
+COST_OF_GOODS_ACCOUNT = "632"  # Giá vốn hàng bán - chênh lệch giá khi hủy phiếu nhập
+
+# {(account_code, period): {"debit": x, "credit": y}}
+BalanceDeltas = Dict[Tuple[str, str], Dict[str, float]]
+
+
+class LedgerService:
+    JOURNAL_COLLECTION = "journal_entries"
+    BALANCE_COLLECTION = "account_balances"
+
+    def __init__(self):
+        self.db = get_db()
+        self.tz = timezone(timedelta(hours=settings.stats_timezone_offset_hours))
+
+    def _get_journal(self):
+        return self.db.collection(self.JOURNAL_COLLECTION)
+
+    def _get_balances(self):
+        return self.db.collection(self.BALANCE_COLLECTION)
+
+    @staticmethod
+    def _stream_dicts(query) -> List[dict]:
+        """Stream query results as dicts (blocking - run via run_db)"""
+        docs = [doc.to_dict() for doc in query.stream()]
+        record_datastore(streamed=len(docs))
+        return docs
+
+    def period_key(self, value: datetime) -> str:
+        return as_utc(value).astimezone(self.tz).strftime("%Y-%m")
+
+    @staticmethod
+    def journal_id(source: str, voucher_id: str) -> str:
+        return f"{source}_{voucher_id}"
+
+    @staticmethod
+    def adjustment_id(source: str, voucher_id: str) -> str:
+        return f"{source}_{voucher_id}_adjustment"
+
+    @staticmethod
+    def balance_id(account_code: str, period: str) -> str:
+        return f"{account_code}_{period}"
+
+    # ----- Journal lines -----
+
+    @staticmethod
+    def cash_lines(voucher: dict) -> List[dict]:
+        """
+        Phiếu thu: Nợ TK tiền / Có TK đối ứng (+ Có 33311 phần thuế)
+        Phiếu chi: Nợ TK đối ứng (+ Nợ 1331 phần thuế) / Có TK tiền
+        """
+        cash_account = voucher["cash_account_code"]
+        is_receipt = voucher.get("voucher_type") == "RECEIPT"
+        lines = []
+        for line in voucher.get("lines") or []:
+            description = line.get("description")
+            amount = float(line.get("amount") or 0)
+            tax_amount = float(line.get("tax_amount") or 0)
+            if is_receipt:
+                pairs = [(cash_account, line["account_code"], amount), (cash_account, OUTPUT_VAT_ACCOUNT, tax_amount)]
+            else:
+                pairs = [(line["account_code"], cash_account, amount), (INPUT_VAT_ACCOUNT, cash_account, tax_amount)]
+            lines += [
+                {"debit_account": debit, "credit_account": credit, "amount": value, "description": description}
+                for debit, credit, value in pairs if value
+            ]
+        return lines
+
+    @staticmethod
+    def warehouse_lines(voucher: dict) -> List[dict]:
+        """
+        Phiếu nhập: Nợ debit_account (156...) / Có credit_account (331...)
+        Phiếu xuất: Nợ expense_account của dòng hoặc debit_account (632...) / Có credit_account (156...)
+        Gộp theo cặp tài khoản.
+        """
+        is_issue = voucher.get("voucher_type") == "ISSUE"
+        amounts: Dict[Tuple[str, str], float] = {}
+        for line in voucher.get("lines") or []:
+            debit = (line.get("expense_account") if is_issue else None) or voucher["debit_account"]
+            pair = (debit, voucher["credit_account"])
+            amounts[pair] = amounts.get(pair, 0) + float(line.get("amount") or 0)
+        return [
+            {"debit_account": debit, "credit_account": credit, "amount": amount, "description": voucher.get("description")}
+            for (debit, credit), amount in amounts.items() if amount
+        ]
+
+    @staticmethod
+    def adjustment_lines(voucher: dict) -> List[dict]:
+        """
+        Hủy phiếu nhập với cost_adjustment > 0: Nợ 632 / Có debit_account (156...)
+        cost_adjustment < 0: Nợ debit_account / Có 632
+        """
+        amount = round(float(voucher.get("cost_adjustment") or 0), 2)
+        if not amount:
+            return []
+        inventory_account = voucher["debit_account"]
+        debit, credit = (COST_OF_GOODS_ACCOUNT, inventory_account) if amount > 0 else (inventory_account, COST_OF_GOODS_ACCOUNT)
+        return [{
+            "debit_account": debit,
+            "credit_account": credit,
+            "amount": abs(amount),
+            "description": "Chênh lệch giá vốn khi hủy phiếu nhập"
+        }]
+
+    def journal_lines(self, source: str, voucher: dict) -> List[dict]:
+        return self.cash_lines(voucher) if source == "cash" else self.warehouse_lines(voucher)
+
+    def _journal_document(
+        self,
+        source: str,
+        voucher: dict,
+        status: str,
+        now: datetime,
+        lines: Optional[List[dict]] = None
+    ) -> dict:
+        adjustment = lines is not None
+        if lines is None:
+            lines = self.journal_lines(source, voucher)
+        accounts = sorted({line["debit_account"] for line in lines} | {line["credit_account"] for line in lines})
+        return {
+            "id": self.adjustment_id(source, voucher["id"]) if adjustment else self.journal_id(source, voucher["id"]),
+            "source": source,
+            "voucher_id": voucher["id"],
+            "voucher_no": voucher.get("voucher_no"),
+            "voucher_type": voucher.get("voucher_type"),
+            "voucher_date": voucher["voucher_date"],
+            "period": self.period_key(voucher["voucher_date"]),
+            "status": status,
+            "description": voucher.get("reason") or voucher.get("description"),
+            "lines": lines,
+            "accounts": accounts,
+            "total_amount": sum(line["amount"] for line in lines),
+            "created_at": (voucher.get("cancelled_at") if adjustment else voucher.get("posted_at")) or now,
+            "cancelled_at": voucher.get("cancelled_at") if status == CANCELLED else None
+        }
+
+    # ----- Deltas -----
+
+    def accumulate(
+        self,
+        deltas: BalanceDeltas,
+        source: str,
+        voucher: dict,
+        sign: int = 1,
+        lines: Optional[List[dict]] = None
+    ) -> BalanceDeltas:
+        """Add one posted voucher's debit/credit movements (or the given journal lines) into per-account, per-period deltas"""
+        period = self.period_key(voucher["voucher_date"])
+        for line in self.journal_lines(source, voucher) if lines is None else lines:
+            for side in ("debit", "credit"):
+                values = deltas.setdefault((line[f"{side}_account"], period), {"debit": 0.0, "credit": 0.0})
+                values[side] += sign * line["amount"]
+        return deltas
+
+    def deltas(self, source: str, before: Optional[dict], after: Optional[dict]) -> BalanceDeltas:
+        """Balance changes for a voucher going from `before` to `after` - only POSTED vouchers count"""
+        result: BalanceDeltas = {}
+        for data, sign in ((before, -1), (after, 1)):
+            if data and data.get("status") == POSTED:
+                self.accumulate(result, source, data, sign)
+        return {key: values for key, values in result.items() if values["debit"] or values["credit"]}
+
+    def apply(self, writer, source: str, before: Optional[dict], after: Optional[dict]):
+        """Queue journal and balance writes on a WriteBatch or Transaction (no reads)"""
+        was_posted = bool(before) and before.get("status") == POSTED
+        is_posted = bool(after) and after.get("status") == POSTED
+        if was_posted == is_posted:
+            return
+
+        now = datetime.now()
+        document = self._journal_document(source, after or before, POSTED if is_posted else CANCELLED, now)
+        writer.set(self._get_journal().document(document["id"]), document)
+        deltas = self.deltas(source, before, after)
+        adjustment = self.adjustment_lines(after) if after and not is_posted else []
+        if adjustment:
+            # Bút toán chênh lệch giữ nguyên khi phiếu nhập bị hủy
+            adjustment_document = self._journal_document(source, after, POSTED, now, adjustment)
+            writer.set(self._get_journal().document(adjustment_document["id"]), adjustment_document)
+            self.accumulate(deltas, source, after, lines=adjustment)
+        self._apply_deltas(writer, deltas, now)
+
+    def remove_adjustment(self, writer, source: str, voucher: dict):
+        """Delete a cancelled receipt's cost adjustment entry and take it out of the balances (recompute)"""
+        lines = self.adjustment_lines(voucher)
+        if not lines:
+            return
+        writer.delete(self._get_journal().document(self.adjustment_id(source, voucher["id"])))
+        self._apply_deltas(writer, self.accumulate({}, source, voucher, -1, lines), datetime.now())
+
+    def apply_revision(self, writer, source: str, before: dict, after: dict):
+        """Rewrite the journal entry and correct balances of a posted voucher whose amounts changed (repricing)"""
+        now = datetime.now()
+        document = self._journal_document(source, after, POSTED, now)
+        writer.set(self._get_journal().document(document["id"]), document)
+        self._apply_deltas(writer, self.deltas(source, before, after), now)
+
+    def _apply_deltas(self, writer, deltas: BalanceDeltas, now: datetime):
+        for (account_code, period), values in deltas.items():
+            writer.set(
+                self._get_balances().document(self.balance_id(account_code, period)),
+                {
+                    "account_code": account_code,
+                    "period": period,
+                    "debit": Increment(values["debit"]),
+                    "credit": Increment(values["credit"]),
+                    "updated_at": now
+                },
+                merge=True
+            )
+
+    # ----- Queries -----
+
+    def _sum_balances(self, query) -> Dict[str, Dict[str, float]]:
+        """Sum debit/credit per account over balance documents (blocking)"""
+        totals: Dict[str, Dict[str, float]] = {}
+        for data in self._stream_dicts(query):
+            values = totals.setdefault(data["account_code"], {"debit": 0.0, "credit": 0.0})
+            values["debit"] += float(data.get("debit") or 0)
+            values["credit"] += float(data.get("credit") or 0)
+        return totals
+
+    async def get_account_balances(
+        self,
+        from_period: str,
+        to_period: str,
+        account_prefix: Optional[str] = None
+    ) -> List[AccountBalance]:
+        """Opening, movement and closing balance per account for periods [from_period, to_period]"""
+        opening_query = self._get_balances().where(filter=FieldFilter("period", "<", from_period))
+        movement_query = (
+            self._get_balances()
+            .where(filter=FieldFilter("period", ">=", from_period))
+            .where(filter=FieldFilter("period", "<=", to_period))
+        )
+        opening = await run_db(self._sum_balances, opening_query)
+        movement = await run_db(self._sum_balances, movement_query)
+
+        result = []
+        for account_code in sorted(set(opening) | set(movement)):
+            if account_prefix and not account_code.startswith(account_prefix):
+                continue
+            before = opening.get(account_code, {"debit": 0.0, "credit": 0.0})
+            during = movement.get(account_code, {"debit": 0.0, "credit": 0.0})
+            opening_net = before["debit"] - before["credit"]
+            closing_net = opening_net + during["debit"] - during["credit"]
+            result.append(AccountBalance(
+                account_code=account_code,
+                opening_debit=opening_net if opening_net > 0 else 0.0,
+                opening_credit=-opening_net if opening_net < 0 else 0.0,
+                debit=during["debit"],
+                credit=during["credit"],
+                closing_debit=closing_net if closing_net > 0 else 0.0,
+                closing_credit=-closing_net if closing_net < 0 else 0.0
+            ))
+        return result
+
+    async def get_journal(
+        self,
+        account_code: Optional[str] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        include_cancelled: bool = False,
+        limit: int = 500
+    ) -> List[JournalEntry]:
+        """Journal entries ordered by voucher date, optionally touching one account"""
+        query = self._get_journal()
+        if account_code:
+            query = query.where(filter=FieldFilter("accounts", "array_contains", account_code))
+        if not include_cancelled:
+            query = query.where(filter=FieldFilter("status", "==", POSTED))
+        if from_date:
+            query = query.where(filter=FieldFilter("voucher_date", ">=", from_date))
+        if to_date:
+            query = query.where(filter=FieldFilter("voucher_date", "<=", to_date))
+
+        docs = await run_db(self._stream_dicts, query.order_by("voucher_date").limit(limit))
+        return [JournalEntry(**data) for data in docs]
+
+    # ----- Report loading (blocking - run via run_db) -----
+
+    def stream_journal(self, from_date: datetime, to_date: datetime, fields: List[str]) -> List[dict]:
+        """Posted journal entries with voucher_date in [from_date, to_date]"""
+        query = (
+            self._get_journal()
+            .where(filter=FieldFilter("status", "==", POSTED))
+            .where(filter=FieldFilter("voucher_date", ">=", from_date))
+            .where(filter=FieldFilter("voucher_date", "<=", to_date))
+        )
+        return self._stream_dicts(query.select(fields))
+
+    def stream_period_balances(self, before_period: str) -> List[dict]:
+        """Account balance documents of every period before `before_period` (YYYY-MM)"""
+        query = self._get_balances().where(filter=FieldFilter("period", "<", before_period))
+        return self._stream_dicts(query.select(["account_code", "debit", "credit"]))
+
+    # ----- Maintenance (blocking - run via run_db) -----
+
+    def rebuild(self, voucher_collections: Dict[str, str]) -> dict:
+        """
+        Regenerate every journal entry and account balance from raw vouchers
+        ({source: voucher collection name}). Run during maintenance - postings
+        made while rebuilding may be lost.
+        """
+        now = datetime.now()
+        journals: Dict[str, dict] = {}
+        deltas: BalanceDeltas = {}
+        for source, collection in voucher_collections.items():
+            line_chunks = VoucherLineChunks(self.db, collection)
+            query = self.db.collection(collection).where(filter=FieldFilter("status", "in", [POSTED, CANCELLED]))
+            for doc in query.stream():
+                voucher = line_chunks.load(doc.to_dict() or {})
+                if voucher.get("status") == POSTED:
+                    self.accumulate(deltas, source, voucher)
+                elif not voucher.get("posted_at"):
+                    continue  # Hủy khi còn nháp - chưa từng có bút toán
+                document = self._journal_document(source, voucher, voucher["status"], now)
+                journals[document["id"]] = document
+                adjustment = self.adjustment_lines(voucher) if voucher["status"] == CANCELLED else []
+                if adjustment:
+                    self.accumulate(deltas, source, voucher, lines=adjustment)
+                    document = self._journal_document(source, voucher, POSTED, now, adjustment)
+                    journals[document["id"]] = document
+
+        balances = {
+            self.balance_id(account_code, period): {
+                "account_code": account_code,
+                "period": period,
+                "debit": values["debit"],
+                "credit": values["credit"],
+                "updated_at": now
+            }
+            for (account_code, period), values in deltas.items()
+        }
+
+        writes = [("delete", doc.reference, None) for doc in self._get_journal().select([]).stream()
+                  if doc.id not in journals]
+        writes += [("delete", doc.reference, None) for doc in self._get_balances().select([]).stream()
+                   if doc.id not in balances]
+        writes += [("set", self._get_journal().document(doc_id), data) for doc_id, data in journals.items()]
+        writes += [("set", self._get_balances().document(doc_id), data) for doc_id, data in balances.items()]
+
+        for i in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for op, ref, data in writes[i:i + MAX_BATCH_WRITES]:
+                if op == "delete":
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, data)
+            commit_batch(batch)
+
+        return {"journal_entries": len(journals), "account_balances": len(balances)}
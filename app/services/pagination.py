@@ -0,0 +1,56 @@
+"""
+Cursor Pagination - phân trang bằng cursor token cho danh sách phiếu
+
+Danh sách phiếu được sắp xếp theo (voucher_date DESC, id DESC). Cursor là vị trí
+của phiếu cuối cùng trong trang trước, mã hóa base64 để client coi như chuỗi opaque.
+Firestore bắt đầu trang sau bằng start_after(), nên trang sâu tốn chi phí như trang đầu.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from google.cloud.firestore import Query
+
+
+def encode_cursor(voucher_date: datetime, voucher_id: str) -> str:
+    """(voucher_date, id) -> opaque cursor token"""
+    payload = json.dumps({"d": voucher_date.isoformat(), "i": voucher_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[datetime, str]:
+    """Opaque cursor token -> (voucher_date, id); raises ValueError if invalid"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["d"]), str(payload["i"])
+    except Exception:
+        raise ValueError("Cursor không hợp lệ")
+
+
+def split_page(docs: List[dict], limit: int) -> Tuple[List[dict], Optional[str]]:
+    """Documents fetched with limit + 1 -> (page, cursor of the next page or None)"""
+    if len(docs) <= limit:
+        return docs, None
+    last = docs[limit - 1]
+    return docs[:limit], encode_cursor(last["voucher_date"], last["id"])
+
+
+def projection_fields(fields: Sequence[str], allowed: Iterable[str]) -> List[str]:
+    """Field mask for a projected list: requested fields + cursor fields; raises ValueError on unknown names"""
+    allowed = set(allowed)
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"Trường không hợp lệ: {', '.join(unknown)}")
+    return list(dict.fromkeys(["id", "voucher_date", *fields]))
+
+
+def apply_order_and_cursor(query, cursor: Optional[str] = None):
+    """Order by (voucher_date DESC, id DESC) and start after the cursor position"""
+    query = query.order_by("voucher_date", direction=Query.DESCENDING)
+    query = query.order_by("id", direction=Query.DESCENDING)
+    if cursor:
+        voucher_date, voucher_id = decode_cursor(cursor)
+        query = query.start_after({"voucher_date": voucher_date, "id": voucher_id})
+    return query
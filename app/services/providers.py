@@ -0,0 +1,83 @@
+"""
+Service Providers - service dùng chung cho các route, cấp qua FastAPI Depends
+
+Route không tạo service lúc import, nên import app không khởi tạo Firebase / kênh gRPC.
+Mỗi worker (process) tạo client và service của riêng nó trong warm_up_services() ở lifespan
+(hoặc ở request đầu tiên nếu không chạy lifespan). Process con sau fork bỏ các service của
+process cha.
+"""
+import os
+import threading
+from typing import Dict, Type, TypeVar
+
+from .cash_voucher_service import CashVoucherService
+from .warehouse_voucher_service import WarehouseVoucherService
+from .inventory_service import InventoryService
+from .ledger_service import LedgerService
+from .report_service import ReportService
+from .voucher_search import VoucherSearchService
+
+T = TypeVar("T")
+
+_services: Dict[type, object] = {}
+_lock = threading.Lock()
+
+
+def _get(service_class: Type[T]) -> T:
+    service = _services.get(service_class)
+    if service is None:
+        with _lock:
+            service = _services.get(service_class)
+            if service is None:
+                service = _services[service_class] = service_class()
+    return service
+
+
+# async: FastAPI gọi dependency async trực tiếp trên event loop, không qua threadpool
+async def get_cash_voucher_service() -> CashVoucherService:
+    return _get(CashVoucherService)
+
+
+async def get_warehouse_voucher_service() -> WarehouseVoucherService:
+    return _get(WarehouseVoucherService)
+
+
+async def get_inventory_service() -> InventoryService:
+    return _get(InventoryService)
+
+
+async def get_ledger_service() -> LedgerService:
+    return _get(LedgerService)
+
+
+async def get_report_service() -> ReportService:
+    return _get(ReportService)
+
+
+async def get_search_service() -> VoucherSearchService:
+    return _get(VoucherSearchService)
+
+
+SERVICE_PROVIDERS = (
+    get_cash_voucher_service,
+    get_warehouse_voucher_service,
+    get_inventory_service,
+    get_ledger_service,
+    get_report_service,
+    get_search_service,
+)
+
+
+async def warm_up_services():
+    """Create the database client and every route service at startup instead of on the first request"""
+    for provider in SERVICE_PROVIDERS:
+        await provider()
+
+
+def _reset_after_fork():
+    global _lock
+    _services.clear()
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
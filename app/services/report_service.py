@@ -0,0 +1,285 @@
+"""
+Report Service - Bảng cân đối số phát sinh và sổ chi tiết tài khoản
+
+Các dòng bút toán của kỳ báo cáo (journal_entries, sinh từ phiếu thu/chi và
+phiếu kho khi ghi sổ) được nạp thành các mảng NumPy dạng cột:
+
+    debit_id / credit_id  int32  - mã tài khoản dạng categorical (chỉ số trong `codes`)
+    amount                int64  - số tiền (đồng)
+    timestamp             int64  - voucher_date (microsecond UTC)
+
+Số dư đầu kỳ lấy từ `account_balances` của các tháng trước kỳ, cộng phần đầu
+tháng đến from_date. Số phát sinh và số dư được tính bằng các phép gộp nhóm
+vector hóa (np.bincount) thay vì vòng lặp Python theo từng dòng.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config.executor import run_db
+from ..config.database import as_utc, get_db
+from ..models.report import AccountDetail, AccountDetailLine, TrialBalance, TrialBalanceRow
+from .ledger_service import LedgerService
+
+# Độ dài mã tài khoản cấp 1 / cấp 2 theo TT133 - dùng cho dòng tổng hợp
+ROLLUP_LENGTHS = (3, 4)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _timestamp(value: datetime) -> int:
+    return (as_utc(value) - EPOCH) // timedelta(microseconds=1)
+
+
+def _sum_by(ids: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """Grouped sum of int64 values by categorical id (exact below 2^53 đồng)"""
+    if not len(ids):
+        return np.zeros(size, dtype=np.int64)
+    return np.rint(np.bincount(ids, weights=values, minlength=size)).astype(np.int64)
+
+
+class JournalFrame:
+    """Columnar journal lines of a date range"""
+
+    def __init__(self):
+        self.codes: List[str] = []
+        self._code_ids: Dict[str, int] = {}
+        self.debit_id = np.zeros(0, dtype=np.int32)
+        self.credit_id = np.zeros(0, dtype=np.int32)
+        self.amount = np.zeros(0, dtype=np.int64)
+        self.timestamp = np.zeros(0, dtype=np.int64)
+        self.entry_id = np.zeros(0, dtype=np.int32)
+        # Thông tin phiếu theo entry_id (chỉ dùng cho sổ chi tiết)
+        self.entries: List[dict] = []
+        self.descriptions: List[Optional[str]] = []
+
+    def code_id(self, code: str) -> int:
+        code_id = self._code_ids.get(code)
+        if code_id is None:
+            code_id = self._code_ids[code] = len(self.codes)
+            self.codes.append(code)
+        return code_id
+
+    @classmethod
+    def from_entries(cls, entries: List[dict]) -> "JournalFrame":
+        frame = cls()
+        debit_ids, credit_ids, amounts, timestamps, entry_ids = [], [], [], [], []
+        for entry in entries:
+            entry_index = len(frame.entries)
+            frame.entries.append(entry)
+            timestamp = _timestamp(entry["voucher_date"])
+            for line in entry.get("lines") or []:
+                debit_ids.append(frame.code_id(line["debit_account"]))
+                credit_ids.append(frame.code_id(line["credit_account"]))
+                amounts.append(round(line["amount"]))
+                timestamps.append(timestamp)
+                entry_ids.append(entry_index)
+                frame.descriptions.append(line.get("description"))
+
+        frame.debit_id = np.asarray(debit_ids, dtype=np.int32)
+        frame.credit_id = np.asarray(credit_ids, dtype=np.int32)
+        frame.amount = np.asarray(amounts, dtype=np.int64)
+        frame.timestamp = np.asarray(timestamps, dtype=np.int64)
+        frame.entry_id = np.asarray(entry_ids, dtype=np.int32)
+        return frame
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    def net_by_account(self, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(debit, credit) totals per account code for the selected lines"""
+        size = len(self.codes)
+        return (
+            _sum_by(self.debit_id[mask], self.amount[mask], size),
+            _sum_by(self.credit_id[mask], self.amount[mask], size)
+        )
+
+
+class ReportService:
+
+    def __init__(self):
+        self.db = get_db()
+        self.ledger = LedgerService()
+
+    def _month_start(self, value: datetime) -> datetime:
+        local = as_utc(value).astimezone(self.ledger.tz)
+        return local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    # ----- Loading (blocking - run via run_db) -----
+
+    def _load(self, from_date: datetime, to_date: datetime) -> Tuple[JournalFrame, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Journal frame from the start of from_date's month to to_date, opening
+        debit/credit per account code, and the mask of in-range lines.
+        """
+        month_start = self._month_start(from_date)
+        entries = self.ledger.stream_journal(
+            month_start, to_date, ["source", "voucher_id", "voucher_no", "voucher_date", "description", "lines"]
+        )
+        frame = JournalFrame.from_entries(sorted(entries, key=lambda entry: _timestamp(entry["voucher_date"])))
+        balances = self.ledger.stream_period_balances(month_start.strftime("%Y-%m"))
+
+        # Đăng ký mã tài khoản của số dư đầu kỳ trước khi tạo mảng theo số lượng mã
+        balance_ids = np.asarray([frame.code_id(data["account_code"]) for data in balances], dtype=np.int32)
+        size = len(frame.codes)
+        opening_debit = _sum_by(balance_ids, np.asarray([round(data.get("debit") or 0) for data in balances], dtype=np.int64), size)
+        opening_credit = _sum_by(balance_ids, np.asarray([round(data.get("credit") or 0) for data in balances], dtype=np.int64), size)
+
+        in_range = frame.timestamp >= _timestamp(from_date)
+        head_debit, head_credit = frame.net_by_account(~in_range)
+        return frame, opening_debit + head_debit, opening_credit + head_credit, in_range
+
+    # ----- Trial balance -----
+
+    @staticmethod
+    def _rollup_rows(codes: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Rows of the report (every code and its level-1/level-2 prefixes) and
+        (code_id, row_id) pairs mapping each code to itself and its ancestors.
+        """
+        row_codes = sorted(set(codes) | {code[:length] for code in codes for length in ROLLUP_LENGTHS if len(code) > length})
+        row_ids = {code: index for index, code in enumerate(row_codes)}
+        pairs = [
+            (code_id, row_ids[ancestor])
+            for code_id, code in enumerate(codes)
+            for ancestor in {code, *(code[:length] for length in ROLLUP_LENGTHS if len(code) > length)}
+        ]
+        pair_array = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        return row_codes, pair_array[:, 0], pair_array[:, 1]
+
+    @staticmethod
+    def _split(net: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Net balance (Nợ - Có) -> debit / credit columns"""
+        return np.where(net > 0, net, 0), np.where(net < 0, -net, 0)
+
+    def _trial_balance(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        account_prefix: Optional[str],
+        max_length: Optional[int]
+    ) -> TrialBalance:
+        frame, opening_debit, opening_credit, in_range = self._load(from_date, to_date)
+        debit, credit = frame.net_by_account(in_range)
+        opening_net = opening_debit - opening_credit
+        closing_net = opening_net + debit - credit
+
+        row_codes, code_ids, row_ids = self._rollup_rows(frame.codes)
+        size = len(row_codes)
+        columns = {
+            name: _sum_by(row_ids, values[code_ids], size)
+            for name, values in (("opening", opening_net), ("debit", debit), ("credit", credit), ("closing", closing_net))
+        }
+        opening_columns = self._split(columns["opening"])
+        closing_columns = self._split(columns["closing"])
+        parents = {code[:length] for code in frame.codes for length in ROLLUP_LENGTHS if len(code) > length}
+
+        rows = []
+        for index, code in enumerate(row_codes):
+            if account_prefix and not code.startswith(account_prefix):
+                continue
+            if max_length and len(code) > max_length:
+                continue
+            values = (
+                opening_columns[0][index], opening_columns[1][index], columns["debit"][index],
+                columns["credit"][index], closing_columns[0][index], closing_columns[1][index]
+            )
+            if not any(values):
+                continue
+            rows.append(TrialBalanceRow(
+                account_code=code,
+                is_rollup=code in parents,
+                opening_debit=int(values[0]),
+                opening_credit=int(values[1]),
+                debit=int(values[2]),
+                credit=int(values[3]),
+                closing_debit=int(values[4]),
+                closing_credit=int(values[5])
+            ))
+
+        # Tổng cộng trên các tài khoản chi tiết - mỗi dòng bút toán được tính đúng một lần
+        opening_split = self._split(opening_net)
+        closing_split = self._split(closing_net)
+        totals = TrialBalanceRow(
+            account_code="TOTAL",
+            is_rollup=True,
+            opening_debit=int(opening_split[0].sum()),
+            opening_credit=int(opening_split[1].sum()),
+            debit=int(debit.sum()),
+            credit=int(credit.sum()),
+            closing_debit=int(closing_split[0].sum()),
+            closing_credit=int(closing_split[1].sum())
+        )
+        return TrialBalance(
+            from_date=from_date,
+            to_date=to_date,
+            rows=rows,
+            totals=totals,
+            line_count=int(in_range.sum())
+        )
+
+    async def get_trial_balance(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        account_prefix: Optional[str] = None,
+        max_length: Optional[int] = None
+    ) -> TrialBalance:
+        """Bảng cân đối số phát sinh for [from_date, to_date], with level-1/level-2 rollup rows"""
+        return await run_db(self._trial_balance, from_date, to_date, account_prefix, max_length)
+
+    # ----- Account detail -----
+
+    def _account_detail(self, account_code: str, from_date: datetime, to_date: datetime) -> AccountDetail:
+        frame, opening_debit, opening_credit, in_range = self._load(from_date, to_date)
+
+        # Tài khoản con cũng thuộc tài khoản được chọn (111 gồm 1111, 1112)
+        matches = np.asarray([code.startswith(account_code) for code in frame.codes], dtype=bool)
+        opening_balance = int((opening_debit - opening_credit)[matches].sum()) if len(matches) else 0
+        if not len(frame):
+            return AccountDetail(
+                account_code=account_code, from_date=from_date, to_date=to_date,
+                opening_balance=opening_balance, debit=0, credit=0, closing_balance=opening_balance, lines=[]
+            )
+
+        debit_side = matches[frame.debit_id] & in_range
+        credit_side = matches[frame.credit_id] & in_range
+        selected = np.flatnonzero(debit_side | credit_side)
+        debit = np.where(debit_side, frame.amount, 0)[selected]
+        credit = np.where(credit_side, frame.amount, 0)[selected]
+        balance = opening_balance + np.cumsum(debit - credit)
+
+        lines = []
+        for position, index in enumerate(selected.tolist()):
+            entry = frame.entries[frame.entry_id[index]]
+            own, counter = (frame.debit_id[index], frame.credit_id[index]) if debit_side[index] else (frame.credit_id[index], frame.debit_id[index])
+            lines.append(AccountDetailLine(
+                voucher_date=entry["voucher_date"],
+                source=entry["source"],
+                voucher_id=entry["voucher_id"],
+                voucher_no=entry.get("voucher_no"),
+                description=frame.descriptions[index] or entry.get("description"),
+                account_code=frame.codes[own],
+                counter_account=frame.codes[counter],
+                debit=int(debit[position]),
+                credit=int(credit[position]),
+                balance=int(balance[position])
+            ))
+
+        total_debit = int(debit.sum())
+        total_credit = int(credit.sum())
+        return AccountDetail(
+            account_code=account_code,
+            from_date=from_date,
+            to_date=to_date,
+            opening_balance=opening_balance,
+            debit=total_debit,
+            credit=total_credit,
+            closing_balance=opening_balance + total_debit - total_credit,
+            lines=lines
+        )
+
+    async def get_account_detail(self, account_code: str, from_date: datetime, to_date: datetime) -> AccountDetail:
+        """Sổ chi tiết tài khoản: opening balance, every journal line touching the account, running balance"""
+        return await run_db(self._account_detail, account_code, from_date, to_date)
@@ -0,0 +1,213 @@
+"""
+Daily Statistics Rollup - Tổng hợp thống kê phiếu theo ngày
+
+Mỗi ngày có một document {collection}/{YYYY-MM-DD} chứa các bucket theo
+loại phiếu và trạng thái:
+
+    buckets.RECEIPT.POSTED = {"count": 12, "grand_total": 15000000, ...}
+
+Document được cập nhật bằng Increment trong cùng batch/transaction với lệnh
+ghi phiếu, nên thống kê chỉ cần gộp O(số ngày) document thay vì đọc O(số phiếu).
+Các ngày chỉ nằm một phần trong khoảng lọc được tính lại từ phiếu gốc.
+"""
+from datetime import datetime, date, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from google.cloud.firestore import FieldFilter, Increment
+
+from ..config.database import as_utc, commit_batch
+from ..config.metrics import record_datastore
+from ..config.settings import settings
+
+# {voucher_type: {status: {"count": n, "<amount_field>": x}}}
+Buckets = Dict[str, Dict[str, Dict[str, float]]]
+
+# Firestore giới hạn 500 lệnh ghi trong một WriteBatch
+MAX_BATCH_WRITES = 500
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def _value(value):
+    """Enum -> raw value"""
+    return getattr(value, "value", value)
+
+
+def merge_buckets(target: Buckets, source: Buckets) -> Buckets:
+    """Add source buckets into target (in place)"""
+    for voucher_type, statuses in source.items():
+        for status, values in statuses.items():
+            bucket = target.setdefault(voucher_type, {}).setdefault(status, {})
+            for key, amount in values.items():
+                bucket[key] = bucket.get(key, 0) + amount
+    return target
+
+
+def merge_deltas(target: Dict[str, Buckets], source: Dict[str, Buckets]) -> Dict[str, Buckets]:
+    """Add per-day deltas into target (in place)"""
+    for day, buckets in source.items():
+        merge_buckets(target.setdefault(day, {}), buckets)
+    return target
+
+
+class DailyStatsRollup:
+
+    def __init__(self, db, collection: str, amount_fields: Iterable[str]):
+        self.db = db
+        self.collection = collection
+        self.amount_fields = tuple(amount_fields)
+        self.tz = timezone(timedelta(hours=settings.stats_timezone_offset_hours))
+
+    def _get_collection(self):
+        return self.db.collection(self.collection)
+
+    # ----- Day boundaries -----
+
+    def _localize(self, value: datetime) -> datetime:
+        return as_utc(value).astimezone(self.tz)
+
+    def day_key(self, value: datetime) -> str:
+        return self._localize(value).date().isoformat()
+
+    def _day_start(self, day: date) -> datetime:
+        return datetime.combine(day, time.min, tzinfo=self.tz)
+
+    def split_range(
+        self,
+        from_date: Optional[datetime],
+        to_date: Optional[datetime]
+    ) -> Tuple[Optional[Tuple[Optional[str], Optional[str]]], List[Tuple[datetime, datetime]]]:
+        """
+        Split [from_date, to_date] into fully covered days (served by rollups)
+        and partial ranges at the edges (served by raw vouchers).
+
+        Returns (full_days, partial_ranges); full_days is (first_day, last_day)
+        with None meaning unbounded, or None when no day is fully covered.
+        """
+        start = self._localize(from_date) if from_date else None
+        end = self._localize(to_date) if to_date else None
+        if start and end and start > end:
+            return None, []
+
+        one_day = timedelta(days=1)
+        head_partial = start is not None and start != self._day_start(start.date())
+        tail_partial = end is not None and end != self._day_start(end.date() + one_day) - ONE_MICROSECOND
+
+        first_day: Optional[date] = (start.date() + one_day if head_partial else start.date()) if start else None
+        last_day: Optional[date] = (end.date() - one_day if tail_partial else end.date()) if end else None
+
+        partial: List[Tuple[datetime, datetime]] = []
+        if head_partial:
+            head_end = self._day_start(first_day) - ONE_MICROSECOND
+            partial.append((start, min(end, head_end) if end else head_end))
+        if tail_partial:
+            tail_start = self._day_start(last_day + one_day)
+            # from_date và to_date cùng một ngày: khoảng đầu đã bao trọn [from_date, to_date]
+            if not head_partial or tail_start > partial[0][1]:
+                partial.append((max(start, tail_start) if start else tail_start, end))
+
+        if first_day and last_day and first_day > last_day:
+            return None, partial
+
+        return (
+            first_day.isoformat() if first_day else None,
+            last_day.isoformat() if last_day else None
+        ), partial
+
+    # ----- Deltas -----
+
+    def accumulate(self, buckets: Buckets, data: dict, sign: int = 1) -> Buckets:
+        """Add one raw voucher's contribution into flat buckets"""
+        bucket = buckets.setdefault(_value(data.get("voucher_type")), {}).setdefault(_value(data.get("status")), {})
+        bucket["count"] = bucket.get("count", 0) + sign
+        for field in self.amount_fields:
+            bucket[field] = bucket.get(field, 0) + sign * float(data.get(field) or 0)
+        return buckets
+
+    def deltas(self, before: Optional[dict], after: Optional[dict]) -> Dict[str, Buckets]:
+        """Per-day bucket changes for a voucher going from `before` to `after`"""
+        result: Dict[str, Buckets] = {}
+        for data, sign in ((before, -1), (after, 1)):
+            if data:
+                self.accumulate(result.setdefault(self.day_key(data["voucher_date"]), {}), data, sign)
+
+        # Bỏ các giá trị không đổi (ví dụ cập nhật không đổi ngày/trạng thái/số tiền)
+        for day in list(result):
+            for voucher_type in list(result[day]):
+                for status in list(result[day][voucher_type]):
+                    values = {k: v for k, v in result[day][voucher_type][status].items() if v}
+                    if values:
+                        result[day][voucher_type][status] = values
+                    else:
+                        del result[day][voucher_type][status]
+                if not result[day][voucher_type]:
+                    del result[day][voucher_type]
+            if not result[day]:
+                del result[day]
+        return result
+
+    def apply(self, writer, deltas: Dict[str, Buckets]):
+        """Queue rollup increments on a WriteBatch or Transaction"""
+        now = datetime.now()
+        for day, buckets in deltas.items():
+            increments = {
+                voucher_type: {
+                    status: {key: Increment(amount) for key, amount in values.items()}
+                    for status, values in statuses.items()
+                }
+                for voucher_type, statuses in buckets.items()
+            }
+            writer.set(
+                self._get_collection().document(day),
+                {"day": day, "buckets": increments, "updated_at": now},
+                merge=True
+            )
+
+    # ----- Reads (blocking - run via run_db) -----
+
+    def fetch_buckets(self, first_day: Optional[str], last_day: Optional[str]) -> Buckets:
+        """Merge rollup documents for days in [first_day, last_day]"""
+        query = self._get_collection()
+        if first_day:
+            query = query.where(filter=FieldFilter("day", ">=", first_day))
+        if last_day:
+            query = query.where(filter=FieldFilter("day", "<=", last_day))
+
+        buckets: Buckets = {}
+        streamed = 0
+        for doc in query.stream():
+            merge_buckets(buckets, (doc.to_dict() or {}).get("buckets", {}))
+            streamed += 1
+        record_datastore(streamed=streamed)
+        return buckets
+
+    def rebuild(self, voucher_collection) -> dict:
+        """
+        Regenerate every rollup document from raw vouchers.
+        Run during maintenance - writes made while rebuilding may be lost.
+        """
+        fields = ["voucher_date", "voucher_type", "status", *self.amount_fields]
+        by_day: Dict[str, Buckets] = {}
+        voucher_count = 0
+        for doc in voucher_collection.select(fields).stream():
+            data = doc.to_dict() or {}
+            if not data.get("voucher_date"):
+                continue
+            self.accumulate(by_day.setdefault(self.day_key(data["voucher_date"]), {}), data)
+            voucher_count += 1
+
+        now = datetime.now()
+        writes = [("delete", doc.reference, None) for doc in self._get_collection().select([]).stream()
+                  if doc.id not in by_day]
+        writes += [("set", self._get_collection().document(day), {"day": day, "buckets": buckets, "updated_at": now})
+                   for day, buckets in by_day.items()]
+
+        for i in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for op, ref, data in writes[i:i + MAX_BATCH_WRITES]:
+                if op == "delete":
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, data)
+            commit_batch(batch)
+
+        return {"collection": self.collection, "days": len(by_day), "vouchers": voucher_count}
@@ -0,0 +1,242 @@
+"""
+Voucher Cache - Cache đọc phiếu (read-through) cho get_by_id
+
+VoucherCache giữ các CashVoucher / WarehouseVoucher đã hydrate, có giới hạn số
+phần tử (LRU) và thời gian sống (TTL). Service ghi phiếu sẽ cập nhật hoặc xóa
+phần tử tương ứng. Backend có thể thay thế:
+
+- memory: cache trong tiến trình (mỗi worker một cache)
+- shared: một tiến trình cache cục bộ dùng chung cho nhiều worker
+  (python manage.py cache-server), kết nối qua multiprocessing.managers
+- none: tắt cache
+"""
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+from typing import Any, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+from ..config.settings import settings
+
+M = TypeVar("M", bound=BaseModel)
+
+
+class CacheBackend:
+    """Giao diện backend cache - key là chuỗi, value do VoucherCache quyết định"""
+    name = "base"
+    # True: lưu trực tiếp object Python; False: lưu chuỗi JSON (qua tiến trình khác)
+    stores_objects = True
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class NullCacheBackend(CacheBackend):
+    name = "none"
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCacheBackend(CacheBackend):
+    """In-process LRU cache with per-entry TTL"""
+    name = "memory"
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+        }
+
+
+class _CacheManager(BaseManager):
+    pass
+
+
+class SharedCacheBackend(CacheBackend):
+    """Client of the shared cache process started by `python manage.py cache-server`"""
+    name = "shared"
+    stores_objects = False
+
+    def __init__(self, address: str, authkey: str):
+        host, port = address.rsplit(":", 1)
+        _CacheManager.register("get_cache")
+        manager = _CacheManager(address=(host, int(port)), authkey=authkey.encode("utf-8"))
+        manager.connect()
+        self._remote = manager.get_cache()
+        self.address = address
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._remote.get(key)
+
+    def set(self, key: str, value: Any):
+        self._remote.set(key, value)
+
+    def delete(self, key: str):
+        self._remote.delete(key)
+
+    def clear(self):
+        self._remote.clear()
+
+    def stats(self) -> dict:
+        return {"address": self.address, **self._remote.stats()}
+
+
+def serve_shared_cache(address: str, authkey: str, max_entries: int, ttl_seconds: float):
+    """Run the shared cache process (blocking)"""
+    host, port = address.rsplit(":", 1)
+    backend = LRUCacheBackend(max_entries, ttl_seconds)
+    _CacheManager.register("get_cache", callable=lambda: backend)
+    manager = _CacheManager(address=(host, int(port)), authkey=authkey.encode("utf-8"))
+    print(f"✅ Shared voucher cache listening on {address} (max {max_entries} entries, TTL {ttl_seconds}s)")
+    manager.get_server().serve_forever()
+
+
+class VoucherCache:
+    """Read-through cache of hydrated voucher models, keyed by collection and ID"""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "invalidations": 0,
+            "errors": 0,
+        }
+
+    @staticmethod
+    def _key(collection: str, voucher_id: str) -> str:
+        return f"{collection}:{voucher_id}"
+
+    def get(self, collection: str, voucher_id: str, model: Type[M]) -> Optional[M]:
+        try:
+            value = self.backend.get(self._key(collection, voucher_id))
+        except Exception:
+            # Cache lỗi không được làm hỏng request - coi như miss
+            self._stats["errors"] += 1
+            value = None
+
+        if value is None:
+            self._stats["misses"] += 1
+            return None
+
+        self._stats["hits"] += 1
+        return value if self.backend.stores_objects else model.model_validate_json(value)
+
+    def set(self, collection: str, voucher: BaseModel):
+        value = voucher if self.backend.stores_objects else voucher.model_dump_json()
+        try:
+            self.backend.set(self._key(collection, voucher.id), value)
+            self._stats["sets"] += 1
+        except Exception:
+            self._stats["errors"] += 1
+
+    def invalidate(self, collection: str, voucher_id: str):
+        try:
+            self.backend.delete(self._key(collection, voucher_id))
+            self._stats["invalidations"] += 1
+        except Exception:
+            self._stats["errors"] += 1
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        try:
+            backend_stats = self.backend.stats()
+        except Exception:
+            backend_stats = {"error": "unreachable"}
+        return {
+            "backend": self.backend.name,
+            **self._stats,
+            "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            **backend_stats,
+        }
+
+
+def _create_backend() -> CacheBackend:
+    backend = settings.voucher_cache_backend.lower()
+    if backend == "none":
+        return NullCacheBackend()
+    if backend == "shared":
+        try:
+            return SharedCacheBackend(settings.voucher_cache_address, settings.voucher_cache_authkey)
+        except Exception as e:
+            print(f"⚠️ Shared voucher cache at {settings.voucher_cache_address} unavailable ({e}), using in-process cache")
+    return LRUCacheBackend(settings.voucher_cache_max_entries, settings.voucher_cache_ttl_seconds)
+
+
+_voucher_cache: Optional[VoucherCache] = None
+
+
+def get_voucher_cache() -> VoucherCache:
+    """Shared voucher cache for all voucher services in this worker"""
+    global _voucher_cache
+    if _voucher_cache is None:
+        _voucher_cache = VoucherCache(_create_backend())
+    return _voucher_cache
@@ -0,0 +1,233 @@
+"""
+Voucher Events - luồng thay đổi phiếu cho client (Server-Sent Events)
+
+Mỗi lệnh tạo / sửa / ghi sổ / hủy / xóa phiếu ghi thêm (cùng batch / transaction) một
+document vào `voucher_changes`. Khi có client nghe GET /api/vouchers/stream, mỗi worker giữ
+một snapshot listener duy nhất trên collection này và phân phát sự kiện tới mọi client theo
+bộ lọc của từng client, nên client không cần poll danh sách phiếu.
+
+Document thay đổi có `expire_at` (VOUCHER_CHANGE_RETENTION_HOURS) để đặt TTL policy trên Firestore
+(SQLite: manage.py purge-expired). Listener chỉ nghe thay đổi từ lúc mở; khi đã giữ quá
+VOUCHER_STREAM_LISTENER_MAX_CHANGES document, phần lớn cũ hơn RESTART_OVERLAP, hub mở listener
+mới từ thay đổi gần nhất (lùi RESTART_OVERLAP để không sót thay đổi commit chậm) rồi đóng
+listener cũ, nên kết quả query không tăng mãi.
+"""
+import asyncio
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from google.cloud.firestore import FieldFilter
+
+from ..config.database import get_db
+from ..config.settings import settings
+
+CHANGES_COLLECTION = "voucher_changes"
+EVENT_FIELDS = ("id", "voucher_no", "voucher_type", "status", "voucher_date", "warehouse_code")
+# `at` được lấy trước khi commit: listener mới nghe lùi lại khoảng này, thay đổi đã phát bị bỏ qua theo id
+RESTART_OVERLAP = timedelta(minutes=1)
+
+
+def change_event(before: Optional[dict], after: Optional[dict]) -> str:
+    """created | updated | posted | cancelled | deleted"""
+    if before is None:
+        return "created"
+    if after is None:
+        return "deleted"
+    if after.get("status") != before.get("status"):
+        return after.get("status", "").lower() or "updated"
+    return "updated"
+
+
+class VoucherChangeLog:
+    """Writes change documents together with voucher writes (WriteBatch or Transaction)"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _get_collection(self):
+        return self.db.collection(CHANGES_COLLECTION)
+
+    def record(self, writer, source: str, event: str, vouchers: List[dict]):
+        now = datetime.now()
+        writer.set(self._get_collection().document(), {
+            "source": source,
+            "event": event,
+            "vouchers": [{field: voucher.get(field) for field in EVENT_FIELDS if field in voucher} for voucher in vouchers],
+            "at": now,
+            "expire_at": now + timedelta(hours=settings.voucher_change_retention_hours)
+        })
+
+    def apply(self, writer, source: str, before: Optional[dict], after: Optional[dict]):
+        """One change document for a single voucher write (no reads)"""
+        self.record(writer, source, change_event(before, after), [after or before])
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class VoucherSubscription:
+    """One SSE client: filtered events queued by the hub, None once the client fell too far behind"""
+
+    def __init__(self, source: Optional[str], voucher_type: Optional[str], warehouse_code: Optional[str]):
+        self.source = source
+        self.voucher_type = voucher_type
+        self.warehouse_code = warehouse_code
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.voucher_stream_queue_size)
+        self.overflowed = False
+
+    def matches(self, event: dict) -> bool:
+        return (
+            (self.source is None or event["source"] == self.source)
+            and (self.voucher_type is None or event.get("voucher_type") == self.voucher_type)
+            and (self.warehouse_code is None or event.get("warehouse_code") == self.warehouse_code)
+        )
+
+    def push(self, event: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Client quá chậm: báo reset để client tải lại danh sách
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self) -> Optional[dict]:
+        return await self.queue.get()
+
+
+class VoucherEventHub:
+    """Per-worker fan-out of voucher_changes to SSE subscribers through one snapshot listener"""
+
+    def __init__(self, db):
+        self.db = db
+        self._subscribers: Set[VoucherSubscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._watch = None
+        self._seen: Dict[str, datetime] = {}
+        self._restarting = False
+        self._lock = threading.Lock()
+        self._stats = {"listener_starts": 0, "changes": 0, "events": 0, "overflows": 0}
+
+    def subscribe(
+        self,
+        source: Optional[str] = None,
+        voucher_type: Optional[str] = None,
+        warehouse_code: Optional[str] = None
+    ) -> VoucherSubscription:
+        """Register a subscriber (call from the event loop); starts the listener for the first one"""
+        subscription = VoucherSubscription(source, voucher_type, warehouse_code)
+        self._loop = asyncio.get_running_loop()
+        self._subscribers.add(subscription)
+        with self._lock:
+            if self._watch is None:
+                self._seen = {}
+                self._start(datetime.now())
+        return subscription
+
+    def _start(self, since: datetime):
+        # Gọi khi giữ self._lock
+        query = self.db.collection(CHANGES_COLLECTION).where(filter=FieldFilter("at", ">=", since))
+        self._watch = query.on_snapshot(self._on_snapshot)
+        self._stats["listener_starts"] += 1
+
+    def _restart(self):
+        """Event loop: re-anchor the listener at the latest change so its result set stays small"""
+        with self._lock:
+            self._restarting = False
+            watch = self._watch
+            if watch is None or not self._seen:
+                return
+            since = max(self._seen.values()) - RESTART_OVERLAP
+            self._seen = {doc_id: at for doc_id, at in self._seen.items() if at >= since}
+            self._start(since)
+        watch.unsubscribe()
+
+    def unsubscribe(self, subscription: VoucherSubscription):
+        """Remove a subscriber; the listener stops with the last one"""
+        self._subscribers.discard(subscription)
+        if subscription.overflowed:
+            self._stats["overflows"] += 1
+        if not self._subscribers:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            watch, self._watch = self._watch, None
+            self._seen = {}
+        if watch is not None:
+            watch.unsubscribe()
+
+    def _on_snapshot(self, docs, changes, read_time):
+        """Listener thread: turn added change documents into events, dispatch on the event loop"""
+        added = []
+        with self._lock:
+            for change in changes:
+                # Listener mới gửi lại các thay đổi trong khoảng lùi - đã phát thì bỏ qua
+                if change.type.name != "ADDED" or change.document.id in self._seen:
+                    continue
+                data = change.document.to_dict() or {}
+                self._seen[change.document.id] = data.get("at")
+                added.append(data)
+            restart = False
+            limit = settings.voucher_stream_listener_max_changes
+            if len(docs) > limit and self._seen and not self._restarting and self._loop is not None:
+                # Chỉ mở lại khi phần lớn kết quả nằm ngoài khoảng lùi, nếu không listener mới cũng lớn như cũ
+                since = max(self._seen.values()) - RESTART_OVERLAP
+                restart = self._restarting = sum(1 for at in self._seen.values() if at < since) > limit // 2
+        added.sort(key=lambda data: data.get("at") or datetime.min)
+        if restart:
+            try:
+                self._loop.call_soon_threadsafe(self._restart)
+            except RuntimeError:
+                pass  # Event loop đã đóng (worker đang tắt)
+        events = []
+        for data in added:
+            for voucher in data.get("vouchers") or []:
+                events.append({
+                    "event": data.get("event"),
+                    "source": data.get("source"),
+                    "at": _json_value(data.get("at")),
+                    **{field: _json_value(value) for field, value in voucher.items()}
+                })
+        if not events or self._loop is None:
+            return
+        self._stats["changes"] += len(added)
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, events)
+        except RuntimeError:
+            pass  # Event loop đã đóng (worker đang tắt)
+
+    def _dispatch(self, events: List[dict]):
+        for event in events:
+            for subscription in list(self._subscribers):
+                if subscription.matches(event):
+                    subscription.push(event)
+                    self._stats["events"] += 1
+
+    def get_stats(self) -> dict:
+        return {"subscribers": len(self._subscribers), "listening": self._watch is not None, **self._stats}
+
+
+_voucher_event_hub: Optional[VoucherEventHub] = None
+
+
+def get_voucher_event_hub() -> VoucherEventHub:
+    """Shared change listener for all SSE clients of this worker"""
+    global _voucher_event_hub
+    if _voucher_event_hub is None:
+        _voucher_event_hub = VoucherEventHub(get_db())
+    return _voucher_event_hub
+
+
+def _reset_after_fork():
+    # Listener thread không tồn tại trong process con
+    global _voucher_event_hub
+    _voucher_event_hub = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
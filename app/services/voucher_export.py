@@ -0,0 +1,67 @@
+"""
+Voucher Export - Xuất phiếu dạng NDJSON / CSV theo luồng
+
+Dữ liệu được đọc từng trang bằng cursor Firestore và ghi ra ngay, nên bộ nhớ
+chỉ phụ thuộc vào kích thước một trang, không phụ thuộc vào khoảng thời gian xuất.
+"""
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, List, Sequence
+
+from pydantic import BaseModel
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return getattr(value, "value", value)
+
+
+async def export_chunks(
+    pages: AsyncIterator[List[BaseModel]],
+    export_format: str,
+    layout: str,
+    header_fields: Sequence[str],
+    line_fields: Sequence[str]
+) -> AsyncIterator[str]:
+    """
+    Yield one text chunk per page of vouchers.
+
+    - ndjson: one voucher (with lines) per line
+    - csv, layout=header: one row per voucher
+    - csv, layout=lines: one row per voucher line, header columns repeated
+    """
+    if export_format == "ndjson":
+        async for page in pages:
+            yield "".join(voucher.model_dump_json() + "\n" for voucher in page)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # BOM để Excel nhận đúng UTF-8 (tiếng Việt)
+    columns = list(header_fields)
+    if layout == "lines":
+        columns += [f"line_{field}" for field in line_fields]
+    writer.writerow(columns)
+    yield "﻿" + buffer.getvalue()
+
+    async for page in pages:
+        buffer.seek(0)
+        buffer.truncate()
+        for voucher in page:
+            header = [_csv_value(getattr(voucher, field)) for field in header_fields]
+            if layout == "lines":
+                for line in voucher.lines:
+                    writer.writerow(header + [_csv_value(getattr(line, field)) for field in line_fields])
+            else:
+                writer.writerow(header)
+        yield buffer.getvalue()
@@ -0,0 +1,142 @@
+"""
+Voucher Line Chunks - lưu dòng của phiếu lớn thành nhiều document con
+
+Phiếu có nhiều hơn VOUCHER_LINE_CHUNK_THRESHOLD dòng (kiểm kê, nhập hàng lớn) không giữ
+dòng trong document phiếu (giới hạn 1 MiB của Firestore): các dòng được chia thành từng khối
+VOUCHER_LINE_CHUNK_SIZE dòng, lưu ở `<collection>_line_chunks/<voucher_id>_<index>`.
+Document phiếu giữ `lines: []`, `line_count`, `line_chunks`, `line_chunk_size` và các tổng.
+Vị trí dòng trong khối luôn tính theo `line_chunk_size` lưu trên phiếu, nên đổi
+VOUCHER_LINE_CHUNK_SIZE chỉ áp dụng cho phiếu ghi sau đó.
+
+- Đọc phiếu / danh sách chỉ tải document phiếu; dòng đọc theo trang bằng read_range()
+- Ghi sổ / hủy / sửa nạp đủ dòng bằng load() trong transaction; plan() chỉ ghi lại các
+  khối có dòng thay đổi
+"""
+from typing import List, Optional, Sequence, Tuple
+
+from ..config.metrics import record_datastore
+from ..config.settings import settings
+
+
+class VoucherLineChunks:
+
+    def __init__(self, db, voucher_collection: str):
+        self.db = db
+        self.collection_name = f"{voucher_collection}_line_chunks"
+        self.threshold = settings.voucher_line_chunk_threshold
+        self.chunk_size = settings.voucher_line_chunk_size
+
+    def _get_collection(self):
+        return self.db.collection(self.collection_name)
+
+    @staticmethod
+    def chunk_id(voucher_id: str, index: int) -> str:
+        return f"{voucher_id}_{index:05d}"
+
+    def chunk_ref(self, voucher_id: str, index: int):
+        return self._get_collection().document(self.chunk_id(voucher_id, index))
+
+    @staticmethod
+    def is_chunked(voucher: Optional[dict]) -> bool:
+        return bool(voucher and voucher.get("line_chunks"))
+
+    def size_of(self, voucher: Optional[dict]) -> int:
+        """Chunk size a voucher was stored with (phiếu tách trước khi lưu line_chunk_size: cấu hình hiện tại)"""
+        return (voucher or {}).get("line_chunk_size") or self.chunk_size
+
+    def split(self, lines: List[dict], chunk_size: Optional[int] = None) -> List[List[dict]]:
+        """Chunks for a line list ([] when the lines stay inline)"""
+        if len(lines) <= self.threshold:
+            return []
+        chunk_size = chunk_size or self.chunk_size
+        return [lines[i:i + chunk_size] for i in range(0, len(lines), chunk_size)]
+
+    def chunk_count(self, line_count: int) -> int:
+        return 0 if line_count <= self.threshold else -(-line_count // self.chunk_size)
+
+    def plan(self, voucher_id: str, lines: List[dict], before: Optional[dict] = None) -> Tuple[dict, List[tuple]]:
+        """
+        Storage of a new line list: (voucher fields, chunk writes).
+
+        before is the current voucher with its full lines (load()), None for a new voucher.
+        Only chunks whose lines differ from before are written; surplus chunks are deleted.
+        """
+        chunks = self.split(lines)
+        fields = {
+            "lines": [] if chunks else lines,
+            "line_count": len(lines),
+            "line_chunks": len(chunks),
+            "line_chunk_size": self.chunk_size if chunks else None
+        }
+
+        # Khối đang lưu, theo kích thước lúc ghi
+        previous = self.split(before.get("lines") or [], self.size_of(before)) if self.is_chunked(before) else []
+        writes: List[tuple] = []
+        for index, chunk in enumerate(chunks):
+            if index >= len(previous) or previous[index] != chunk:
+                writes.append((
+                    "set",
+                    self.chunk_ref(voucher_id, index),
+                    {"voucher_id": voucher_id, "index": index, "lines": chunk}
+                ))
+        for index in range(len(chunks), (before or {}).get("line_chunks") or 0):
+            writes.append(("delete", self.chunk_ref(voucher_id, index), None))
+        return fields, writes
+
+    @staticmethod
+    def apply(writer, writes: List[tuple]):
+        """Queue the chunk writes computed by plan() on a WriteBatch or Transaction"""
+        for op, ref, data in writes:
+            if op == "delete":
+                writer.delete(ref)
+            else:
+                writer.set(ref, data)
+
+    def _read_chunks(self, voucher_id: str, indexes: Sequence[int], transaction=None) -> List[List[dict]]:
+        refs = [self.chunk_ref(voucher_id, index) for index in indexes]
+        if not refs:
+            return []
+        snapshots = transaction.get_all(refs) if transaction is not None else self.db.get_all(refs)
+        found = {snapshot.id: (snapshot.to_dict() or {}).get("lines") or [] for snapshot in snapshots if snapshot.exists}
+        record_datastore(reads=len(refs))
+        return [found.get(ref.id, []) for ref in refs]
+
+    def load(self, voucher: Optional[dict], transaction=None) -> Optional[dict]:
+        """Voucher with its full line list - chunks are read when stored chunked (blocking)"""
+        if not self.is_chunked(voucher):
+            return voucher
+        chunks = self._read_chunks(voucher["id"], range(voucher["line_chunks"]), transaction)
+        return {**voucher, "lines": [line for chunk in chunks for line in chunk]}
+
+    def replace_line(self, voucher: dict, index: int, line: dict, transaction=None) -> Tuple[dict, dict, List[tuple]]:
+        """
+        Replace line `index` (0-based): (previous line, voucher fields, chunk writes).
+        A chunked voucher reads and rewrites only the chunk holding the line.
+        """
+        if not self.is_chunked(voucher):
+            lines = list(voucher.get("lines") or [])
+            previous, lines[index] = lines[index], line
+            return previous, {"lines": lines}, []
+
+        chunk_index, position = divmod(index, self.size_of(voucher))
+        lines = list(self._read_chunks(voucher["id"], [chunk_index], transaction)[0])
+        previous, lines[position] = lines[position], line
+        data = {"voucher_id": voucher["id"], "index": chunk_index, "lines": lines}
+        return previous, {}, [("set", self.chunk_ref(voucher["id"], chunk_index), data)]
+
+    def read_range(self, voucher: dict, offset: int, limit: int) -> List[dict]:
+        """Lines [offset, offset + limit) of a chunked voucher, reading only the chunks they fall in (blocking)"""
+        chunk_size = self.size_of(voucher)
+        first = offset // chunk_size
+        last = min((offset + limit - 1) // chunk_size, voucher["line_chunks"] - 1)
+        if limit <= 0 or first > last:
+            return []
+        chunks = self._read_chunks(voucher["id"], range(first, last + 1))
+        lines = [line for chunk in chunks for line in chunk]
+        start = offset - first * chunk_size
+        return lines[start:start + limit]
+
+    @staticmethod
+    def stored(voucher: dict) -> dict:
+        """Voucher as kept in its document (chunked lines left out)"""
+        return {**voucher, "lines": []} if voucher.get("line_chunks") else voucher
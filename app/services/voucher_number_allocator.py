@@ -0,0 +1,204 @@
+"""
+Voucher Number Allocator - Cấp số phiếu PT/PC/PNK/PXK
+
+Mỗi worker giữ trước (lease) một block số liên tiếp của bộ đếm
+counters/{prefix}{year} trong một transaction, sau đó cấp số từ bộ nhớ.
+Bộ đếm chỉ tăng nên không bao giờ cấp trùng số; các số đã giữ nhưng không
+dùng (tắt worker, sang năm mới, ghi phiếu lỗi) được ghi lại vào counter_gaps.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from ..config.settings import settings
+from ..config.database import get_db, run_transaction
+from ..config.executor import run_db
+from ..config.metrics import record_counter_lock_wait, record_counter_reserve, record_datastore
+
+
+class VoucherNumberAllocator:
+    COUNTER_COLLECTION = "counters"
+    GAP_COLLECTION = "counter_gaps"
+    NUMBER_WIDTH = 5
+
+    def __init__(self, block_size: Optional[int] = None):
+        self.db = get_db()
+        self.block_size = max(1, block_size or settings.voucher_no_block_size)
+        # counter_key -> [next_value, last_value] của block đang giữ
+        self._blocks: Dict[str, List[int]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._gaps: List[dict] = []
+        self._stats = {
+            "issued": 0,
+            "blocks_leased": 0,
+            "numbers_leased": 0,
+            "gap_numbers": 0,
+            "lock_waits": 0,
+            "reserve_attempts": 0,
+        }
+
+    @staticmethod
+    def counter_key(prefix: str, year: int) -> str:
+        return f"{prefix}{year}"
+
+    def format_number(self, prefix: str, year: int, value: int) -> str:
+        """PT + 2025 + 00001 -> PT202500001"""
+        return f"{prefix}{year}{str(value).zfill(self.NUMBER_WIDTH)}"
+
+    def parse_number(self, voucher_no: str) -> Optional[Tuple[str, int]]:
+        """PT202500001 -> ("PT2025", 1)"""
+        key, value = voucher_no[:-self.NUMBER_WIDTH], voucher_no[-self.NUMBER_WIDTH:]
+        if not key or not value.isdigit():
+            return None
+        return key, int(value)
+
+    def _lock_for(self, counter_key: str) -> asyncio.Lock:
+        lock = self._locks.get(counter_key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[counter_key] = lock
+        return lock
+
+    def _reserve_range(self, counter_key: str, count: int) -> Tuple[int, int]:
+        """Reserve `count` consecutive values in one transaction (blocking)"""
+        counter_ref = self.db.collection(self.COUNTER_COLLECTION).document(counter_key)
+
+        def _reserve(transaction):
+            # Firestore chạy lại hàm khi transaction tranh chấp với worker khác
+            self._stats["reserve_attempts"] += 1
+            record_counter_reserve(counter_key, committed=False)
+            snapshot = counter_ref.get(transaction=transaction)
+            record_datastore(reads=1)
+            current = (snapshot.to_dict() or {}).get("value", 0) if snapshot.exists else 0
+            transaction.set(counter_ref, {"value": current + count, "updated_at": datetime.now()}, merge=True)
+            return current + 1, current + count
+
+        reserved = run_transaction(_reserve)
+        record_counter_reserve(counter_key, committed=True)
+        return reserved
+
+    async def reserve(self, prefix: str, count: int, year: Optional[int] = None) -> Tuple[int, int, int]:
+        """Reserve a contiguous range directly from the counter: (year, first, last)"""
+        year = year or datetime.now().year
+        first, last = await run_db(self._reserve_range, self.counter_key(prefix, year), count)
+        self._stats["numbers_leased"] += count
+        self._stats["issued"] += count
+        return year, first, last
+
+    async def next_number(self, prefix: str) -> str:
+        """Issue the next voucher number from the in-memory block"""
+        year = datetime.now().year
+        counter_key = self.counter_key(prefix, year)
+
+        lock = self._lock_for(counter_key)
+        # Request khác đang giữ khóa (thường là đang lấy block mới của cùng bộ đếm)
+        contended = lock.locked()
+        wait_started = time.perf_counter()
+        async with lock:
+            if contended:
+                self._stats["lock_waits"] += 1
+                record_counter_lock_wait(counter_key, time.perf_counter() - wait_started)
+            await self._retire_stale_blocks(prefix, year)
+
+            block = self._blocks.get(counter_key)
+            if block is None or block[0] > block[1]:
+                first, last = await run_db(self._reserve_range, counter_key, self.block_size)
+                block = [first, last]
+                self._blocks[counter_key] = block
+                self._stats["blocks_leased"] += 1
+                self._stats["numbers_leased"] += self.block_size
+
+            value = block[0]
+            block[0] += 1
+
+        self._stats["issued"] += 1
+        return self.format_number(prefix, year, value)
+
+    async def _retire_stale_blocks(self, prefix: str, year: int):
+        """Year rollover: remaining numbers of last year's block become gaps"""
+        for key in list(self._blocks):
+            if key.startswith(prefix) and key != self.counter_key(prefix, year) and key[len(prefix):].isdigit():
+                first, last = self._blocks.pop(key)
+                if first <= last:
+                    await self._record_gap(key, first, last, "year_rollover")
+
+    async def report_unused(self, voucher_no: str, reason: str):
+        """Record a number that was issued but never written (failed create)"""
+        parsed = self.parse_number(voucher_no)
+        if parsed:
+            await self._record_gap(parsed[0], parsed[1], parsed[1], reason)
+
+    async def report_unused_numbers(self, voucher_nos: List[str], reason: str):
+        """Record many unused numbers, grouped into consecutive ranges"""
+        values: Dict[str, List[int]] = {}
+        for voucher_no in voucher_nos:
+            parsed = self.parse_number(voucher_no)
+            if parsed:
+                values.setdefault(parsed[0], []).append(parsed[1])
+
+        for counter_key, numbers in values.items():
+            numbers.sort()
+            first = last = numbers[0]
+            for value in numbers[1:]:
+                if value != last + 1:
+                    await self._record_gap(counter_key, first, last, reason)
+                    first = value
+                last = value
+            await self._record_gap(counter_key, first, last, reason)
+
+    async def _record_gap(self, counter_key: str, first: int, last: int, reason: str):
+        gap = {
+            "counter_key": counter_key,
+            "from_value": first,
+            "to_value": last,
+            "count": last - first + 1,
+            "reason": reason,
+            "worker_pid": os.getpid(),
+            "created_at": datetime.now(),
+        }
+        self._gaps.append(gap)
+        self._stats["gap_numbers"] += gap["count"]
+        try:
+            await run_db(self.db.collection(self.GAP_COLLECTION).add, gap)
+        except Exception as e:
+            print(f"⚠️ Could not record voucher number gap {counter_key} {first}-{last}: {e}")
+
+    async def close(self):
+        """Release leased blocks on shutdown - unused numbers are reported as gaps"""
+        for key in list(self._blocks):
+            first, last = self._blocks.pop(key)
+            if first <= last:
+                await self._record_gap(key, first, last, "shutdown")
+
+    def get_stats(self) -> dict:
+        return {
+            **self._stats,
+            "block_size": self.block_size,
+            "blocks": {key: {"next": b[0], "last": b[1]} for key, b in self._blocks.items()},
+            "recent_gaps": [
+                {k: v for k, v in gap.items() if k != "created_at"}
+                for gap in self._gaps[-20:]
+            ],
+        }
+
+
+_allocator: Optional[VoucherNumberAllocator] = None
+
+
+def get_voucher_number_allocator() -> VoucherNumberAllocator:
+    """Shared allocator for all voucher services in this worker"""
+    global _allocator
+    if _allocator is None:
+        _allocator = VoucherNumberAllocator()
+    return _allocator
+
+
+def _reset_after_fork():
+    # Khối số đang giữ và client Firestore thuộc process cha
+    global _allocator
+    _allocator = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,348 @@
+"""
+Voucher Replica - bản sao phiếu gần đây trong bộ nhớ cho danh sách và thống kê
+
+Bật bằng VOUCHER_REPLICA_ENABLED. Mỗi worker giữ một bản sao các phiếu có voucher_date
+từ đầu tháng (VOUCHER_REPLICA_MONTHS - 1) trước đến nay, cập nhật bằng một snapshot listener
+trên collection phiếu. Bản sao có chỉ mục theo voucher_date (danh sách sắp xếp) và theo
+voucher_type / status / warehouse_code, nên danh sách và thống kê trong khoảng này không
+đọc Firestore.
+
+- covered_from: mọi phiếu có voucher_date >= covered_from đều có trong bản sao; truy vấn
+  cần phiếu cũ hơn thì service đọc Firestore như bình thường
+- VOUCHER_REPLICA_MAX_MB (ước lượng) gồm cả bản listener giữ: listener có bản riêng của mọi
+  document trong kết quả query, kể cả phiếu bản sao đã bỏ. Vượt thì bỏ các phiếu cũ nhất và dời
+  covered_from lên; khi phiếu đã bỏ mà listener còn giữ vượt 1/RESTART_FRACTION ngân sách,
+  listener được mở lại từ covered_from mới (đọc lại khoảng giữ lại một lần)
+- Service ghi phiếu cập nhật bản sao ngay sau khi commit (đọc lại thấy ngay trên worker đó);
+  worker khác nhận thay đổi qua listener sau khoảng một giây
+"""
+import bisect
+import os
+import threading
+from datetime import datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import orjson
+from google.cloud.firestore import FieldFilter
+
+from ..config.database import as_utc, get_db
+from ..config.metrics import record_datastore, record_replica_query
+from ..config.settings import settings
+from .pagination import decode_cursor
+from .stats_rollup import Buckets, ONE_MICROSECOND
+
+INDEX_FIELDS = ("voucher_type", "status", "warehouse_code")
+# Bộ nhớ dict Python ≈ 5 lần kích thước JSON của document (đo bằng tracemalloc)
+SIZE_FACTOR = 5
+# Mở lại listener khi phiếu đã bỏ còn trong listener vượt 1/RESTART_FRACTION ngân sách bộ nhớ
+RESTART_FRACTION = 10
+_UTC_MIN = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _value(value):
+    """Enum -> raw value"""
+    return getattr(value, "value", value)
+
+
+def _as_stored(value):
+    """Datetimes (also inside lines) as aware UTC, the shape Firestore returns - local writes carry naive ones"""
+    if isinstance(value, datetime):
+        return as_utc(value).astimezone(timezone.utc)
+    if isinstance(value, dict):
+        return {key: _as_stored(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_as_stored(item) for item in value]
+    return value
+
+
+def _estimate_size(data: dict) -> int:
+    return SIZE_FACTOR * len(orjson.dumps(data, default=str))
+
+
+class VoucherReplica:
+
+    def __init__(self, db, collection: str, months: int, max_bytes: int):
+        self.db = db
+        self.collection = collection
+        self.months = max(1, months)
+        self.max_bytes = max_bytes
+        self.tz = timezone(timedelta(hours=settings.stats_timezone_offset_hours))
+        self.covered_from: Optional[datetime] = None
+        self._docs: Dict[str, dict] = {}
+        self._sizes: Dict[str, int] = {}
+        self._order: List[Tuple[datetime, str]] = []  # (voucher_date UTC, id) tăng dần
+        self._index: Dict[str, Dict[str, set]] = {field: {} for field in INDEX_FIELDS}
+        self._bytes = 0
+        self._stale_bytes = 0  # Phiếu đã bỏ khỏi bản sao nhưng listener vẫn giữ
+        self._ready = False
+        self._watch = None
+        self._restarting = False
+        self._lock = threading.RLock()
+        self._stats = {"listener_starts": 0, "changes": 0, "evictions": 0}
+
+    def _get_collection(self):
+        return self.db.collection(self.collection)
+
+    def _window_start(self) -> datetime:
+        """00:00 (stats timezone) on the first day of the oldest retained month"""
+        today = datetime.now(self.tz).date()
+        month = today.year * 12 + today.month - 1 - (self.months - 1)
+        first_day = today.replace(year=month // 12, month=month % 12 + 1, day=1)
+        return datetime.combine(first_day, time.min, tzinfo=self.tz).astimezone(timezone.utc)
+
+    # ----- Listener -----
+
+    def start(self):
+        """Start the snapshot listener (non-blocking); the replica answers once the first snapshot arrived"""
+        with self._lock:
+            if self._watch is not None:
+                return
+            self.covered_from = self._window_start()
+            self._listen()
+
+    def _listen(self):
+        # Gọi khi giữ self._lock
+        query = self._get_collection().where(filter=FieldFilter("voucher_date", ">=", self.covered_from))
+        self._watch = query.on_snapshot(self._on_snapshot)
+        self._stale_bytes = 0
+        self._stats["listener_starts"] += 1
+
+    def _restart(self):
+        """Narrow the listener query to covered_from so it drops the evicted vouchers"""
+        with self._lock:
+            self._restarting = False
+            watch = self._watch
+            if watch is None:
+                return
+            self._listen()
+        watch.unsubscribe()
+
+    def close(self):
+        with self._lock:
+            watch, self._watch = self._watch, None
+            self._ready = False
+            self._clear()
+        if watch is not None:
+            watch.unsubscribe()
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            if self._watch is None:
+                return
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    self._remove(change.document.id)
+                else:
+                    self._put(change.document.to_dict())
+            self._trim()
+            self._ready = True
+            self._stats["changes"] += len(changes)
+        record_datastore(streamed=len(changes))
+
+    # ----- Local writes (read-your-writes on this worker) -----
+
+    def upsert(self, data: dict):
+        """Apply a committed voucher write"""
+        with self._lock:
+            if self._ready:
+                self._put(data)
+                self._trim()
+
+    def remove(self, voucher_id: str):
+        with self._lock:
+            self._remove(voucher_id)
+
+    # ----- Storage -----
+
+    def _clear(self):
+        self._docs.clear()
+        self._sizes.clear()
+        self._order.clear()
+        self._index = {field: {} for field in INDEX_FIELDS}
+        self._bytes = 0
+        self._stale_bytes = 0
+
+    def _put(self, data: dict):
+        # Trả về giống hệt khi đọc Firestore (body và cursor)
+        data = _as_stored(data)
+        voucher_id = data["id"]
+        current = self._docs.get(voucher_id)
+        # Listener có thể gửi bản cũ hơn bản service vừa ghi
+        if current is not None and as_utc(data.get("updated_at") or _UTC_MIN) < as_utc(current.get("updated_at") or _UTC_MIN):
+            return
+        self._remove(voucher_id)
+        voucher_date = as_utc(data["voucher_date"])
+        if voucher_date < self.covered_from:
+            return
+
+        self._docs[voucher_id] = data
+        self._sizes[voucher_id] = size = _estimate_size(data)
+        self._bytes += size
+        bisect.insort(self._order, (voucher_date, voucher_id))
+        for field in INDEX_FIELDS:
+            value = _value(data.get(field))
+            if value is not None:
+                self._index[field].setdefault(value, set()).add(voucher_id)
+
+    def _remove(self, voucher_id: str):
+        data = self._docs.pop(voucher_id, None)
+        if data is None:
+            return
+        self._bytes -= self._sizes.pop(voucher_id)
+        key = (as_utc(data["voucher_date"]), voucher_id)
+        position = bisect.bisect_left(self._order, key)
+        if position < len(self._order) and self._order[position] == key:
+            del self._order[position]
+        for field in INDEX_FIELDS:
+            ids = self._index[field].get(_value(data.get(field)))
+            if ids is not None:
+                ids.discard(voucher_id)
+                if not ids:
+                    del self._index[field][_value(data.get(field))]
+
+    def _used_bytes(self) -> int:
+        # Bản sao + bản của listener (cùng các phiếu, cộng phiếu đã bỏ cho đến khi listener mở lại)
+        return 2 * self._bytes + self._stale_bytes
+
+    def _trim(self):
+        """Drop vouchers older than the retention window, then the oldest ones while over the memory budget"""
+        cutoff = max(self.covered_from, self._window_start())
+        # Phiếu đã bỏ được giải phóng khi listener mở lại, nên chỉ tính hai bản của phiếu còn giữ
+        while self._order and (self._order[0][0] < cutoff or 2 * self._bytes > self.max_bytes):
+            oldest = self._order[0][0]
+            while self._order and self._order[0][0] <= oldest:
+                voucher_id = self._order[0][1]
+                self._stale_bytes += self._sizes[voucher_id]
+                self._remove(voucher_id)
+                self._stats["evictions"] += 1
+            cutoff = max(cutoff, oldest + ONE_MICROSECOND)
+        self.covered_from = cutoff
+
+        if self._stale_bytes > self.max_bytes // RESTART_FRACTION and self._watch is not None and not self._restarting:
+            # Không mở lại trong thread của listener (unsubscribe chờ chính thread đó)
+            self._restarting = True
+            threading.Thread(target=self._restart, name="voucher-replica-restart", daemon=True).start()
+
+    # ----- Queries -----
+
+    def _covers(self, from_date: Optional[datetime]) -> bool:
+        return from_date is not None and as_utc(from_date) >= self.covered_from
+
+    def _range(self, from_date: Optional[datetime], to_date: Optional[datetime], cursor: Optional[str] = None) -> Tuple[int, int]:
+        """Positions [lo, hi) of _order inside the date range and before the cursor position"""
+        lo = bisect.bisect_left(self._order, (as_utc(from_date),)) if from_date else 0
+        hi = bisect.bisect_left(self._order, (as_utc(to_date) + ONE_MICROSECOND,)) if to_date else len(self._order)
+        if cursor:
+            voucher_date, voucher_id = decode_cursor(cursor)
+            hi = min(hi, bisect.bisect_left(self._order, (as_utc(voucher_date), voucher_id)))
+        return lo, hi
+
+    def _matching_ids(self, equals: Dict[str, object]) -> Optional[set]:
+        """Ids matching every equality filter (None: no filter)"""
+        sets = [self._index[field].get(_value(value), set()) for field, value in equals.items() if value is not None]
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def query(
+        self,
+        from_date: Optional[datetime],
+        to_date: Optional[datetime],
+        cursor: Optional[str],
+        limit: int,
+        fields: Optional[Sequence[str]] = None,
+        **equals
+    ) -> Optional[List[dict]]:
+        """
+        Up to `limit` matching vouchers, newest first (same order as apply_order_and_cursor).
+
+        Returns None when the replica cannot answer exactly: not loaded yet, or fewer than
+        `limit` matches and the range reaches before covered_from. Do not mutate the dicts.
+        """
+        self.start()
+        with self._lock:
+            if not self._ready:
+                record_replica_query(self.collection, False)
+                return None
+            lo, hi = self._range(from_date, to_date, cursor)
+            ids = self._matching_ids(equals)
+            docs = []
+            for position in range(hi - 1, lo - 1, -1):
+                voucher_id = self._order[position][1]
+                if ids is None or voucher_id in ids:
+                    docs.append(self._docs[voucher_id])
+                    if len(docs) == limit:
+                        break
+            hit = len(docs) == limit or self._covers(from_date)
+
+        record_replica_query(self.collection, hit)
+        if not hit:
+            return None
+        if fields is not None:
+            return [{field: data[field] for field in fields if field in data} for data in docs]
+        return docs
+
+    def buckets(self, rollup, from_date: Optional[datetime], to_date: Optional[datetime], **equals) -> Optional[Buckets]:
+        """Statistics buckets of the vouchers in [from_date, to_date], None when the range is not covered"""
+        self.start()
+        buckets: Optional[Buckets] = None
+        with self._lock:
+            hit = self._ready and self._covers(from_date)
+            if hit:
+                lo, hi = self._range(from_date, to_date)
+                ids = self._matching_ids(equals)
+                buckets = {}
+                for _, voucher_id in self._order[lo:hi]:
+                    if ids is None or voucher_id in ids:
+                        rollup.accumulate(buckets, self._docs[voucher_id])
+
+        record_replica_query(self.collection, hit)
+        return buckets
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self._ready,
+                "vouchers": len(self._docs),
+                "estimated_mb": round(self._used_bytes() / (1024 * 1024), 1),
+                "covered_from": self.covered_from.isoformat() if self.covered_from else None,
+                **self._stats
+            }
+
+
+_replicas: Dict[str, VoucherReplica] = {}
+
+
+def get_voucher_replica(collection: str) -> Optional[VoucherReplica]:
+    """Replica of one voucher collection for this worker (None when VOUCHER_REPLICA_ENABLED is off)"""
+    if not settings.voucher_replica_enabled:
+        return None
+    if collection not in _replicas:
+        _replicas[collection] = VoucherReplica(
+            get_db(), collection, settings.voucher_replica_months, settings.voucher_replica_max_mb * 1024 * 1024
+        )
+    return _replicas[collection]
+
+
+def start_voucher_replicas():
+    """Begin loading every replica at startup instead of on the first list / statistics query"""
+    for replica in _replicas.values():
+        replica.start()
+
+
+def close_voucher_replicas():
+    for replica in _replicas.values():
+        replica.close()
+
+
+def get_voucher_replica_stats() -> Dict[str, dict]:
+    return {collection: replica.get_stats() for collection, replica in _replicas.items()}
+
+
+def _reset_after_fork():
+    # Listener thread không tồn tại trong process con
+    _replicas.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,252 @@
+"""
+Voucher Search - tìm phiếu theo từ khóa, không phân biệt dấu tiếng Việt
+
+Mỗi phiếu có một document `voucher_search/<source>_<voucher_id>` ghi cùng batch / transaction
+với phiếu, gồm:
+
+- terms: các tiền tố (>= 2 ký tự) của mọi từ trong số phiếu, tên đối tượng, lý do / diễn giải
+  và tên hàng / diễn giải dòng, đã bỏ dấu ("Nguyễn" -> ng, ngu, nguy, nguye, nguyen)
+- text: nội dung các trường chính đã bỏ dấu, dùng để xếp hạng
+- thông tin chung của phiếu để trả kết quả không cần đọc lại phiếu
+
+Tìm kiếm là một truy vấn Firestore `terms array-contains <từ dài nhất>` theo voucher_date giảm
+dần (index trong firestore.indexes.json), nên chi phí không phụ thuộc số phiếu; các từ còn lại
+được lọc và chấm điểm trên VOUCHER_SEARCH_CANDIDATES phiếu mới nhất khớp từ đó.
+"""
+import re
+import unicodedata
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence
+
+from google.cloud.firestore import FieldFilter, Query
+
+from ..config.database import commit_batch, get_db
+from ..config.executor import run_db
+from ..config.metrics import record_datastore
+from ..config.settings import settings
+from .stats_rollup import MAX_BATCH_WRITES
+
+SEARCH_COLLECTION = "voucher_search"
+MIN_PREFIX = 2
+MAX_PREFIX = 15
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Trọng số khi xếp hạng theo trường khớp; từ chỉ khớp trong dòng phiếu được 0.5
+FIELD_WEIGHTS = {
+    "voucher_no": 3.0,
+    "related_object_name": 3.0,
+    "partner_name": 3.0,
+    "related_object_code": 2.0,
+    "partner_code": 2.0,
+    "reason": 2.0,
+    "description": 1.0,
+}
+LINE_WEIGHT = 0.5
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip Vietnamese diacritics: 'Nguyễn Văn Đức' -> 'nguyen van duc'"""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN.findall(fold(text)) if text else []
+
+
+def _prefixes(token: str) -> List[str]:
+    result = [token[:length] for length in range(MIN_PREFIX, min(len(token), MAX_PREFIX) + 1)]
+    if len(token) > MAX_PREFIX:
+        result.append(token)
+    return result
+
+
+def _value(value):
+    """Enum -> raw value"""
+    return getattr(value, "value", value)
+
+
+class VoucherSearchIndex:
+    """Search documents of one voucher collection, written with the voucher (WriteBatch or Transaction)"""
+
+    def __init__(
+        self,
+        db,
+        source: str,
+        text_fields: Sequence[str],
+        line_fields: Sequence[str],
+        summary_fields: Iterable[str]
+    ):
+        self.db = db
+        self.source = source
+        self.text_fields = tuple(text_fields)
+        self.line_fields = tuple(line_fields)
+        self.summary_fields = tuple(summary_fields)
+
+    def _get_collection(self):
+        return self.db.collection(SEARCH_COLLECTION)
+
+    def ref(self, voucher_id: str):
+        return self._get_collection().document(f"{self.source}_{voucher_id}")
+
+    def _line_tokens(self, lines: List[dict]) -> List[str]:
+        return [token for line in lines for field in self.line_fields for token in tokenize(line.get(field))]
+
+    def line_terms(self, lines: List[dict]) -> List[str]:
+        """Terms contributed by some voucher lines"""
+        return [term for token in dict.fromkeys(self._line_tokens(lines)) for term in _prefixes(token)]
+
+    def document(self, voucher: dict, extra_terms: Iterable[str] = ()) -> dict:
+        """Search document of a voucher; extra_terms keeps terms of chunked lines that were not loaded"""
+        text = {field: " ".join(tokenize(voucher.get(field))) for field in self.text_fields if voucher.get(field)}
+        tokens = [token for value in text.values() for token in value.split()]
+        tokens += self._line_tokens(voucher.get("lines") or [])
+
+        terms = dict.fromkeys(term for token in dict.fromkeys(tokens) for term in _prefixes(token))
+        terms.update(dict.fromkeys(extra_terms))
+        return {
+            "source": self.source,
+            "voucher_id": voucher["id"],
+            "voucher_date": voucher["voucher_date"],
+            "summary": {field: _value(voucher.get(field)) for field in self.summary_fields if field in voucher},
+            "text": text,
+            "terms": list(terms)[:settings.voucher_search_max_terms]
+        }
+
+    def apply(self, writer, before: Optional[dict], after: Optional[dict], extra_terms: Iterable[str] = ()):
+        """Write, rewrite or delete the search document for a voucher change (no reads)"""
+        if after is None:
+            writer.delete(self.ref(before["id"]))
+            return
+        document = self.document(after, extra_terms)
+        if before is not None and self.document(before) == document:
+            return
+        writer.set(self.ref(after["id"]), document)
+
+    def read_terms(self, voucher_id: str, transaction=None) -> List[str]:
+        """Current terms of a voucher (blocking) - for line edits of chunked vouchers"""
+        snapshot = self.ref(voucher_id).get(transaction=transaction)
+        record_datastore(reads=1)
+        if not snapshot.exists:
+            return []
+        return (snapshot.to_dict() or {}).get("terms") or []
+
+    def rebuild(self, voucher_collection, line_chunks=None) -> dict:
+        """
+        Regenerate the search documents of this source from raw vouchers.
+        Run during maintenance - writes made while rebuilding may be lost.
+        """
+        indexed = set()
+        batch, pending = self.db.batch(), 0
+        for doc in voucher_collection.stream():
+            voucher = doc.to_dict() or {}
+            if line_chunks is not None:
+                voucher = line_chunks.load(voucher)
+            batch.set(self.ref(voucher["id"]), self.document(voucher))
+            indexed.add(self.ref(voucher["id"]).id)
+            pending += 1
+            if pending == MAX_BATCH_WRITES:
+                commit_batch(batch)
+                batch, pending = self.db.batch(), 0
+
+        stale = self._get_collection().where(filter=FieldFilter("source", "==", self.source)).select([]).stream()
+        for doc in stale:
+            if doc.id not in indexed:
+                batch.delete(doc.reference)
+                pending += 1
+                if pending == MAX_BATCH_WRITES:
+                    commit_batch(batch)
+                    batch, pending = self.db.batch(), 0
+        if pending:
+            commit_batch(batch)
+        return {"source": self.source, "vouchers": len(indexed)}
+
+
+def _match_weight(token: str, data: dict, terms: set) -> float:
+    """Best field weight for one query token: whole word counts double, prefix once, line-only 0.5"""
+    best = 0.0
+    for field, value in (data.get("text") or {}).items():
+        weight = FIELD_WEIGHTS.get(field, 1.0)
+        words = value.split()
+        if token in words:
+            best = max(best, 2 * weight)
+        elif any(word.startswith(token) for word in words):
+            best = max(best, weight)
+    if best:
+        return best
+    if token in terms or (len(token) > MAX_PREFIX and any(term.startswith(token) for term in terms)):
+        return LINE_WEIGHT
+    return 0.0
+
+
+class VoucherSearchService:
+    """Search across cash and warehouse vouchers"""
+
+    def __init__(self):
+        self.db = get_db()
+
+    async def search(
+        self,
+        query: str,
+        source: Optional[str] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: int = 20
+    ) -> dict:
+        """
+        Vouchers containing every query word (as a word prefix), best matches first.
+
+        truncated=True means the rarest-looking word matched more than VOUCHER_SEARCH_CANDIDATES
+        vouchers and only the newest were ranked - narrow the date range to see older ones.
+        """
+        tokens = list(dict.fromkeys(token for token in tokenize(query) if len(token) >= MIN_PREFIX))
+        if not tokens:
+            return {"query": query, "items": [], "truncated": False}
+        return await run_db(self._search, query, tokens, source, from_date, to_date, limit)
+
+    def _search(
+        self,
+        query: str,
+        tokens: List[str],
+        source: Optional[str],
+        from_date: Optional[datetime],
+        to_date: Optional[datetime],
+        limit: int
+    ) -> dict:
+        """One indexed query on the longest word, then filter and rank the candidates (blocking)"""
+        lookup = max(tokens, key=len)
+        search_query = self.db.collection(SEARCH_COLLECTION).where(
+            filter=FieldFilter("terms", "array_contains", lookup[:MAX_PREFIX])
+        )
+        if source:
+            search_query = search_query.where(filter=FieldFilter("source", "==", source))
+        if from_date:
+            search_query = search_query.where(filter=FieldFilter("voucher_date", ">=", from_date))
+        if to_date:
+            search_query = search_query.where(filter=FieldFilter("voucher_date", "<=", to_date))
+        candidates = settings.voucher_search_candidates
+        search_query = search_query.order_by("voucher_date", direction=Query.DESCENDING).limit(candidates)
+
+        docs = [doc.to_dict() for doc in search_query.stream()]
+        record_datastore(streamed=len(docs))
+
+        hits = []
+        for data in docs:
+            terms = set(data.get("terms") or [])
+            weights = [_match_weight(token, data, terms) for token in tokens]
+            if all(weights):
+                hits.append((sum(weights), data))
+        # sort ổn định: cùng điểm thì giữ thứ tự phiếu mới trước
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+
+        items = [
+            {
+                "source": data["source"],
+                "id": data["voucher_id"],
+                "voucher_date": data["voucher_date"],
+                "score": round(score, 2),
+                "summary": data.get("summary") or {}
+            }
+            for score, data in hits[:limit]
+        ]
+        return {"query": query, "items": items, "truncated": len(docs) == candidates}
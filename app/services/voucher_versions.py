@@ -0,0 +1,151 @@
+"""
+Voucher Versions - bộ đếm thay đổi của collection phiếu cho ETag danh sách / thống kê
+
+Mỗi lệnh ghi phiếu tăng (cùng batch / transaction) một trong VOUCHER_VERSION_SHARDS document
+`voucher_versions/<collection>_<shard>` chọn ngẫu nhiên - chia shard để các lệnh ghi không
+tranh nhau một document (Firestore ~1 lần ghi/giây mỗi document). Phiên bản của collection
+là tổng các shard; số đếm chỉ tăng.
+
+- Mỗi worker giữ một snapshot listener trên các shard của collection, nên ETag được tính
+  (và 304 được trả) không đọc Firestore
+- Sau lệnh ghi trên chính worker, lần lấy phiên bản kế tiếp đọc lại các shard (get_all)
+  để worker thấy ngay thay đổi của mình; thay đổi từ worker khác đến qua listener sau
+  khoảng một giây
+"""
+import os
+import random
+import threading
+from typing import Dict, Optional
+
+from google.cloud.firestore import FieldFilter, Increment
+
+from ..config.database import get_db
+from ..config.executor import run_db
+from ..config.metrics import record_datastore
+from ..config.settings import settings
+
+VERSIONS_COLLECTION = "voucher_versions"
+
+
+class VoucherVersions:
+
+    def __init__(self, db, collection: str, shards: int):
+        self.db = db
+        self.collection = collection
+        self.shards = max(1, shards)
+        self._counts: Dict[str, int] = {}
+        self._ready = False
+        self._dirty = True
+        self._watch = None
+        self._lock = threading.Lock()
+        self._stats = {"listener_starts": 0, "reads": 0}
+
+    def _get_collection(self):
+        return self.db.collection(VERSIONS_COLLECTION)
+
+    def _ref(self, shard: int):
+        return self._get_collection().document(f"{self.collection}_{shard}")
+
+    def bump(self, writer):
+        """Count one voucher write (WriteBatch or Transaction, no reads)"""
+        writer.set(
+            self._ref(random.randrange(self.shards)),
+            {"collection": self.collection, "count": Increment(1)},
+            merge=True
+        )
+
+    def mark_written(self):
+        """A write of this worker was committed: the next current() re-reads the shards"""
+        self._dirty = True
+
+    # ----- Listener -----
+
+    def start(self):
+        with self._lock:
+            if self._watch is not None:
+                return
+            query = self._get_collection().where(filter=FieldFilter("collection", "==", self.collection))
+            self._watch = query.on_snapshot(self._on_snapshot)
+            self._stats["listener_starts"] += 1
+
+    def close(self):
+        with self._lock:
+            watch, self._watch = self._watch, None
+            self._ready = False
+        if watch is not None:
+            watch.unsubscribe()
+
+    def _merge(self, shard_id: str, data: Optional[dict]):
+        # Số đếm chỉ tăng: giữ giá trị lớn nhất giữa listener và get_all
+        count = int((data or {}).get("count") or 0)
+        if count > self._counts.get(shard_id, 0):
+            self._counts[shard_id] = count
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            if self._watch is None:
+                return
+            for change in changes:
+                self._merge(change.document.id, change.document.to_dict())
+            self._ready = True
+        record_datastore(streamed=len(changes))
+
+    # ----- Reads -----
+
+    def known(self) -> Optional[int]:
+        """Current version when the listener is up to date for this worker, else None"""
+        self.start()
+        with self._lock:
+            if self._ready and not self._dirty:
+                return sum(self._counts.values())
+        return None
+
+    def read(self) -> int:
+        """Read every shard (blocking)"""
+        self._dirty = False
+        refs = [self._ref(shard) for shard in range(self.shards)]
+        snapshots = list(self.db.get_all(refs))
+        record_datastore(reads=len(refs))
+        with self._lock:
+            for snapshot in snapshots:
+                if snapshot.exists:
+                    self._merge(snapshot.id, snapshot.to_dict())
+            self._stats["reads"] += 1
+            return sum(self._counts.values())
+
+    async def current(self) -> int:
+        version = self.known()
+        if version is None:
+            version = await run_db(self.read)
+        return version
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"ready": self._ready, "version": sum(self._counts.values()), **self._stats}
+
+
+_versions: Dict[str, VoucherVersions] = {}
+
+
+def get_voucher_versions(collection: str) -> VoucherVersions:
+    """Change counter of one voucher collection for this worker"""
+    if collection not in _versions:
+        _versions[collection] = VoucherVersions(get_db(), collection, settings.voucher_version_shards)
+    return _versions[collection]
+
+
+def close_voucher_versions():
+    for versions in _versions.values():
+        versions.close()
+
+
+def get_voucher_versions_stats() -> Dict[str, dict]:
+    return {collection: versions.get_stats() for collection, versions in _versions.items()}
+
+
+def _reset_after_fork():
+    # Listener thread không tồn tại trong process con
+    _versions.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
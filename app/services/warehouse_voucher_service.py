@@ -1,17 +1,37 @@
 """
 Warehouse Voucher Service - Phiếu Nhập/Xuất Kho
 """
+from collections import Counter
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, Callable, List, Optional, Sequence, Tuple, Union
 from google.cloud.firestore import FieldFilter
+from pydantic import ValidationError
+import asyncio
 import uuid
 
-from ..config.firebase import get_db
+from ..config.database import commit_batch, get_db, run_transaction
+from ..config.executor import run_db
+from ..config.metrics import record_datastore
+from .voucher_number_allocator import get_voucher_number_allocator
+from .pagination import apply_order_and_cursor, projection_fields, split_page
+from .stats_rollup import DailyStatsRollup, MAX_BATCH_WRITES, merge_deltas
+from .voucher_cache import get_voucher_cache
+from .ledger_service import LedgerService
+from .voucher_events import VoucherChangeLog
+from .voucher_replica import get_voucher_replica
+from .voucher_versions import get_voucher_versions
+from .voucher_search import VoucherSearchIndex
+from .idempotency import IdempotencyStore, IdempotentRequest, fingerprint
+from .inventory_service import InventoryService
+from .inventory_costing import PRECISION
+from .voucher_lines import VoucherLineChunks
 from ..models.warehouse_voucher import (
     WarehouseVoucher,
+    WarehouseVoucherSummary,
     WarehouseVoucherCreate,
     WarehouseVoucherUpdate,
     WarehouseVoucherLine,
+    WarehouseVoucherLinePage,
     WarehouseVoucherType,
     WarehouseVoucherStatus
 )
@@ -19,31 +39,205 @@ from ..models.warehouse_voucher import (
 
 class WarehouseVoucherService:
     COLLECTION = "warehouse_vouchers"
-    COUNTER_COLLECTION = "counters"
+    STATS_COLLECTION = "warehouse_voucher_daily_stats"
+    LEDGER_SOURCE = "warehouse"
+    EVENT_SOURCE = "warehouse"
+    SEARCH_SOURCE = "warehouse"
+    SEARCH_TEXT_FIELDS = ("voucher_no", "partner_code", "partner_name", "ref_voucher_no", "description")
+    SEARCH_LINE_FIELDS = ("product_code", "product_name")
+    STATS_AMOUNT_FIELDS = ("total_quantity", "total_amount")
+    EXPORT_HEADER_FIELDS = (
+        "id", "voucher_no", "voucher_type", "receipt_type", "issue_type", "voucher_date", "status",
+        "warehouse_code", "warehouse_name", "partner_code", "partner_name", "debit_account", "credit_account",
+        "total_quantity", "total_amount", "created_at", "posted_at"
+    )
+    EXPORT_LINE_FIELDS = (
+        "line_no", "product_code", "product_name", "unit", "quantity", "unit_price", "amount",
+        "inventory_account", "expense_account", "batch_no", "expiry_date"
+    )
 
     def __init__(self):
         self.db = get_db()
+        self.allocator = get_voucher_number_allocator()
+        self.cache = get_voucher_cache()
+        self.rollup = DailyStatsRollup(self.db, self.STATS_COLLECTION, self.STATS_AMOUNT_FIELDS)
+        self.ledger = LedgerService()
+        self.changes = VoucherChangeLog(self.db)
+        self.inventory = InventoryService()
+        self.line_chunks = VoucherLineChunks(self.db, self.COLLECTION)
+        self.replica = get_voucher_replica(self.COLLECTION)
+        self.versions = get_voucher_versions(self.COLLECTION)
+        self.idempotency = IdempotencyStore(self.db)
+        self.search = VoucherSearchIndex(
+            self.db, self.SEARCH_SOURCE, self.SEARCH_TEXT_FIELDS, self.SEARCH_LINE_FIELDS, WarehouseVoucherSummary.model_fields
+        )
 
     def _get_collection(self):
         return self.db.collection(self.COLLECTION)
 
-    def _generate_voucher_no(self, voucher_type: WarehouseVoucherType) -> str:
-        """Generate voucher number: PNK202501001 or PXK202501001"""
-        prefix = "PNK" if voucher_type == WarehouseVoucherType.RECEIPT else "PXK"
-        year = datetime.now().year
-        counter_key = f"{prefix}{year}"
-
-        counter_ref = self.db.collection(self.COUNTER_COLLECTION).document(counter_key)
-        counter_doc = counter_ref.get()
-
-        if counter_doc.exists:
-            current = counter_doc.to_dict().get("value", 0)
-            new_value = current + 1
+    @staticmethod
+    def _stream_dicts(query) -> List[dict]:
+        """Stream query results as dicts (blocking - run via run_db)"""
+        docs = [doc.to_dict() for doc in query.stream()]
+        record_datastore(streamed=len(docs))
+        return docs
+
+    def _commit_create(self, voucher_id: str, voucher_data: dict, idempotent: Optional[IdempotentRequest] = None) -> dict:
+        """Write a new voucher, its line chunks and derived documents in one batch (blocking); returns the stored voucher"""
+        batch = self.db.batch()
+        line_fields, chunk_writes = self.line_chunks.plan(voucher_id, voucher_data["lines"])
+        stored = {**voucher_data, **line_fields}
+        batch.set(self._get_collection().document(voucher_id), stored)
+        self.line_chunks.apply(batch, chunk_writes)
+        self._apply_side_effects(batch, None, voucher_data)
+        if idempotent is not None:
+            self.idempotency.record(batch, idempotent, stored)
+        commit_batch(batch)
+        self._replicate(voucher_id, stored)
+        return stored
+
+    def _commit_create_batch(self, documents: List[dict], records: Sequence[Tuple[IdempotentRequest, dict]] = ()):
+        """
+        Write many new vouchers with aggregated rollup increments in one WriteBatch (blocking).
+        records: (Idempotency-Key request, item result) stored with the vouchers.
+        """
+        batch = self.db.batch()
+        deltas: dict = {}
+        stored = []
+        for voucher_data in documents:
+            line_fields, chunk_writes = self.line_chunks.plan(voucher_data["id"], voucher_data["lines"])
+            stored.append({**voucher_data, **line_fields})
+            batch.set(self._get_collection().document(voucher_data["id"]), stored[-1])
+            self.line_chunks.apply(batch, chunk_writes)
+            merge_deltas(deltas, self.rollup.deltas(None, voucher_data))
+        self.rollup.apply(batch, deltas)
+        self.changes.record(batch, self.EVENT_SOURCE, "created", documents)
+        self.versions.bump(batch)
+        for voucher_data in documents:
+            self.search.apply(batch, None, voucher_data)
+        for request, result in records:
+            self.idempotency.record(batch, request, result)
+        commit_batch(batch)
+        for voucher_data in stored:
+            self._replicate(voucher_data["id"], voucher_data)
+
+    def _chunk_for_batch(self, documents: List[Tuple[int, dict]], extra_writes: int = 0) -> List[List[Tuple[int, dict]]]:
+        """
+        Split documents so voucher writes (with line chunks, the search document and
+        extra_writes per voucher) + rollup day writes + the change and version documents
+        fit in one WriteBatch
+        """
+        chunks, chunk, days, writes = [], [], set(), 0
+        for item in documents:
+            day = self.rollup.day_key(item[1]["voucher_date"])
+            item_writes = 2 + extra_writes + self.line_chunks.chunk_count(len(item[1]["lines"]))
+            if chunk and writes + item_writes + len(days | {day}) > MAX_BATCH_WRITES - 2:
+                chunks.append(chunk)
+                chunk, days, writes = [], set(), 0
+            chunk.append(item)
+            days.add(day)
+            writes += item_writes
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _apply_side_effects(self, writer, before: Optional[dict], after: Optional[dict]):
+        """
+        Derived documents written together with a voucher change (WriteBatch or Transaction).
+        Inventory balances are read first - a transaction must do all reads before writes.
+
+        Returns extra voucher fields to write: issue lines priced by the costing engine on post.
+        """
+        stock_writes, voucher_changes = self.inventory.prepare(writer, before, after)
+        if voucher_changes:
+            after = {**after, **voucher_changes}
+        self.rollup.apply(writer, self.rollup.deltas(before, after))
+        self.inventory.apply(writer, stock_writes)
+        self.ledger.apply(writer, self.LEDGER_SOURCE, before, after)
+        self.changes.apply(writer, self.EVENT_SOURCE, before, after)
+        self.search.apply(writer, before, after)
+        self.versions.bump(writer)
+        return voucher_changes
+
+    def _replicate(self, voucher_id: str, after: Optional[dict]):
+        """Apply a committed write to this worker's in-memory replica and version counter (after=None: deleted)"""
+        self.versions.mark_written()
+        if self.replica is None:
+            return
+        if after is None:
+            self.replica.remove(voucher_id)
         else:
-            new_value = 1
+            self.replica.upsert(after)
 
-        counter_ref.set({"value": new_value})
-        return f"{prefix}{year}{str(new_value).zfill(5)}"
+    def _run_transition(
+        self,
+        voucher_id: str,
+        build_changes: Callable[[dict], Optional[dict]],
+        delete: bool = False,
+        idempotent: Optional[IdempotentRequest] = None
+    ) -> Tuple[Optional[dict], bool]:
+        """
+        Read the voucher, check the status precondition and write the change in
+        one transaction (blocking). build_changes(current) returns the fields to
+        update, or None when the precondition fails.
+
+        Returns (data, written): the stored voucher data after the change
+        (before it, with all lines, for delete), or None if the voucher does not
+        exist or the precondition failed; written is False when the data is the
+        stored result of an earlier request with the same Idempotency-Key.
+        Chunked lines are loaded for the side effects and only changed chunks
+        are rewritten.
+        """
+        ref = self._get_collection().document(voucher_id)
+
+        def _transition(transaction):
+            if idempotent is not None:
+                # Request trùng chạy song song đã ghi xong trước
+                stored = self.idempotency.lookup(idempotent, transaction)
+                if stored is not None:
+                    return stored, False
+            snapshot = ref.get(transaction=transaction)
+            record_datastore(reads=1)
+            if not snapshot.exists:
+                return None, False
+
+            before = snapshot.to_dict()
+            changes = build_changes(before)
+            if changes is None:
+                return None, False
+            before = self.line_chunks.load(before, transaction)
+
+            after = None if delete else {**before, **changes}
+            priced = self._apply_side_effects(transaction, before, after)
+            if delete:
+                transaction.delete(ref)
+                self.line_chunks.apply(transaction, self.line_chunks.plan(voucher_id, [], before)[1])
+                return before, True
+
+            updates = {**changes, **priced}
+            if "lines" in updates:
+                line_fields, chunk_writes = self.line_chunks.plan(voucher_id, updates["lines"], before)
+                updates.update(line_fields)
+                self.line_chunks.apply(transaction, chunk_writes)
+            transaction.update(ref, updates)
+            result = self.line_chunks.stored({**after, **updates})
+            if idempotent is not None:
+                self.idempotency.record(transaction, idempotent, result, overwrite=True)
+            return result, True
+
+        result, written = run_transaction(_transition)
+        if written:
+            # Kết quả lưu theo Idempotency-Key là bản cũ: không đẩy vào bản sao
+            self._replicate(voucher_id, None if delete else result)
+        return result, written
+
+    @staticmethod
+    def _voucher_prefix(voucher_type: WarehouseVoucherType) -> str:
+        return "PNK" if voucher_type == WarehouseVoucherType.RECEIPT else "PXK"
+
+    async def _generate_voucher_no(self, voucher_type: WarehouseVoucherType) -> str:
+        """Generate voucher number: PNK202500001 or PXK202500001"""
+        return await self.allocator.next_number(self._voucher_prefix(voucher_type))
 
     def _calculate_totals(self, lines: List[WarehouseVoucherLine]) -> dict:
         """Calculate total quantity and amount from lines"""
@@ -54,12 +248,9 @@ class WarehouseVoucherService:
             "total_amount": total_amount
         }
 
-    async def create(self, data: WarehouseVoucherCreate, user_id: str = "admin") -> WarehouseVoucher:
-        """Create new warehouse voucher"""
-        voucher_id = str(uuid.uuid4())
-        voucher_no = self._generate_voucher_no(data.voucher_type)
+    def _build_voucher_data(self, data: WarehouseVoucherCreate, voucher_id: str, voucher_no: str, user_id: str, now: datetime) -> dict:
+        """Document data for a new voucher"""
         totals = self._calculate_totals(data.lines)
-        now = datetime.now()
 
         # Prepare lines with IDs
         lines = []
@@ -69,7 +260,7 @@ class WarehouseVoucherService:
             line_dict["line_no"] = i + 1
             lines.append(line_dict)
 
-        voucher_data = {
+        return {
             "id": voucher_id,
             "voucher_no": voucher_no,
             "voucher_type": data.voucher_type.value,
@@ -99,66 +290,312 @@ class WarehouseVoucherService:
             "updated_at": now
         }
 
-        self._get_collection().document(voucher_id).set(voucher_data)
-        return WarehouseVoucher(**voucher_data)
+    async def create(self, data: WarehouseVoucherCreate, user_id: str = "admin", idempotency_key: Optional[str] = None) -> WarehouseVoucher:
+        """Create new warehouse voucher (a retry with the same Idempotency-Key returns the first result)"""
+        idempotent = None
+        if idempotency_key:
+            idempotent = IdempotentRequest(f"{self.COLLECTION}:create", idempotency_key, fingerprint(data.model_dump(mode="json")))
+            stored = await self._stored_result(idempotent)
+            if stored is not None:
+                return WarehouseVoucher(**stored)
+
+        voucher_id = str(uuid.uuid4())
+        voucher_no = await self._generate_voucher_no(data.voucher_type)
+        voucher_data = self._build_voucher_data(data, voucher_id, voucher_no, user_id, datetime.now())
+
+        try:
+            stored = await run_db(self._commit_create, voucher_id, voucher_data, idempotent)
+        except Exception:
+            await self.allocator.report_unused(voucher_no, "create_failed")
+            # Request trùng chạy song song đã tạo phiếu trước
+            stored = await self._stored_result(idempotent)
+            if stored is not None:
+                return WarehouseVoucher(**stored)
+            raise
+
+        voucher = WarehouseVoucher(**stored)
+        self.cache.set(self.COLLECTION, voucher)
+        return voucher
+
+    async def create_batch(self, items: List[dict], user_id: str = "admin", idempotency_key: Optional[str] = None) -> List[dict]:
+        """
+        Create many vouchers at once: validate every item, reserve one contiguous
+        range of voucher numbers per prefix, then write with chunked WriteBatch
+        commits. Returns one result per item, in input order.
+
+        With an Idempotency-Key each item's result is stored with its voucher, so a
+        retry only creates the items that were not written.
+        """
+        results: List[Optional[dict]] = [None] * len(items)
+        valid: List[Tuple[int, WarehouseVoucherCreate]] = []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, WarehouseVoucherCreate.model_validate(item)))
+            except ValidationError as e:
+                results[index] = {
+                    "index": index,
+                    "success": False,
+                    "error": e.errors(include_url=False, include_context=False, include_input=False)
+                }
+
+        requests = {}
+        if idempotency_key:
+            requests = {
+                index: IdempotentRequest(f"{self.COLLECTION}:batch", f"{idempotency_key}#{index}", fingerprint(items[index]))
+                for index, _ in valid
+            }
+            stored = await run_db(self.idempotency.lookup_many, list(requests.values()))
+            for index, result in zip(list(requests), stored):
+                if result is not None:
+                    results[index] = result
+            valid = [(index, data) for index, data in valid if results[index] is None]
+
+        # One counter transaction per prefix for the whole batch
+        numbers = {}
+        for prefix, count in Counter(self._voucher_prefix(data.voucher_type) for _, data in valid).items():
+            year, first, last = await self.allocator.reserve(prefix, count)
+            numbers[prefix] = iter([self.allocator.format_number(prefix, year, value) for value in range(first, last + 1)])
+
+        now = datetime.now()
+        documents = []
+        for index, data in valid:
+            voucher_id = str(uuid.uuid4())
+            voucher_no = next(numbers[self._voucher_prefix(data.voucher_type)])
+            documents.append((index, self._build_voucher_data(data, voucher_id, voucher_no, user_id, now)))
+
+        async def _commit_chunk(chunk: List[Tuple[int, dict]]):
+            created = {
+                index: {"index": index, "success": True, "id": voucher_data["id"], "voucher_no": voucher_data["voucher_no"]}
+                for index, voucher_data in chunk
+            }
+            records = [(requests[index], result) for index, result in created.items() if index in requests]
+            try:
+                await run_db(self._commit_create_batch, [voucher_data for _, voucher_data in chunk], records)
+            except Exception as e:
+                await self.allocator.report_unused_numbers([voucher_data["voucher_no"] for _, voucher_data in chunk], "batch_failed")
+                for index, _ in chunk:
+                    results[index] = {"index": index, "success": False, "error": str(e)}
+                return
+            for index, result in created.items():
+                results[index] = result
+
+        extra_writes = 1 if requests else 0
+        await asyncio.gather(*[_commit_chunk(chunk) for chunk in self._chunk_for_batch(documents, extra_writes)])
+        return results
 
     async def get_by_id(self, voucher_id: str) -> Optional[WarehouseVoucher]:
-        """Get voucher by ID"""
-        doc = self._get_collection().document(voucher_id).get()
+        """Get voucher by ID (read-through cache)"""
+        voucher = self.cache.get(self.COLLECTION, voucher_id, WarehouseVoucher)
+        if voucher is not None:
+            return voucher
+
+        doc = await run_db(self._get_collection().document(voucher_id).get)
+        record_datastore(reads=1)
         if doc.exists:
-            return WarehouseVoucher(**doc.to_dict())
+            voucher = WarehouseVoucher(**doc.to_dict())
+            self.cache.set(self.COLLECTION, voucher)
+            return voucher
         return None
 
-    async def get_all(
+    def _build_list_query(
         self,
         voucher_type: Optional[WarehouseVoucherType] = None,
         status: Optional[WarehouseVoucherStatus] = None,
         warehouse_code: Optional[str] = None,
         from_date: Optional[datetime] = None,
         to_date: Optional[datetime] = None,
-        limit: int = 100
-    ) -> List[WarehouseVoucher]:
-        """Get all vouchers with filters - simple query to avoid composite index"""
+        cursor: Optional[str] = None
+    ):
+        """All filters and voucher_date ordering pushed to Firestore (see firestore.indexes.json)"""
         query = self._get_collection()
 
-        # Only apply voucher_type filter in Firestore (most common filter)
         if voucher_type:
             query = query.where(filter=FieldFilter("voucher_type", "==", voucher_type.value))
+        if status:
+            query = query.where(filter=FieldFilter("status", "==", status.value))
+        if warehouse_code:
+            query = query.where(filter=FieldFilter("warehouse_code", "==", warehouse_code))
+        if from_date:
+            query = query.where(filter=FieldFilter("voucher_date", ">=", from_date))
+        if to_date:
+            query = query.where(filter=FieldFilter("voucher_date", "<=", to_date))
 
-        # Get all documents (limited)
-        docs = query.limit(limit * 2).stream()
-
-        # Convert to list and filter in memory
-        vouchers = []
-        for doc in docs:
-            data = doc.to_dict()
-            voucher = WarehouseVoucher(**data)
+        return apply_order_and_cursor(query, cursor)
 
-            # Apply other filters in memory
-            if status and voucher.status != status:
-                continue
-            if warehouse_code and voucher.warehouse_code != warehouse_code:
-                continue
-            if from_date and voucher.voucher_date < from_date:
-                continue
-            if to_date and voucher.voucher_date > to_date:
-                continue
+    async def get_page(
+        self,
+        voucher_type: Optional[WarehouseVoucherType] = None,
+        status: Optional[WarehouseVoucherStatus] = None,
+        warehouse_code: Optional[str] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[WarehouseVoucher], Optional[str]]:
+        """Get one page of vouchers (newest first) and the cursor of the next page"""
+        # Fetch one extra document to know whether there is a next page
+        docs = self.replica.query(
+            from_date, to_date, cursor, limit + 1,
+            voucher_type=voucher_type, status=status, warehouse_code=warehouse_code
+        ) if self.replica else None
+        if docs is None:
+            query = self._build_list_query(voucher_type, status, warehouse_code, from_date, to_date, cursor)
+            docs = await run_db(self._stream_dicts, query.limit(limit + 1))
+        docs, next_cursor = split_page(docs, limit)
+        return [WarehouseVoucher(**data) for data in docs], next_cursor
+
+    async def get_summary_page(
+        self,
+        voucher_type: Optional[WarehouseVoucherType] = None,
+        status: Optional[WarehouseVoucherStatus] = None,
+        warehouse_code: Optional[str] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Tuple[List[Union[WarehouseVoucherSummary, dict]], Optional[str]]:
+        """
+        One page of voucher headers, read with a Firestore field mask (lines are not downloaded)
+
+        fields=None returns WarehouseVoucherSummary models; an explicit field list returns dicts
+        with only those fields (plus id and voucher_date, used by the cursor).
+        """
+        if fields is not None:
+            selected = projection_fields(fields, WarehouseVoucher.model_fields)
+        else:
+            selected = list(WarehouseVoucherSummary.model_fields)
+        docs = self.replica.query(
+            from_date, to_date, cursor, limit + 1, selected,
+            voucher_type=voucher_type, status=status, warehouse_code=warehouse_code
+        ) if self.replica else None
+        if docs is None:
+            query = self._build_list_query(voucher_type, status, warehouse_code, from_date, to_date, cursor).select(selected)
+            docs = await run_db(self._stream_dicts, query.limit(limit + 1))
+
+        docs, next_cursor = split_page(docs, limit)
+        if fields is not None:
+            return docs, next_cursor
+        return [WarehouseVoucherSummary(**data) for data in docs], next_cursor
 
-            vouchers.append(voucher)
+    async def get_all(
+        self,
+        voucher_type: Optional[WarehouseVoucherType] = None,
+        status: Optional[WarehouseVoucherStatus] = None,
+        warehouse_code: Optional[str] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: int = 100
+    ) -> List[WarehouseVoucher]:
+        """Get the first page of vouchers with filters"""
+        vouchers, _ = await self.get_page(voucher_type, status, warehouse_code, from_date, to_date, limit)
+        return vouchers
 
-            if len(vouchers) >= limit:
+    async def iter_pages(
+        self,
+        voucher_type: Optional[WarehouseVoucherType] = None,
+        status: Optional[WarehouseVoucherStatus] = None,
+        warehouse_code: Optional[str] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        page_size: int = 500
+    ) -> AsyncIterator[List[WarehouseVoucher]]:
+        """Walk every matching voucher (with all lines) page by page with a Firestore cursor (constant memory)"""
+        cursor = None
+        while True:
+            vouchers, cursor = await self.get_page(
+                voucher_type, status, warehouse_code, from_date, to_date, limit=page_size, cursor=cursor
+            )
+            if any(voucher.line_chunks for voucher in vouchers):
+                vouchers = await run_db(self._load_chunked_lines, vouchers)
+            if vouchers:
+                yield vouchers
+            if not cursor:
                 break
 
-        # Sort by date descending
-        vouchers.sort(key=lambda v: v.voucher_date, reverse=True)
-        return vouchers[:limit]
+    def _load_chunked_lines(self, vouchers: List[WarehouseVoucher]) -> List[WarehouseVoucher]:
+        """Read the line chunks of chunked vouchers (blocking)"""
+        return [
+            WarehouseVoucher(**self.line_chunks.load(voucher.model_dump())) if voucher.line_chunks else voucher
+            for voucher in vouchers
+        ]
 
-    async def update(self, voucher_id: str, data: WarehouseVoucherUpdate, user_id: str = "admin") -> Optional[WarehouseVoucher]:
-        """Update voucher (only DRAFT status)"""
+    async def get_lines(self, voucher_id: str, offset: int = 0, limit: int = 200) -> Optional[WarehouseVoucherLinePage]:
+        """One page of voucher lines - a chunked voucher reads only the chunks the page falls in"""
         voucher = await self.get_by_id(voucher_id)
-        if not voucher or voucher.status != WarehouseVoucherStatus.DRAFT:
+        if voucher is None:
             return None
 
+        if voucher.line_chunks:
+            header = {"id": voucher_id, "line_chunks": voucher.line_chunks, "line_chunk_size": voucher.line_chunk_size}
+            lines = await run_db(self.line_chunks.read_range, header, offset, limit)
+        else:
+            lines = voucher.lines[offset:offset + limit]
+        line_count = voucher.line_count if voucher.line_count is not None else len(voucher.lines)
+        return WarehouseVoucherLinePage(voucher_id=voucher_id, line_count=line_count, offset=offset, lines=lines)
+
+    def _run_line_update(self, voucher_id: str, line_no: int, line_data: dict, now: datetime) -> Optional[dict]:
+        """
+        Replace line `line_no` of a DRAFT voucher in one transaction (blocking).
+        Only the chunk holding the line is read and rewritten; totals and the
+        daily rollup are adjusted by the difference. The search document of a
+        chunked voucher keeps the terms of the replaced line until rebuilt.
+        """
+        ref = self._get_collection().document(voucher_id)
+
+        def _update(transaction):
+            snapshot = ref.get(transaction=transaction)
+            record_datastore(reads=1)
+            if not snapshot.exists:
+                return None
+
+            before = snapshot.to_dict()
+            line_count = before.get("line_count")
+            if line_count is None:
+                line_count = len(before.get("lines") or [])
+            if before.get("status") != WarehouseVoucherStatus.DRAFT.value or not 1 <= line_no <= line_count:
+                return None
+
+            new_line = {**line_data, "line_no": line_no}
+            old_line, line_fields, chunk_writes = self.line_chunks.replace_line(before, line_no - 1, new_line, transaction)
+            # Phiếu lưu dòng tách riêng: giữ tiền tố đã có, thêm tiền tố của dòng mới
+            search_terms = []
+            if self.line_chunks.is_chunked(before):
+                search_terms = self.search.read_terms(voucher_id, transaction) + self.search.line_terms([new_line])
+            changes = {
+                **line_fields,
+                "total_quantity": round(before["total_quantity"] - old_line["quantity"] + new_line["quantity"], PRECISION),
+                "total_amount": round(before["total_amount"] - old_line["amount"] + new_line["amount"], PRECISION),
+                "updated_at": now
+            }
+            after = {**before, **changes}
+            self.rollup.apply(transaction, self.rollup.deltas(before, after))
+            self.changes.apply(transaction, self.EVENT_SOURCE, before, after)
+            self.search.apply(transaction, before, after, search_terms)
+            self.versions.bump(transaction)
+            self.line_chunks.apply(transaction, chunk_writes)
+            transaction.update(ref, changes)
+            return after
+
+        result = run_transaction(_update)
+        if result is not None:
+            self._replicate(voucher_id, result)
+        return result
+
+    async def update_line(self, voucher_id: str, line_no: int, line: WarehouseVoucherLine) -> Optional[WarehouseVoucher]:
+        """Replace one line of a DRAFT voucher (line_no: 1-based position)"""
+        line_data = line.model_dump()
+        line_data["id"] = line_data["id"] or str(uuid.uuid4())
+        after = await run_db(self._run_line_update, voucher_id, line_no, line_data, datetime.now())
+        if after is None:
+            return None
+
+        voucher = WarehouseVoucher(**after)
+        self.cache.set(self.COLLECTION, voucher)
+        return voucher
+
+    async def update(self, voucher_id: str, data: WarehouseVoucherUpdate, user_id: str = "admin") -> Optional[WarehouseVoucher]:
+        """Update voucher (only DRAFT status)"""
         update_data = data.model_dump(exclude_unset=True)
         update_data["updated_at"] = datetime.now()
 
@@ -167,47 +604,136 @@ class WarehouseVoucherService:
             totals = self._calculate_totals(lines)
             update_data.update(totals)
 
-        self._get_collection().document(voucher_id).update(update_data)
-        return await self.get_by_id(voucher_id)
+        def _changes(current: dict) -> Optional[dict]:
+            if current.get("status") != WarehouseVoucherStatus.DRAFT.value:
+                return None
+            return update_data
 
-    async def post(self, voucher_id: str, user_id: str = "admin") -> Optional[WarehouseVoucher]:
-        """Post voucher (change status to POSTED)"""
-        voucher = await self.get_by_id(voucher_id)
-        if not voucher or voucher.status != WarehouseVoucherStatus.DRAFT:
-            return None
+        return await self._transition(voucher_id, _changes)
 
+    async def post(self, voucher_id: str, user_id: str = "admin", idempotency_key: Optional[str] = None) -> Optional[WarehouseVoucher]:
+        """Post voucher (change status to POSTED) - issue lines are priced from the cost state"""
         now = datetime.now()
-        self._get_collection().document(voucher_id).update({
-            "status": WarehouseVoucherStatus.POSTED.value,
-            "posted_at": now,
-            "posted_by": user_id
-        })
-        return await self.get_by_id(voucher_id)
-
-    async def cancel(self, voucher_id: str, reason: str, user_id: str = "admin") -> Optional[WarehouseVoucher]:
-        """Cancel voucher"""
-        voucher = await self.get_by_id(voucher_id)
-        if not voucher or voucher.status == WarehouseVoucherStatus.CANCELLED:
-            return None
 
+        def _changes(current: dict) -> Optional[dict]:
+            if current.get("status") != WarehouseVoucherStatus.DRAFT.value:
+                return None
+            return {
+                "status": WarehouseVoucherStatus.POSTED.value,
+                "posted_at": now,
+                "posted_by": user_id,
+                "updated_at": now
+            }
+
+        idempotent = None
+        if idempotency_key:
+            idempotent = IdempotentRequest(f"{self.COLLECTION}:post", idempotency_key, fingerprint(voucher_id))
+        return await self._transition(voucher_id, _changes, idempotent)
+
+    async def cancel(
+        self,
+        voucher_id: str,
+        reason: str,
+        user_id: str = "admin",
+        idempotency_key: Optional[str] = None
+    ) -> Optional[WarehouseVoucher]:
+        """Cancel voucher"""
         now = datetime.now()
-        self._get_collection().document(voucher_id).update({
-            "status": WarehouseVoucherStatus.CANCELLED.value,
-            "cancelled_at": now,
-            "cancelled_by": user_id,
-            "cancel_reason": reason
-        })
-        return await self.get_by_id(voucher_id)
+
+        def _changes(current: dict) -> Optional[dict]:
+            if current.get("status") == WarehouseVoucherStatus.CANCELLED.value:
+                return None
+            return {
+                "status": WarehouseVoucherStatus.CANCELLED.value,
+                "cancelled_at": now,
+                "cancelled_by": user_id,
+                "cancel_reason": reason,
+                "updated_at": now
+            }
+
+        idempotent = None
+        if idempotency_key:
+            idempotent = IdempotentRequest(f"{self.COLLECTION}:cancel", idempotency_key, fingerprint(voucher_id, reason))
+        return await self._transition(voucher_id, _changes, idempotent)
 
     async def delete(self, voucher_id: str) -> bool:
         """Delete voucher (only DRAFT status)"""
-        voucher = await self.get_by_id(voucher_id)
-        if not voucher or voucher.status != WarehouseVoucherStatus.DRAFT:
+        def _changes(current: dict) -> Optional[dict]:
+            if current.get("status") != WarehouseVoucherStatus.DRAFT.value:
+                return None
+            return {}
+
+        deleted, _ = await run_db(self._run_transition, voucher_id, _changes, True)
+        if deleted is None:
             return False
 
-        self._get_collection().document(voucher_id).delete()
+        self.cache.invalidate(self.COLLECTION, voucher_id)
         return True
 
+    async def _stored_result(self, idempotent: Optional[IdempotentRequest]) -> Optional[dict]:
+        """Result of an earlier request with the same Idempotency-Key (None without a key)"""
+        if idempotent is None:
+            return None
+        return await run_db(self.idempotency.lookup, idempotent)
+
+    async def _transition(
+        self,
+        voucher_id: str,
+        build_changes: Callable[[dict], Optional[dict]],
+        idempotent: Optional[IdempotentRequest] = None
+    ) -> Optional[WarehouseVoucher]:
+        """Run a transition and build the response from the transaction result (no re-read)"""
+        stored = await self._stored_result(idempotent)
+        if stored is not None:
+            return WarehouseVoucher(**stored)
+
+        after, written = await run_db(self._run_transition, voucher_id, build_changes, False, idempotent)
+        if after is None:
+            return None
+
+        voucher = WarehouseVoucher(**after)
+        if written:
+            self.cache.set(self.COLLECTION, voucher)
+        return voucher
+
+    async def _load_stat_buckets(
+        self,
+        voucher_type: Optional[WarehouseVoucherType],
+        from_date: Optional[datetime],
+        to_date: Optional[datetime]
+    ) -> dict:
+        """
+        In-memory replica when it covers the range, otherwise daily rollups for fully
+        covered days + raw vouchers for partial days at the edges
+        """
+        buckets = self.replica.buckets(self.rollup, from_date, to_date, voucher_type=voucher_type) if self.replica else None
+        if buckets is not None:
+            return buckets
+
+        full_days, partial_ranges = self.rollup.split_range(from_date, to_date)
+
+        buckets = {}
+        if full_days:
+            buckets = await run_db(self.rollup.fetch_buckets, *full_days)
+
+        fields = ["voucher_date", "voucher_type", "status", *self.STATS_AMOUNT_FIELDS]
+        for start, end in partial_ranges:
+            query = self._get_collection()
+            if voucher_type:
+                query = query.where(filter=FieldFilter("voucher_type", "==", voucher_type.value))
+            query = query.where(filter=FieldFilter("voucher_date", ">=", start))
+            query = query.where(filter=FieldFilter("voucher_date", "<=", end))
+            for data in await run_db(self._stream_dicts, query.select(fields)):
+                self.rollup.accumulate(buckets, data)
+
+        if voucher_type:
+            buckets = {voucher_type.value: buckets.get(voucher_type.value, {})}
+        return buckets
+
+    async def get_version(self) -> int:
+        """Change counter of the collection, for list / statistics ETags"""
+        return await self.versions.current()
+
     async def get_statistics(
         self,
         voucher_type: Optional[WarehouseVoucherType] = None,
@@ -215,16 +741,7 @@ class WarehouseVoucherService:
         to_date: Optional[datetime] = None
     ) -> dict:
         """Get voucher statistics"""
-        query = self._get_collection()
-
-        if voucher_type:
-            query = query.where(filter=FieldFilter("voucher_type", "==", voucher_type.value))
-        if from_date:
-            query = query.where(filter=FieldFilter("voucher_date", ">=", from_date))
-        if to_date:
-            query = query.where(filter=FieldFilter("voucher_date", "<=", to_date))
-
-        docs = list(query.stream())
+        buckets = await self._load_stat_buckets(voucher_type, from_date, to_date)
 
         stats = {
             "total_vouchers": 0,
@@ -235,20 +752,40 @@ class WarehouseVoucherService:
             "total_amount": 0.0
         }
 
-        for doc in docs:
-            data = doc.to_dict()
-            stats["total_vouchers"] += 1
+        for statuses in buckets.values():
+            for status, values in statuses.items():
+                count = int(values.get("count", 0))
+                stats["total_vouchers"] += count
 
-            status = data.get("status")
-            if status == WarehouseVoucherStatus.DRAFT.value:
-                stats["draft_count"] += 1
-            elif status == WarehouseVoucherStatus.POSTED.value:
-                stats["posted_count"] += 1
-            elif status == WarehouseVoucherStatus.CANCELLED.value:
-                stats["cancelled_count"] += 1
+                if status == WarehouseVoucherStatus.DRAFT.value:
+                    stats["draft_count"] += count
+                elif status == WarehouseVoucherStatus.POSTED.value:
+                    stats["posted_count"] += count
+                elif status == WarehouseVoucherStatus.CANCELLED.value:
+                    stats["cancelled_count"] += count
 
-            if status != WarehouseVoucherStatus.CANCELLED.value:
-                stats["total_quantity"] += data.get("total_quantity", 0)
-                stats["total_amount"] += data.get("total_amount", 0)
+                if status != WarehouseVoucherStatus.CANCELLED.value:
+                    stats["total_quantity"] += values.get("total_quantity", 0)
+                    stats["total_amount"] += values.get("total_amount", 0)
 
         return stats
+
+    async def rebuild_statistics(self) -> dict:
+        """Regenerate daily statistics rollups from raw vouchers"""
+        return await run_db(self.rollup.rebuild, self._get_collection())
+
+    async def rebuild_search_index(self) -> dict:
+        """Regenerate the search documents from raw vouchers"""
+        return await run_db(self.search.rebuild, self._get_collection(), self.line_chunks)
+
+    async def rebuild_inventory(self, from_date: Optional[datetime] = None) -> dict:
+        """Replay posted vouchers from `from_date` (all when None): reprice issues, rebuild balances"""
+        result = await run_db(
+            self.inventory.recompute, self._get_collection(), self.rollup, self.ledger, self.LEDGER_SOURCE, from_date,
+            self.line_chunks, self.cache
+        )
+        if result.get("repriced") or result.get("adjustments_removed"):
+            batch = self.db.batch()
+            self.versions.bump(batch)
+            await run_db(commit_batch, batch)
+        return result
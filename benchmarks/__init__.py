@@ -0,0 +1,3 @@
+"""
+Benchmarks - đo hiệu năng các thao tác phiếu ở tầng service (offline, SQLite)
+"""
@@ -0,0 +1,426 @@
+"""
+Voucher Benchmark - đo throughput và độ trễ các thao tác phiếu ở tầng service
+
+Chạy offline trên backend SQLite (file tạm), không cần project Firebase:
+
+    python -m benchmarks.voucher_bench --vouchers 10000 --max-lines 200
+    python -m benchmarks.voucher_bench --only cash --operations 200 --compare benchmarks/results/old.json
+
+Các bước:
+1. Sinh dữ liệu ngẫu nhiên có seed cố định (số dòng mỗi phiếu lệch về phía ít dòng,
+   từ --min-lines đến --max-lines) và ghi bằng create_batch
+2. Đo get_by_id, list / list_summary (get_page / get_summary_page với bộ lọc ngẫu nhiên),
+   statistics, create, update, post, cancel và các phép CPU thuần (hydrate model, _calculate_totals,
+   serialize trang 500 phiếu theo response_model của FastAPI và theo model_response)
+3. Đo khởi động lạnh (--cold-starts lần, mỗi lần một process Python mới): import main,
+   lifespan (tạo client, warm-up service) và request đầu tiên
+4. Ghi kết quả JSON (p50/p90/p99/max, ops/s) vào benchmarks/results/ để so sánh giữa các commit
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DATASET_START = datetime(2025, 1, 1)
+DATASET_DAYS = 365
+
+CASH_ACCOUNTS = ("5111", "5113", "131", "141", "331", "334", "6422", "711")
+PRODUCT_COUNT = 2000
+WAREHOUSES = ("K1", "K2", "K3")
+
+
+# ----- Dataset -----
+
+def _line_count(rng: random.Random, min_lines: int, max_lines: int) -> int:
+    """Skewed towards small vouchers: most have a few lines, some have up to max_lines"""
+    mean = max(1.0, (max_lines - min_lines) / 10)
+    return min(max_lines, min_lines + int(rng.expovariate(1 / mean)))
+
+
+def _voucher_date(rng: random.Random) -> str:
+    offset = timedelta(days=rng.randrange(DATASET_DAYS), seconds=rng.randrange(86400))
+    return (DATASET_START + offset).isoformat()
+
+
+def cash_item(rng: random.Random, min_lines: int, max_lines: int) -> dict:
+    lines = []
+    for index in range(_line_count(rng, min_lines, max_lines)):
+        amount = rng.randrange(1, 500) * 1000
+        lines.append({
+            "line_no": index + 1,
+            "description": f"Nội dung {index + 1}",
+            "account_code": rng.choice(CASH_ACCOUNTS),
+            "amount": amount,
+            "tax_amount": amount // 10 if rng.random() < 0.3 else 0
+        })
+    return {
+        "voucher_type": "RECEIPT" if rng.random() < 0.6 else "PAYMENT",
+        "voucher_date": _voucher_date(rng),
+        "related_object_type": "CUSTOMER",
+        "related_object_name": f"Khách hàng {rng.randrange(5000)}",
+        "reason": "Thu tiền bán hàng",
+        "lines": lines
+    }
+
+
+def warehouse_item(rng: random.Random, min_lines: int, max_lines: int, voucher_type: Optional[str] = None) -> dict:
+    voucher_type = voucher_type or ("RECEIPT" if rng.random() < 0.8 else "ISSUE")
+    lines = []
+    for index in range(_line_count(rng, min_lines, max_lines)):
+        quantity = rng.randrange(1, 100)
+        unit_price = rng.randrange(1, 200) * 1000
+        product = rng.randrange(PRODUCT_COUNT)
+        lines.append({
+            "line_no": index + 1,
+            "product_code": f"SP{product:05d}",
+            "product_name": f"Hàng hóa {product}",
+            "unit": "cái",
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "amount": quantity * unit_price
+        })
+    receipt = voucher_type == "RECEIPT"
+    return {
+        "voucher_type": voucher_type,
+        "voucher_date": _voucher_date(rng),
+        "warehouse_code": rng.choice(WAREHOUSES),
+        "warehouse_name": "Kho hàng",
+        "debit_account": "156" if receipt else "632",
+        "credit_account": "331" if receipt else "156",
+        "lines": lines
+    }
+
+
+# ----- Measurement -----
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(latencies_ms: List[float], errors: int, elapsed: float) -> dict:
+    values = sorted(latencies_ms)
+    return {
+        "ops": len(values),
+        "errors": errors,
+        "throughput_ops_s": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / len(values), 4) if values else 0.0,
+            "p50": round(_percentile(values, 0.50), 4),
+            "p90": round(_percentile(values, 0.90), 4),
+            "p99": round(_percentile(values, 0.99), 4),
+            "max": round(values[-1], 4) if values else 0.0,
+        },
+    }
+
+
+async def measure(operations: List[Callable[[], Awaitable]], concurrency: int) -> dict:
+    """Run every operation (at most `concurrency` at a time) and record per-call latency"""
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run(operation):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await operation()
+            except Exception:
+                errors += 1
+                return
+            if result is None or result is False:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[_run(operation) for operation in operations])
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def measure_cpu(function: Callable[[], object], count: int) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(count):
+        call_started = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return summarize(latencies, 0, time.perf_counter() - started)
+
+
+async def serialize_response_model(field, content) -> bytes:
+    """FastAPI default path: validate against response_model, jsonable_encoder, stdlib json"""
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+# ----- Benchmarks -----
+
+async def seed(service, make_item: Callable[[], dict], count: int, batch_size: int) -> Dict[str, object]:
+    """Write `count` vouchers through create_batch; returns ids and seeding throughput"""
+    ids: List[str] = []
+    started = time.perf_counter()
+    while len(ids) < count:
+        items = [make_item() for _ in range(min(batch_size, count - len(ids)))]
+        results = await service.create_batch(items)
+        ids += [result["id"] for result in results if result["success"]]
+    elapsed = time.perf_counter() - started
+    return {"ids": ids, "summary": {"vouchers": len(ids), "seconds": round(elapsed, 3), "vouchers_per_s": round(len(ids) / elapsed, 2)}}
+
+
+async def bench_service(name: str, args, rng: random.Random) -> dict:
+    # Import sau khi đã cấu hình biến môi trường của backend SQLite
+    from app.models import (
+        CashVoucher, CashVoucherCreate, CashVoucherLine, CashVoucherUpdate, VoucherStatus, VoucherType,
+        WarehouseVoucher, WarehouseVoucherCreate, WarehouseVoucherLine,
+        WarehouseVoucherType, WarehouseVoucherUpdate,
+    )
+    from app.models.warehouse_voucher import WarehouseVoucherStatus
+    from app.services import CashVoucherService, WarehouseVoucherService
+
+    if name == "cash":
+        service = CashVoucherService()
+        model, create_model, update_model, line_model = CashVoucher, CashVoucherCreate, CashVoucherUpdate, CashVoucherLine
+        make_item = lambda: cash_item(rng, args.min_lines, args.max_lines)
+        make_draft = make_item
+        filters = [{}, {"voucher_type": VoucherType.RECEIPT}, {"status": VoucherStatus.DRAFT}]
+    else:
+        service = WarehouseVoucherService()
+        model, create_model, update_model, line_model = WarehouseVoucher, WarehouseVoucherCreate, WarehouseVoucherUpdate, WarehouseVoucherLine
+        make_item = lambda: warehouse_item(rng, args.min_lines, args.max_lines)
+        # Phiếu đo create/post/cancel là phiếu nhập kho để không phụ thuộc tồn kho
+        make_draft = lambda: warehouse_item(rng, args.min_lines, args.max_lines, "RECEIPT")
+        filters = [
+            {}, {"voucher_type": WarehouseVoucherType.RECEIPT}, {"status": WarehouseVoucherStatus.DRAFT},
+            {"warehouse_code": "K1"}
+        ]
+
+    results = {}
+    print(f"⏳ {name}: seeding {args.vouchers} vouchers...")
+    seeded = await seed(service, make_item, args.vouchers, args.batch_size)
+    results["seed"] = seeded["summary"]
+    ids = seeded["ids"]
+    count = args.operations
+
+    def _list_operation(page_method):
+        params = dict(rng.choice(filters))
+        start = DATASET_START + timedelta(days=rng.randrange(DATASET_DAYS - 30))
+        if rng.random() < 0.5:
+            params.update(from_date=start, to_date=start + timedelta(days=30))
+        return lambda: page_method(limit=100, **params)
+
+    def _statistics_operation():
+        start = DATASET_START + timedelta(days=rng.randrange(DATASET_DAYS - 31), hours=rng.randrange(24))
+        end = start + timedelta(days=rng.randrange(1, 31), hours=rng.randrange(24))
+        return lambda: service.get_statistics(from_date=start, to_date=end)
+
+    print(f"⏳ {name}: read operations...")
+    results["get_by_id"] = await measure(
+        [lambda voucher_id=rng.choice(ids): service.get_by_id(voucher_id) for _ in range(count)], args.concurrency
+    )
+    results["list"] = await measure([_list_operation(service.get_page) for _ in range(count)], args.concurrency)
+    results["list_summary"] = await measure(
+        [_list_operation(service.get_summary_page) for _ in range(count)], args.concurrency
+    )
+    results["statistics"] = await measure([_statistics_operation() for _ in range(count)], args.concurrency)
+
+    print(f"⏳ {name}: write operations...")
+    created: List[str] = []
+
+    async def _create(item):
+        voucher = await service.create(create_model.model_validate(item))
+        created.append(voucher.id)
+        return voucher
+
+    results["create"] = await measure([lambda item=make_draft(): _create(item) for _ in range(count)], args.concurrency)
+    results["update"] = await measure(
+        [
+            lambda voucher_id=voucher_id, item=make_draft(): service.update(voucher_id, update_model(lines=item["lines"]))
+            for voucher_id in created
+        ],
+        args.concurrency
+    )
+    results["post"] = await measure([lambda voucher_id=voucher_id: service.post(voucher_id) for voucher_id in created], args.concurrency)
+    results["cancel"] = await measure(
+        [lambda voucher_id=voucher_id: service.cancel(voucher_id, "benchmark") for voucher_id in created], args.concurrency
+    )
+
+    print(f"⏳ {name}: cpu operations...")
+    page, _ = await service.get_page(limit=100)
+    documents = [voucher.model_dump() for voucher in page]
+    results["hydrate_page"] = measure_cpu(lambda: [model(**data) for data in documents], count)
+    widest = max(documents, key=lambda data: len(data["lines"]), default={"lines": []})
+    lines = [line_model(**line) for line in widest["lines"]]
+    results["calculate_totals"] = measure_cpu(lambda: service._calculate_totals(lines), count)
+
+    from fastapi.utils import create_response_field
+    from app.routes.responses import model_response
+    serialize_page, _ = await service.get_page(limit=min(500, len(ids)))
+    response_field = create_response_field(name="response", type_=List[model], mode="serialization")
+    results["serialize_validated"] = await measure(
+        [lambda: serialize_response_model(response_field, serialize_page) for _ in range(count)], 1
+    )
+    results["serialize_trusted"] = measure_cpu(lambda: model_response(List[model], serialize_page).body, count)
+    return results
+
+
+COLD_START_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    ready = time.perf_counter()
+    client.get("/api/cash-vouchers", params={"limit": 1}).raise_for_status()
+    first = time.perf_counter()
+print(json.dumps({"import": imported - started, "startup": ready - imported, "first_request": first - ready}))
+"""
+
+
+def bench_cold_start(count: int) -> dict:
+    """Fresh interpreter per run: whole process, import of main, lifespan startup and the first request"""
+    samples: Dict[str, List[float]] = {"process": [], "import": [], "startup": [], "first_request": []}
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        launched = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-c", COLD_START_SCRIPT], capture_output=True, text=True, cwd=ROOT_DIR, env=os.environ.copy()
+        )
+        elapsed = time.perf_counter() - launched
+        if completed.returncode != 0:
+            errors += 1
+            continue
+        # lifespan in ra stdout trước, kết quả là dòng cuối
+        timings = json.loads(completed.stdout.strip().splitlines()[-1])
+        samples["process"].append(elapsed * 1000)
+        for name, seconds in timings.items():
+            samples[name].append(seconds * 1000)
+    elapsed = time.perf_counter() - started
+    return {name: summarize(values, errors, elapsed) for name, values in samples.items()}
+
+
+# ----- Results -----
+
+def _git_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        )
+        return completed.stdout.strip()
+    except Exception:
+        return None
+
+
+def print_results(results: dict, baseline: Optional[dict] = None):
+    header = f"{'benchmark':<28}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    if baseline:
+        header += f"{'p50 vs base':>14}{'ops/s vs base':>16}"
+    print(header)
+    for service_name, benchmarks in results.items():
+        for name, summary in benchmarks.items():
+            if "latency_ms" not in summary:
+                continue
+            key = f"{service_name}.{name}"
+            line = (
+                f"{key:<28}{summary['throughput_ops_s']:>12.1f}{summary['latency_ms']['p50']:>10.3f}"
+                f"{summary['latency_ms']['p99']:>10.3f}{summary['errors']:>8}"
+            )
+            base = (baseline or {}).get(service_name, {}).get(name)
+            if base and "latency_ms" in base:
+                p50_ratio = summary["latency_ms"]["p50"] / base["latency_ms"]["p50"] if base["latency_ms"]["p50"] else 0
+                ops_ratio = summary["throughput_ops_s"] / base["throughput_ops_s"] if base["throughput_ops_s"] else 0
+                line += f"{p50_ratio:>13.2f}x{ops_ratio:>15.2f}x"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Voucher service benchmarks (offline, SQLite)")
+    parser.add_argument("--vouchers", type=int, default=10000, help="Số phiếu sinh sẵn mỗi loại")
+    parser.add_argument("--min-lines", type=int, default=1)
+    parser.add_argument("--max-lines", type=int, default=200)
+    parser.add_argument("--operations", type=int, default=500, help="Số lần đo mỗi thao tác")
+    parser.add_argument("--concurrency", type=int, default=1, help="Số thao tác chạy song song")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Số phiếu mỗi lần create_batch khi sinh dữ liệu")
+    parser.add_argument("--only", choices=["cash", "warehouse"])
+    parser.add_argument("--seed", type=int, default=39)
+    parser.add_argument("--cache", choices=["memory", "none"], default="none", help="Cache get_by_id (mặc định tắt để đo đọc thật)")
+    parser.add_argument("--db", help="File SQLite (mặc định: file tạm, xóa sau khi chạy)")
+    parser.add_argument("--output", help="File kết quả JSON (mặc định: benchmarks/results/<thời gian>-<commit>.json)")
+    parser.add_argument("--compare", help="File kết quả JSON trước đó để so sánh")
+    parser.add_argument("--cold-starts", type=int, default=5, help="Số lần đo khởi động lạnh (0: bỏ qua)")
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.db is None:
+        temp_dir = tempfile.mkdtemp(prefix="taphoa39-bench-")
+        args.db = os.path.join(temp_dir, "bench.db")
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = args.db
+    os.environ["VOUCHER_CACHE_BACKEND"] = args.cache
+
+    commit = _git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "storage_backend": "sqlite",
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "db")},
+        },
+        "results": {},
+    }
+
+    async def _run():
+        from app.config import shutdown_db_executor
+        from app.services import get_voucher_number_allocator
+        try:
+            for name in ("cash", "warehouse"):
+                if args.only and args.only != name:
+                    continue
+                report["results"][name] = await bench_service(name, args, random.Random(args.seed))
+        finally:
+            await get_voucher_number_allocator().close()
+            shutdown_db_executor()
+
+    try:
+        asyncio.run(_run())
+        if args.cold_starts:
+            print(f"⏳ startup: {args.cold_starts} cold starts...")
+            report["results"]["startup"] = bench_cold_start(args.cold_starts)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))["results"]
+    print_results(report["results"], baseline)
+    print(f"✅ Kết quả: {output}")
+
+
+if __name__ == "__main__":
+    main()
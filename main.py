@@ -4,11 +4,22 @@ Kế toán doanh nghiệp theo Thông tư 133/2016/TT-BTC
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 import uvicorn
 
-from app.config import settings, initialize_firebase
-from app.routes import cash_voucher_router, warehouse_voucher_router
+from app.config import settings, initialize_database, get_db_pool_stats, shutdown_db_executor
+from app.config.metrics import MetricsMiddleware, render_prometheus
+from app.config.profiling import ProfilingMiddleware
+from app.routes import (
+    cash_voucher_router, warehouse_voucher_router, inventory_router, ledger_router, report_router, profile_router,
+    voucher_stream_router, search_router
+)
+from app.services import (
+    get_voucher_number_allocator, get_voucher_cache, get_voucher_event_hub,
+    start_voucher_replicas, close_voucher_replicas, get_voucher_replica_stats, warm_up_services,
+    close_voucher_versions, get_voucher_versions_stats
+)
 
 
 @asynccontextmanager
@@ -16,11 +27,19 @@ async def lifespan(app: FastAPI):
     """Application lifespan - startup and shutdown events"""
     # Startup
     print("🚀 Starting TapHoa39KeToan Backend...")
-    initialize_firebase()
+    # Client và service được tạo ở đây (mỗi worker một lần), không phải lúc import
+    initialize_database()
+    await warm_up_services()
+    start_voucher_replicas()
     print(f"✅ Server ready at http://{settings.host}:{settings.port}")
     yield
     # Shutdown
     print("👋 Shutting down...")
+    await get_voucher_number_allocator().close()
+    get_voucher_event_hub().close()
+    close_voucher_replicas()
+    close_voucher_versions()
+    shutdown_db_executor()
 
 
 # Create FastAPI app
@@ -54,7 +73,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "X-Profile-Id", "ETag"],
 )
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 # Health check endpoint
@@ -73,14 +95,37 @@ async def health_check():
     """Detailed health check"""
     return {
         "status": "healthy",
-        "firebase": "connected",
-        "version": settings.app_version
+        "storage": settings.storage_backend,
+        "version": settings.app_version,
+        "db_pool": get_db_pool_stats(),
+        "voucher_numbers": get_voucher_number_allocator().get_stats(),
+        "voucher_cache": get_voucher_cache().get_stats(),
+        "voucher_stream": get_voucher_event_hub().get_stats(),
+        "voucher_replica": get_voucher_replica_stats(),
+        "voucher_versions": get_voucher_versions_stats()
     }
 
 
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-route latency, datastore calls/documents, voucher number contention"""
+    pool = get_db_pool_stats()
+    body = render_prometheus({
+        "db_pool_in_flight": ("Số lệnh datastore đang chạy trong thread pool", pool["in_flight"]),
+        "db_pool_waiting": ("Số lệnh datastore đang chờ semaphore", pool["waiting"]),
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Register routers
 app.include_router(cash_voucher_router)
 app.include_router(warehouse_voucher_router)
+app.include_router(inventory_router)
+app.include_router(ledger_router)
+app.include_router(report_router)
+app.include_router(profile_router)
+app.include_router(voucher_stream_router)
+app.include_router(search_router)
 
 
 if __name__ == "__main__":
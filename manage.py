@@ -0,0 +1,142 @@
+"""
+TapHoa39KeToan Backend - Management commands
+
+Usage:
+    python manage.py rebuild-stats [--only cash|warehouse]
+    python manage.py rebuild-inventory [--from-date YYYY-MM-DD]
+    python manage.py rebuild-ledger
+    python manage.py rebuild-search [--only cash|warehouse]
+    python manage.py purge-expired
+    python manage.py cache-server
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+
+from app.config import settings, initialize_database, run_db, shutdown_db_executor
+from app.config.database import delete_expired
+from app.services import CashVoucherService, WarehouseVoucherService, InsufficientStockError, LedgerService
+from app.services.voucher_cache import serve_shared_cache
+from app.services.idempotency import IDEMPOTENCY_COLLECTION
+from app.services.voucher_events import CHANGES_COLLECTION
+
+
+async def rebuild_stats(args):
+    """Regenerate daily statistics rollups from raw vouchers"""
+    services = {
+        "cash": CashVoucherService,
+        "warehouse": WarehouseVoucherService,
+    }
+    for name, service_class in services.items():
+        if args.only and args.only != name:
+            continue
+        result = await service_class().rebuild_statistics()
+        print(f"✅ {result['collection']}: {result['vouchers']} phiếu -> {result['days']} ngày")
+
+
+async def rebuild_inventory(args):
+    """Replay posted warehouse vouchers: reprice issues and rebuild inventory balances"""
+    from_date = None
+    if args.from_date:
+        # Đầu ngày theo múi giờ thống kê (UTC+7)
+        tz = timezone(timedelta(hours=settings.stats_timezone_offset_hours))
+        from_date = datetime.combine(date.fromisoformat(args.from_date), time.min, tzinfo=tz)
+
+    try:
+        result = await WarehouseVoucherService().rebuild_inventory(from_date)
+    except InsufficientStockError as e:
+        print(f"❌ Không thể tính lại giá vốn, chưa ghi gì: {e}")
+        return
+    print(
+        f"✅ {result['collection']} ({result['method']}): {result['vouchers']} phiếu -> "
+        f"{result['balances']} số dư, {result['repriced']} phiếu xuất được tính lại giá"
+    )
+
+
+async def rebuild_ledger(args):
+    """Regenerate journal entries and account balances from posted vouchers"""
+    collections = {
+        service_class.LEDGER_SOURCE: service_class.COLLECTION
+        for service_class in (CashVoucherService, WarehouseVoucherService)
+    }
+    result = await run_db(LedgerService().rebuild, collections)
+    print(f"✅ {result['journal_entries']} bút toán, {result['account_balances']} số dư tài khoản theo kỳ")
+
+
+async def rebuild_search(args):
+    """Regenerate voucher search documents (first deployment, or after rebuild-inventory)"""
+    services = {
+        "cash": CashVoucherService,
+        "warehouse": WarehouseVoucherService,
+    }
+    for name, service_class in services.items():
+        if args.only and args.only != name:
+            continue
+        result = await service_class().rebuild_search_index()
+        print(f"✅ {result['source']}: {result['vouchers']} phiếu")
+
+
+async def purge_expired(args):
+    """Delete expired change documents and idempotency keys (Firestore TTL policy does this; SQLite needs this command, e.g. from cron)"""
+    for collection in (CHANGES_COLLECTION, IDEMPOTENCY_COLLECTION):
+        deleted = await run_db(delete_expired, collection)
+        print(f"✅ {collection}: xóa {deleted} document hết hạn")
+
+
+def cache_server(args):
+    """Run the shared voucher cache process used by VOUCHER_CACHE_BACKEND=shared"""
+    serve_shared_cache(
+        settings.voucher_cache_address,
+        settings.voucher_cache_authkey,
+        settings.voucher_cache_max_entries,
+        settings.voucher_cache_ttl_seconds
+    )
+
+
+COMMANDS = {
+    "rebuild-stats": rebuild_stats,
+    "rebuild-inventory": rebuild_inventory,
+    "rebuild-ledger": rebuild_ledger,
+    "rebuild-search": rebuild_search,
+    "purge-expired": purge_expired,
+}
+
+# Lệnh không cần Firebase
+LOCAL_COMMANDS = {
+    "cache-server": cache_server,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TapHoa39KeToan management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = subparsers.add_parser("rebuild-stats", help="Tính lại thống kê theo ngày từ phiếu gốc")
+    rebuild_parser.add_argument("--only", choices=["cash", "warehouse"], help="Chỉ tính lại một loại phiếu")
+
+    inventory_parser = subparsers.add_parser("rebuild-inventory", help="Tính lại tồn kho và giá xuất kho từ các phiếu đã ghi sổ")
+    inventory_parser.add_argument("--from-date", help="Chỉ tính lại từ ngày này (YYYY-MM-DD), ví dụ ngày của phiếu nhập bổ sung")
+
+    subparsers.add_parser("rebuild-ledger", help="Tính lại bút toán và số dư tài khoản từ các phiếu đã ghi sổ")
+
+    search_parser = subparsers.add_parser("rebuild-search", help="Tạo lại chỉ mục tìm kiếm phiếu từ phiếu gốc")
+    search_parser.add_argument("--only", choices=["cash", "warehouse"], help="Chỉ tạo lại cho một loại phiếu")
+
+    subparsers.add_parser("purge-expired", help="Xóa document hết hạn (expire_at) - cần cho SQLite, Firestore dùng TTL policy")
+
+    subparsers.add_parser("cache-server", help="Chạy tiến trình cache phiếu dùng chung cho nhiều worker")
+
+    args = parser.parse_args()
+    if args.command in LOCAL_COMMANDS:
+        LOCAL_COMMANDS[args.command](args)
+        return
+
+    initialize_database()
+    try:
+        asyncio.run(COMMANDS[args.command](args))
+    finally:
+        shutdown_db_executor()
+
+
+if __name__ == "__main__":
+    main()